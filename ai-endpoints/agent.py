@@ -1,19 +1,74 @@
 import os
 import re
+import threading
+import time
+from typing import AsyncIterator, Iterator, Optional
 
-from huggingface_hub import InferenceClient
 from dotenv import load_dotenv  
 
+from coalescing import MicroBatcher, SingleFlight
+from inference_client import DEFAULT_MODEL, AsyncTextGenerationClient, InferenceError
+from metrics import qna_generation_seconds, qna_time_to_first_token_seconds, qna_tokens_total
+
 load_dotenv()
-print("Environment Keys Loaded:", os.getenv('HUGGINGFACE_API_KEY'))
 
-hf_api_key = os.getenv('HUGGINGFACE_API_KEY')
-if not hf_api_key:
-    raise ValueError("Hugging Face API Key not set in environment variable")
+# Clients are built on first use, so importing this module stays cheap and analysis-only
+# workers never load huggingface_hub or httpx
+_text_generation_client = None
+_async_text_generation_client: Optional[AsyncTextGenerationClient] = None
+_micro_batcher: Optional[MicroBatcher] = None
+_client_lock = threading.Lock()
+
+# Identical prompts in flight at the same time share one generation
+single_flight = SingleFlight()
+
+def get_text_generation_client():
+    """The synchronous huggingface_hub client, for scripts"""
+    global _text_generation_client
+    with _client_lock:
+        if _text_generation_client is None:
+            hf_api_key = os.getenv('HUGGINGFACE_API_KEY')
+            if not hf_api_key:
+                raise ValueError("Hugging Face API Key not set in environment variable")
+            from huggingface_hub import InferenceClient
+
+            _text_generation_client = InferenceClient(
+                token=hf_api_key,
+                model=DEFAULT_MODEL
+            )
+        return _text_generation_client
+
+def get_async_text_generation_client() -> AsyncTextGenerationClient:
+    """The client used by the API: pooled, bounded and non-blocking"""
+    global _async_text_generation_client, _micro_batcher
+    with _client_lock:
+        if _async_text_generation_client is None:
+            # A key is only optional when pointing at a self-hosted endpoint
+            if not os.getenv('HUGGINGFACE_API_KEY') and not os.getenv('HF_INFERENCE_URL'):
+                raise InferenceError("Hugging Face API Key not set in environment variable")
+            _async_text_generation_client = AsyncTextGenerationClient.from_env(DEFAULT_MODEL)
+
+            # Batching is opt-in (HF_BATCH_MAX_SIZE > 1): it needs a backend that accepts a list of inputs
+            batch_max_size = int(os.getenv('HF_BATCH_MAX_SIZE', 1))
+            if batch_max_size > 1:
+                _micro_batcher = MicroBatcher(
+                    _async_text_generation_client,
+                    max_batch_size=batch_max_size,
+                    max_wait=float(os.getenv('HF_BATCH_WINDOW_MS', 20)) / 1000
+                )
+        return _async_text_generation_client
 
-text_generation_client = InferenceClient(
-    token=hf_api_key,
-    model="mistralai/Mixtral-8x7B-Instruct-v0.1"
+def warm_up_inference():
+    """Optional warm-up: build the async client (and import httpx) before the first question"""
+    get_async_text_generation_client()
+
+generation_parameters = dict(
+    temperature=0.5,       # Controls randomness of generated text
+    max_new_tokens=1024,   # Maximum number of tokens to generate
+    top_p=0.96,           
+    repetition_penalty=1.0,
+    do_sample=True,
+    seed=42,
 )
 
 def format_prompt_for_model(user_prompt: str) -> str:
@@ -43,19 +98,108 @@ def format_prompt_for_model(user_prompt: str) -> str:
     combined_prompt = f"<s>[SYS] {system_context_prompt} [/SYS]\n[INST] {user_context_prompt} [/INST]"
     return combined_prompt
 
-def generate_prediction(user_question: str) -> str:
-    generation_parameters = dict(
-        temperature=0.5,       # Controls randomness of generated text
-        max_new_tokens=1024,   # Maximum number of tokens to generate
-        top_p=0.96,           
-        repetition_penalty=1.0,
-        do_sample=True,
-        seed=42,
-    )
+class OutputCleaner:
+    """
+    Incremental version of the cleanup generate_prediction used to do on the full text:
+    drops </s> tokens and, if the prompt is echoed back, everything up to its [/INST].
+
+    feed() returns the text that is safe to emit so far; text that could still turn out
+    to be part of a tag is held back until the next token or finish(). Output is only
+    held while it still reads as the start of the prompt, so an answer that does not
+    echo it starts streaming with its first token.
+    """
+    __slots__ = ['prompt', 'pending', 'seen', 'decided', 'stripping', 'started', 'trailing']
+
+    def __init__(self, prompt: str):
+        # Compared without whitespace or <s>, which an echo need not reproduce exactly
+        self.prompt = _squeeze(prompt)
+        self.pending = ''
+        self.seen = ''
+        self.decided = False
+        self.stripping = False
+        self.started = False
+        self.trailing = ''
+
+    def feed(self, text: str) -> str:
+        cleaned = (self.pending + text).replace('</s>', '')
+        held = _partial_suffix(cleaned, '</s>')
+        self.pending = cleaned[len(cleaned) - held:]
+        return self._emit(cleaned[:len(cleaned) - held])
+
+    def finish(self) -> str:
+        text = self._emit(self.pending, final=True)
+        self.pending = ''
+        return text
+
+    def _emit(self, text: str, final: bool = False) -> str:
+        if not self.decided:
+            self.seen += text
+            match = re.search(r'\[/INST\](.*)', self.seen, re.DOTALL)
+            if match and self.prompt.startswith(_squeeze(self.seen[:match.start()])):
+                self.stripping = True
+                text = match.group(1)
+            elif final or not self.prompt.startswith(_squeeze(self.seen)):
+                text = self.seen
+            else:
+                return ''
+            self.decided = True
+            self.seen = ''
+
+        if not self.stripping:
+            return text
+        # Same as .strip() on the full answer: skip leading whitespace, hold back trailing whitespace
+        if not self.started:
+            text = text.lstrip()
+            if not text:
+                return ''
+            self.started = True
+        text = self.trailing + text
+        stripped = text.rstrip()
+        self.trailing = '' if final else text[len(stripped):]
+        return stripped
+
+
+def _squeeze(text: str) -> str:
+    return ''.join(text.replace('<s>', '').split())
+
+
+def _partial_suffix(text: str, tag: str) -> int:
+    """Length of the longest suffix of text that is a proper prefix of tag"""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
 
+class GenerationTimer:
+    """Records time to first token and total generation time for /metrics"""
+    __slots__ = ['path', 'started', 'tokens']
+
+    def __init__(self, path: str):
+        self.path = path
+        self.started = time.perf_counter()
+        self.tokens = 0
+
+    def token(self):
+        if not self.tokens:
+            qna_time_to_first_token_seconds.observe(time.perf_counter() - self.started)
+        self.tokens += 1
+
+    def finish(self):
+        qna_generation_seconds.observe(time.perf_counter() - self.started, path=self.path)
+        if self.tokens:
+            qna_tokens_total.inc(self.tokens)
+
+
+def stream_prediction(user_question: str) -> Iterator[str]:
+    """
+    Yield the cleaned answer as tokens arrive from the model.
+
+    Closing the generator closes the upstream stream, which stops the generation.
+    """
     model_ready_prompt = format_prompt_for_model(user_question)
 
-    generated_text_stream = text_generation_client.text_generation(
+    generated_text_stream = get_text_generation_client().text_generation(
         model_ready_prompt,
         **generation_parameters,
         stream=True,
@@ -63,20 +207,91 @@ def generate_prediction(user_question: str) -> str:
         return_full_text=True,
     )
 
-    final_output_text = ""
-    for text_segment in generated_text_stream:
-        final_output_text += text_segment.token.text
+    cleaner = OutputCleaner(model_ready_prompt)
+    timer = GenerationTimer('stream')
+    try:
+        for text_segment in generated_text_stream:
+            timer.token()
+            text = cleaner.feed(text_segment.token.text)
+            if text:
+                yield text
+        text = cleaner.finish()
+        if text:
+            yield text
+    finally:
+        generated_text_stream.close()
+        timer.finish()
 
-    # Use regex to filter out </s> tokens
-    cleaned_output = re.sub(r'</s>', '', final_output_text)
-    
-    # Also remove the original prompt from the response if present
-    # This looks for the [/INST] tag and takes everything after it
-    match = re.search(r'\[/INST\](.*)', cleaned_output, re.DOTALL)
-    if match:
-        cleaned_output = match.group(1).strip()
+def generate_prediction(user_question: str) -> str:
+    return ''.join(stream_prediction(user_question))
+
+async def astream_prediction(user_question: str) -> AsyncIterator[str]:
+    """
+    Async counterpart of stream_prediction, running on the shared async client so a slow
+    generation never blocks the event loop.
+    """
+    model_ready_prompt = format_prompt_for_model(user_question)
+    client = get_async_text_generation_client()
+
+    generated_text_stream = single_flight.stream(
+        model_ready_prompt,
+        lambda: client.stream(
+            model_ready_prompt,
+            **generation_parameters,
+            details=True,
+            return_full_text=True,
+        )
+    )
+
+    cleaner = OutputCleaner(model_ready_prompt)
+    timer = GenerationTimer('stream')
+    try:
+        async for token_text in generated_text_stream:
+            timer.token()
+            text = cleaner.feed(token_text)
+            if text:
+                yield text
+        text = cleaner.finish()
+        if text:
+            yield text
+    finally:
+        await generated_text_stream.aclose()
+        timer.finish()
+
+async def agenerate_prediction(user_question: str) -> str:
+    get_async_text_generation_client()
+    micro_batcher = _micro_batcher
+    if micro_batcher is None:
+        return ''.join([text async for text in astream_prediction(user_question)])
+
+    model_ready_prompt = format_prompt_for_model(user_question)
+    timer = GenerationTimer('batch')
+    try:
+        generated_text = await single_flight.call(
+            model_ready_prompt,
+            lambda: micro_batcher.generate(
+                model_ready_prompt,
+                **generation_parameters,
+                return_full_text=True,
+            )
+        )
+    finally:
+        timer.finish()
+    cleaner = OutputCleaner(model_ready_prompt)
+    return cleaner.feed(generated_text) + cleaner.finish()
+
+def inference_stats() -> dict:
+    return {
+        'client': _async_text_generation_client.stats() if _async_text_generation_client is not None else None,
+        'coalescing': single_flight.stats(),
+        'batching': _micro_batcher.stats() if _micro_batcher is not None else None
+    }
 
-    return cleaned_output
+async def close_inference():
+    if _micro_batcher is not None:
+        await _micro_batcher.aclose()
+    if _async_text_generation_client is not None:
+        await _async_text_generation_client.aclose()
 
 if __name__ == "__main__":
     sample_user_question = "How do I use hashmaps in cpp?"
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Bump when any analyzer's output changes; stored results from another version are dropped
+ANALYZER_VERSION = 2
+
+
+def normalize_source(code: str) -> str:
+    """
+    Normalize source code before hashing.
+
+    Line endings, trailing whitespace and trailing blank lines are dropped. None of these
+    move a token to a different line or column, so cached results stay valid for the
+    resubmitted code.
+    """
+    lines = code.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).rstrip('\n')
+
+
+def source_digest(code: str) -> str:
+    """Hash of the normalized source"""
+    return hashlib.sha256(normalize_source(code).encode('utf8')).hexdigest()
+
+
+def source_key(kind: str, code: str) -> str:
+    """Content address for an analysis result: the analysis kind plus a hash of the normalized source"""
+    return f"{kind}:{source_digest(code)}"
+
+
+class SQLiteCacheBackend:
+    """
+    Shared on-disk store for analysis results, so warm restarts and sibling workers keep their hits.
+
+    Uses its own table, so it can live inside an existing database such as the bundled
+    shared-local-instance.db. With a version, the table is emptied when it was written
+    under another one. With max_entries, the least recently used rows beyond it are
+    deleted every PRUNE_INTERVAL puts.
+    """
+    PRUNE_INTERVAL = 64
+
+    __slots__ = ['path', 'table', 'max_entries', 'puts', 'lock']
+
+    def __init__(self, path: str, table: str = 'analysis_cache', version: Optional[int] = None, max_entries: int = 0):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid cache table name: {table}")
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.puts = 0
+        self.lock = threading.Lock()
+        with self._connect() as connection:
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, result TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_updated_at ON {table} (updated_at)")
+            if version is not None:
+                connection.execute("CREATE TABLE IF NOT EXISTS cache_versions (name TEXT PRIMARY KEY, version TEXT NOT NULL)")
+                stored = connection.execute("SELECT version FROM cache_versions WHERE name = ?", (table,)).fetchone()
+                if stored is None or stored[0] != str(version):
+                    connection.execute(f"DELETE FROM {table}")
+                    connection.execute("INSERT OR REPLACE INTO cache_versions (name, version) VALUES (?, ?)",
+                                       (table, str(version)))
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock, self._connect() as connection:
+            row = connection.execute(f"SELECT result FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row and self.max_entries:
+                # Pruning goes by last use
+                connection.execute(f"UPDATE {self.table} SET updated_at = ? WHERE key = ?", (time.time(), key))
+        return row[0] if row else None
+
+    def put(self, key: str, payload: str, updated_at: Optional[float] = None):
+        with self.lock, self._connect() as connection:
+            connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, result, updated_at) VALUES (?, ?, ?)",
+                (key, payload, updated_at if updated_at is not None else time.time())
+            )
+            self.puts += 1
+            if self.max_entries and self.puts % self.PRUNE_INTERVAL == 1:
+                connection.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+
+    def delete(self, keys: List[str]):
+        with self.lock, self._connect() as connection:
+            connection.executemany(f"DELETE FROM {self.table} WHERE key = ?", [(key,) for key in keys])
+
+    def items(self, since: float = 0.0, limit: int = -1) -> List[Tuple[str, str, float]]:
+        """(key, payload, updated_at) rows updated after `since`, newest first"""
+        with self.lock, self._connect() as connection:
+            return connection.execute(
+                f"SELECT key, result, updated_at FROM {self.table} WHERE updated_at > ? "
+                "ORDER BY updated_at DESC LIMIT ?",
+                (since, limit)
+            ).fetchall()
+
+
+class AnalysisCache:
+    """
+    Bounded in-process LRU cache for JSON-serializable analysis results.
+
+    Entries are evicted least-recently-used first once either max_entries or max_bytes
+    (measured on the JSON payload) is exceeded. An optional backend is consulted on
+    in-memory misses and written through on every put.
+    """
+    __slots__ = ['max_entries', 'max_bytes', 'backend', 'entries', 'total_bytes',
+                 'hits', 'misses', 'backend_hits', 'evictions', 'lock']
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 1024 * 1024,
+                 backend: Optional[SQLiteCacheBackend] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.entries: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.backend_hits = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "AnalysisCache":
+        """
+        Build a cache from ANALYSIS_CACHE_MAX_ENTRIES, ANALYSIS_CACHE_MAX_BYTES and,
+        to opt in to the shared on-disk backend, ANALYSIS_CACHE_DB, holding at most
+        ANALYSIS_CACHE_DB_MAX_ENTRIES results of the current ANALYZER_VERSION.
+        """
+        db_path = os.getenv('ANALYSIS_CACHE_DB')
+        return cls(
+            max_entries=int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', 1024)),
+            max_bytes=int(os.getenv('ANALYSIS_CACHE_MAX_BYTES', 16 * 1024 * 1024)),
+            backend=SQLiteCacheBackend(
+                db_path,
+                version=ANALYZER_VERSION,
+                max_entries=int(os.getenv('ANALYSIS_CACHE_DB_MAX_ENTRIES', 100_000))
+            ) if db_path else None
+        )
+
+    def get(self, kind: str, code: str) -> Optional[Dict[str, Any]]:
+        key = source_key(kind, code)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(entry[0])
+
+        payload = self.backend.get(key) if self.backend else None
+        with self.lock:
+            if payload is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.backend_hits += 1
+            self._store(key, payload)
+        return json.loads(payload)
+
+    def put(self, kind: str, code: str, result: Dict[str, Any]):
+        key = source_key(kind, code)
+        payload = json.dumps(result)
+        with self.lock:
+            self._store(key, payload)
+        if self.backend:
+            self.backend.put(key, payload)
+
+    def _store(self, key: str, payload: str):
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.total_bytes -= previous[1]
+        self.entries[key] = (payload, size)
+        self.total_bytes += size
+
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'backend_hits': self.backend_hits,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'backend': self.backend.path if self.backend else None
+            }
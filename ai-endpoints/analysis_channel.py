@@ -0,0 +1,116 @@
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from analysis_limits import SourceTooLarge
+from analysis_workers import AnalysisWorkers, WorkersSaturated
+from editor_sessions import EditorSessionStore, SessionUpdate
+from metrics import editor_channel_updates_total
+
+logger = logging.getLogger('ai_endpoints.channel')
+
+
+class AnalysisChannel:
+    """
+    One editor connection to a session. Updates arriving on the socket queue up; one
+    background task takes everything queued at once, applies it with a single parse
+    (EditorSessionStore.edit) and pushes the diagnostics, then analyzes the functions
+    (EditorSessionStore.analyze) and pushes those.
+
+    Edits cannot simply be dropped in favour of the latest, since each is relative to
+    the buffer before it, so "latest wins" applies to the work instead: updates that
+    arrive while a parse runs are folded into the next one, and a function analysis in
+    progress is abandoned as soon as newer updates are waiting. Results carry the `seq`
+    of the last update they include.
+
+    Messages in: SessionUpdate fields plus an optional "seq" (by default the count of
+    updates received). Messages out: {"type": "diagnostics" | "analysis" | "error", "seq", ...};
+    errors carry the HTTP status the same failure gets from the session endpoint.
+    """
+    __slots__ = ['session_id', 'store', 'workers', 'send', 'send_lock', 'pending', 'wakeup', 'task', 'received', 'closed']
+
+    def __init__(self, session_id: str, store: EditorSessionStore, workers: AnalysisWorkers,
+                 send: Callable[[Dict[str, Any]], Awaitable[None]]):
+        self.session_id = session_id
+        self.store = store
+        self.workers = workers
+        self.send = send
+        self.send_lock = asyncio.Lock()
+        self.pending: List[Tuple[int, SessionUpdate]] = []
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.received = 0
+        self.closed = False
+
+    async def serve(self, receive: Callable[[], Awaitable[str]]):
+        """Read updates until receive raises (the client disconnected); results are pushed meanwhile"""
+        self.task = asyncio.create_task(self._run())
+        try:
+            while True:
+                message = await receive()
+                self.received += 1
+                try:
+                    body = json.loads(message)
+                    seq = body.get('seq', self.received) if isinstance(body, dict) else self.received
+                    update = SessionUpdate.model_validate(body)
+                except (ValueError, ValidationError) as error:
+                    await self._push({'type': 'error', 'seq': self.received, 'status': 400, 'detail': str(error)})
+                    continue
+                self.pending.append((seq, update))
+                self.wakeup.set()
+        finally:
+            self.closed = True
+            self.task.cancel()
+
+    def _superseded(self) -> bool:
+        # Checked from a worker thread; reading a flag or a list's length needs no lock
+        return self.closed or bool(self.pending)
+
+    async def _run(self):
+        while True:
+            while not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            batch, self.pending = self.pending, []
+            seq = batch[-1][0]
+            if len(batch) > 1:
+                editor_channel_updates_total.inc(len(batch) - 1, outcome='coalesced')
+            try:
+                result = await self.workers.call(self.store.edit, self.session_id, [update for _, update in batch])
+            except Exception as error:
+                await self._push_error(seq, error)
+                continue
+            editor_channel_updates_total.inc(outcome='parsed')
+            await self._push({'type': 'diagnostics', 'seq': seq, 'updates': len(batch), **result})
+
+            analysis = None
+            if not self.pending:
+                try:
+                    analysis = await self.workers.call(self.store.analyze, self.session_id, self._superseded)
+                except Exception as error:
+                    await self._push_error(seq, error)
+                    continue
+            if analysis is None:
+                editor_channel_updates_total.inc(outcome='superseded')
+                continue
+            await self._push({'type': 'analysis', 'seq': seq, 'session_id': self.session_id, **analysis})
+
+    async def _push_error(self, seq: int, error: Exception):
+        # Anything else would end the task, and the client would wait for a reply forever
+        if isinstance(error, SourceTooLarge):
+            status, detail = 413, str(error)
+        elif isinstance(error, ValueError):
+            status, detail = 400, str(error)
+        elif isinstance(error, WorkersSaturated):
+            status, detail = 429, str(error)
+        else:
+            logger.exception("Analysis for session %s failed", self.session_id)
+            status, detail = 500, "Analysis failed"
+        await self._push({'type': 'error', 'seq': seq, 'status': status, 'detail': detail})
+
+    async def _push(self, message: Dict[str, Any]):
+        async with self.send_lock:
+            await self.send(message)
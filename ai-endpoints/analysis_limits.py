@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class LimitExceeded(Exception):
+    """An analysis ran past one of its AnalysisLimits; `limit` names which one"""
+
+    def __init__(self, limit: str, detail: str):
+        super().__init__(detail)
+        self.limit = limit
+
+
+class SourceTooLarge(LimitExceeded, ValueError):
+    """The source is over max_source_bytes; rejected before any work is done"""
+
+    def __init__(self, size: int, max_size: int):
+        super().__init__('source_bytes', f"Source is {size} bytes, the limit is {max_size}")
+
+
+class AnalysisLimits:
+    """
+    Bounds on the work one analysis request may cause. Oversized sources are rejected up
+    front; parsing is cut off by tree-sitter after parse_timeout seconds; trees with more
+    than max_nodes nodes are not analyzed; walks stop at nesting deeper than max_depth or
+    once analysis_timeout seconds have passed since the parse; array sizes and loop bounds
+    longer than max_expression_bytes are not evaluated but kept as opaque terms, with a
+    warning on the result; syntax error searches stop after max_diagnostics errors. 0
+    disables a limit.
+    """
+    __slots__ = ['max_source_bytes', 'max_nodes', 'max_depth', 'parse_timeout', 'analysis_timeout',
+                 'max_expression_bytes', 'max_diagnostics']
+
+    def __init__(self, max_source_bytes: int = 1_000_000, max_nodes: int = 500_000, max_depth: int = 2_000,
+                 parse_timeout: float = 2.0, analysis_timeout: float = 5.0, max_expression_bytes: int = 1_000,
+                 max_diagnostics: int = 100):
+        self.max_source_bytes = max_source_bytes
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.parse_timeout = parse_timeout
+        self.analysis_timeout = analysis_timeout
+        self.max_expression_bytes = max_expression_bytes
+        self.max_diagnostics = max_diagnostics
+
+    @classmethod
+    def from_env(cls) -> "AnalysisLimits":
+        """
+        Configured by ANALYSIS_MAX_SOURCE_BYTES, ANALYSIS_MAX_NODES, ANALYSIS_MAX_DEPTH,
+        ANALYSIS_PARSE_TIMEOUT_MS, ANALYSIS_TIMEOUT_MS, ANALYSIS_MAX_EXPRESSION_BYTES and
+        ANALYSIS_MAX_DIAGNOSTICS
+        """
+        return cls(
+            max_source_bytes=int(os.getenv('ANALYSIS_MAX_SOURCE_BYTES', 1_000_000)),
+            max_nodes=int(os.getenv('ANALYSIS_MAX_NODES', 500_000)),
+            max_depth=int(os.getenv('ANALYSIS_MAX_DEPTH', 2_000)),
+            parse_timeout=float(os.getenv('ANALYSIS_PARSE_TIMEOUT_MS', 2_000)) / 1000,
+            analysis_timeout=float(os.getenv('ANALYSIS_TIMEOUT_MS', 5_000)) / 1000,
+            max_expression_bytes=int(os.getenv('ANALYSIS_MAX_EXPRESSION_BYTES', 1_000)),
+            max_diagnostics=int(os.getenv('ANALYSIS_MAX_DIAGNOSTICS', 100))
+        )
+
+    def check_source(self, source: bytes):
+        if self.max_source_bytes and len(source) > self.max_source_bytes:
+            raise SourceTooLarge(len(source), self.max_source_bytes)
+
+    def check_tree(self, tree):
+        # descendant_count is stored in the tree, so this costs nothing
+        nodes = tree.root_node.descendant_count
+        if self.max_nodes and nodes > self.max_nodes:
+            raise LimitExceeded('nodes', f"Tree has {nodes} nodes, the limit is {self.max_nodes}")
+
+    def check_expression(self, text: bytes):
+        """Called before an array size or loop bound is parsed into a Complexity"""
+        if self.max_expression_bytes and len(text) > self.max_expression_bytes:
+            raise LimitExceeded('expression', f"Expression is {len(text)} bytes, the limit is {self.max_expression_bytes}")
+
+    def depth_exceeded(self) -> LimitExceeded:
+        return LimitExceeded('depth', f"Code is nested deeper than {self.max_depth} levels")
+
+    def time_exceeded(self) -> LimitExceeded:
+        return LimitExceeded('analysis_time', f"Analysis took longer than {self.analysis_timeout}s")
+
+    def deadline(self) -> Optional[float]:
+        """time.monotonic() value after which walks give up, or None"""
+        return time.monotonic() + self.analysis_timeout if self.analysis_timeout else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def degraded_result(error: LimitExceeded) -> Dict[str, Any]:
+    """What a task returns instead of its result when it ran out of budget"""
+    return {'degraded': True, 'limit': error.limit, 'detail': str(error)}
+
+
+def limit_warning(error: LimitExceeded, detail: str) -> Dict[str, Any]:
+    """A limit hit by one part of an analysis, which approximated that part and carried on"""
+    return {'limit': error.limit, 'detail': detail}
+
+
+def warnings_result(warnings: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """The warnings entry of a result: each distinct warning once, or nothing if there are none"""
+    if not warnings:
+        return {}
+    return {'warnings': list({warning['detail']: warning for warning in warnings}.values())}
+
+
+_default_limits = None
+_default_limits_lock = threading.Lock()
+
+def default_analysis_limits() -> AnalysisLimits:
+    global _default_limits
+    with _default_limits_lock:
+        if _default_limits is None:
+            _default_limits = AnalysisLimits.from_env()
+        return _default_limits
@@ -0,0 +1,261 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from analysis_cache import AnalysisCache
+from ast_export import export_tree
+from analysis_limits import (AnalysisLimits, LimitExceeded, SourceTooLarge, default_analysis_limits, degraded_result,
+                             warnings_result)
+from code_parser import CodeParser, default_parser_pool, serialize_error
+from diagnostics import diagnostics_result, find_errors
+from metrics import analysis_task_seconds, analysis_tasks_total, collect_spans, profiled, record_spans
+from project_analysis import summarize_file
+
+if TYPE_CHECKING:
+    from content_index import ContentIndex
+
+
+class WorkersSaturated(Exception):
+    """Raised when every worker is busy and the queue is full"""
+
+
+def parse_task(code: str, format: str = 'json', **filters) -> Dict[str, Any]:
+    """
+    The flat AST export of code. It is not encoded here: the response encodes it in
+    format chunk by chunk as it streams, so no complete encoding is ever built.
+    """
+    code_parser = CodeParser()
+    source = code.encode('utf8')
+    tree = code_parser.evaluate_code_syntax(source)
+    export = export_tree(code_parser, tree, source, **filters)
+    return {"format": format, "count": export.count, "export": export}
+
+
+def errors_task(code: str, max_diagnostics: Optional[int] = None) -> Dict[str, Any]:
+    """Syntax errors with messages and ranges, stopping after max_diagnostics (by default the limits')"""
+    code_parser = CodeParser()
+    tree = code_parser.evaluate_code_syntax(code)
+    limit = code_parser.limits.max_diagnostics if max_diagnostics is None else max_diagnostics
+    errors, truncated = find_errors(code_parser, tree.root_node, limit)
+    return diagnostics_result([serialize_error(node) for node in errors], truncated)
+
+
+def time_complexity_task(code: str) -> Dict[str, Any]:
+    code_parser = CodeParser()
+    tree = code_parser.evaluate_code_syntax(code)
+    time_complexity = code_parser.analyze_time_complexity(tree.root_node)
+    return {"time_complexity": str(time_complexity), **warnings_result(code_parser.warnings)}
+
+
+def memory_usage_task(code: str) -> Dict[str, Any]:
+    code_parser = CodeParser()
+    tree = code_parser.evaluate_code_syntax(code)
+    memory_usage, _ = code_parser.analyze_memory_usage(tree.root_node)
+    return {"memory_usage": str(memory_usage), **warnings_result(code_parser.warnings)}
+
+
+def return_analysis_task(code: str) -> Dict[str, Any]:
+    code_parser = CodeParser()
+    tree = code_parser.evaluate_code_syntax(code)
+    analysis = code_parser.analyze(tree.root_node)
+    return {
+        "Syntax Errors": [serialize_error(node) for node in analysis['errors']],
+        "Time Complexity": str(analysis['time_complexity']),
+        "Memory Usage": str(analysis['memory_usage']),
+        **warnings_result(code_parser.warnings)
+    }
+
+
+def function_report_task(code: str) -> Dict[str, Any]:
+    code_parser = CodeParser()
+    tree = code_parser.evaluate_code_syntax(code)
+    return code_parser.function_report(tree.root_node)
+
+
+def project_file_task(code: str) -> Dict[str, Any]:
+    """One file of a project analysis; linked with the project's other files by ProjectAnalysis"""
+    code_parser = CodeParser()
+    tree = code_parser.evaluate_code_syntax(code)
+    return summarize_file(code_parser, tree.root_node)
+
+
+ANALYSIS_TASKS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    'parse': parse_task,
+    'errors': errors_task,
+    'time_complexity': time_complexity_task,
+    'memory_usage': memory_usage_task,
+    'return_analysis': return_analysis_task,
+    'function_report': function_report_task,
+    'project_file': project_file_task,
+}
+
+# Results of these tasks only depend on the source, so they can be served from the cache
+CACHEABLE_TASKS = ('time_complexity', 'memory_usage', 'return_analysis', 'function_report')
+
+
+def run_task(kind: str, code: str, **options) -> Tuple[Dict[str, Any], List[Tuple[str, float]]]:
+    """
+    Run one of ANALYSIS_TASKS; a task that runs out of budget returns a degraded result
+    instead. Returns the result with the stage timings the task collected, which are
+    recorded by the caller so they reach /metrics from worker processes too.
+    """
+    with profiled(kind), collect_spans() as spans:
+        try:
+            result = ANALYSIS_TASKS[kind](code, **options)
+        except SourceTooLarge:
+            raise
+        except LimitExceeded as error:
+            result = degraded_result(error)
+    return result, spans
+
+
+def warm_worker():
+    """Process-pool initializer: build the parser pool and run one analysis before the first request"""
+    default_parser_pool()
+    return_analysis_task("int main() { for (int i = 0; i < n; i++) {} return 0; }")
+
+
+class AnalysisWorkers:
+    """
+    Runs CPU-heavy analysis off the event loop. Every task builds its own CodeParser,
+    so concurrent requests never share analysis state.
+
+    In 'thread' mode tasks share the worker threads with blocking helpers such as cache
+    lookups and editor sessions. In 'process' mode tasks go to a pool of warm worker
+    processes instead, so tree walking and the complexity algebra scale across cores.
+    Either way at most max_workers + queue_limit tasks are in flight; beyond that run()
+    raises WorkersSaturated.
+
+    Sources over the size limit are rejected with SourceTooLarge before any work is queued.
+    Analyses that hit one of the other AnalysisLimits come back degraded and are not cached.
+    Cacheable kinds are looked up in the precomputed ContentIndex first, then the cache.
+    """
+    __slots__ = ['mode', 'max_workers', 'queue_limit', 'executor', 'task_executor', 'cache', 'index', 'limits',
+                 'in_flight', 'rejected', 'degraded']
+
+    def __init__(self, max_workers: Optional[int] = None, cache: Optional[AnalysisCache] = None,
+                 mode: str = 'thread', queue_limit: int = 64, limits: Optional[AnalysisLimits] = None,
+                 index: Optional["ContentIndex"] = None):
+        if mode not in ('thread', 'process'):
+            raise ValueError(f"Unknown analysis executor mode: {mode}")
+        self.mode = mode
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.queue_limit = queue_limit
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis')
+        self.task_executor = self._process_pool() if mode == 'process' else self.executor
+        self.cache = cache
+        self.index = index
+        # Workers read the same limits from the environment; these are for the checks made here
+        self.limits = limits or default_analysis_limits()
+        self.in_flight = 0
+        self.rejected = 0
+        self.degraded = 0
+
+    @classmethod
+    def from_env(cls, cache: Optional[AnalysisCache] = None, index: Optional["ContentIndex"] = None) -> "AnalysisWorkers":
+        """Configured by ANALYSIS_EXECUTOR (thread or process), ANALYSIS_WORKERS and ANALYSIS_QUEUE_LIMIT"""
+        max_workers = os.getenv('ANALYSIS_WORKERS')
+        return cls(
+            max_workers=int(max_workers) if max_workers else None,
+            cache=cache,
+            index=index,
+            mode=os.getenv('ANALYSIS_EXECUTOR', 'thread'),
+            queue_limit=int(os.getenv('ANALYSIS_QUEUE_LIMIT', 64))
+        )
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        # Workers are spawned rather than forked, so they never inherit the server's threads
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=warm_worker
+        )
+
+    async def warm_up(self):
+        """Build the parser pool and run a first analysis now rather than on the first request"""
+        if self.mode == 'process':
+            # Spawned workers start on demand; one task per worker starts them all, each running warm_worker
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*[
+                loop.run_in_executor(self.task_executor, os.getpid) for _ in range(self.max_workers)
+            ])
+        else:
+            await self.call(warm_worker)
+
+    async def call(self, fn: Callable, *args) -> Any:
+        """Run an arbitrary blocking callable on the worker threads"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(fn, *args))
+
+    async def run(self, kind: str, code: str, **options) -> Dict[str, Any]:
+        """
+        Run one of ANALYSIS_TASKS with the task's keyword options, consulting the content
+        index and then the cache first for cacheable kinds run without options
+        """
+        self.limits.check_source(code.encode('utf8'))
+        if self.index is not None and kind in CACHEABLE_TASKS and not options:
+            # In memory, so looked up right here rather than on a worker
+            result = self.index.get(kind, code)
+            if result is not None:
+                analysis_tasks_total.inc(kind=kind, outcome='indexed')
+                return result
+        cacheable = self.cache is not None and kind in CACHEABLE_TASKS and not options
+        if cacheable:
+            result = await self.call(self.cache.get, kind, code)
+            if result is not None:
+                analysis_tasks_total.inc(kind=kind, outcome='cached')
+                return result
+
+        result = await self.submit(kind, code, **options)
+        if cacheable and not result.get('degraded'):
+            await self.call(self.cache.put, kind, code, result)
+        return result
+
+    async def submit(self, kind: str, code: str, **options) -> Dict[str, Any]:
+        """Run one of ANALYSIS_TASKS on the task executor, without the cache"""
+        if self.in_flight >= self.max_workers + self.queue_limit:
+            self.rejected += 1
+            raise WorkersSaturated(f"{self.in_flight} analyses already in flight")
+
+        self.in_flight += 1
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            loop = asyncio.get_running_loop()
+            result, spans = await loop.run_in_executor(self.task_executor, partial(run_task, kind, code, **options))
+            record_spans(spans)
+            outcome = 'ok'
+            if result.get('degraded'):
+                self.degraded += 1
+                outcome = 'degraded'
+            return result
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); replace the pool so later requests recover
+            self.task_executor.shutdown(wait=False, cancel_futures=True)
+            self.task_executor = self._process_pool()
+            raise
+        finally:
+            self.in_flight -= 1
+            analysis_task_seconds.observe(time.perf_counter() - start, kind=kind)
+            analysis_tasks_total.inc(kind=kind, outcome=outcome)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'mode': self.mode,
+            'workers': self.max_workers,
+            'queue_limit': self.queue_limit,
+            'in_flight': self.in_flight,
+            'rejected': self.rejected,
+            'degraded': self.degraded,
+            'limits': self.limits.to_dict()
+        }
+
+    def shutdown(self):
+        if self.task_executor is not self.executor:
+            self.task_executor.shutdown(wait=False, cancel_futures=True)
+        self.executor.shutdown(wait=False, cancel_futures=True)
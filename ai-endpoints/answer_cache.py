@@ -0,0 +1,256 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from analysis_cache import SQLiteCacheBackend
+
+WORD = re.compile(r'[a-z0-9_]+(?:\+\+|#)?')
+
+# Words that carry no meaning about what is being asked; interrogatives such as why and
+# when do, so they are kept
+STOP_WORDS = frozenset((
+    'a', 'an', 'and', 'are', 'can', 'could', 'do', 'does', 'for', 'i', 'in', 'is', 'it',
+    'me', 'my', 'of', 'on', 'or', 'please', 'should', 'the', 'to', 'with', 'would', 'you'
+))
+
+# Spellings learners use interchangeably
+SYNONYMS = {'cpp': 'c++', 'cplusplus': 'c++'}
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    return ' '.join(question.lower().split()).rstrip('?!. ')
+
+
+def question_key(question: str) -> str:
+    digest = hashlib.sha256(normalize_question(question).encode('utf8')).hexdigest()
+    return f"qna:{digest}"
+
+
+def question_terms(normalized: str) -> List[str]:
+    """Content words of a normalized question, with synonyms merged and plurals folded"""
+    terms = []
+    for word in WORD.findall(normalized):
+        word = SYNONYMS.get(word, word)
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def question_features(normalized: str) -> List[str]:
+    """
+    Terms and adjacent term pairs of a normalized question. The pairs carry word order,
+    so "string to int" and "int to string" only share their terms.
+    """
+    terms = question_terms(normalized)
+    return terms + [f"{first} {second}" for first, second in zip(terms, terms[1:])]
+
+
+class QuestionIndex:
+    """
+    TF-IDF index over the terms and term pairs of the cached questions (question_features),
+    used to match rephrasings of a question that was already answered. Document frequencies follow additions and removals, so weights
+    are computed at lookup time; document norms are cached until the index next changes.
+    """
+    __slots__ = ['terms', 'postings', 'norms']
+
+    def __init__(self):
+        self.terms: Dict[str, Counter] = {}
+        self.postings: Dict[str, Set[str]] = {}
+        self.norms: Dict[str, float] = {}
+
+    def add(self, key: str, normalized: str):
+        self.remove(key)
+        self.norms.clear()
+        counts = Counter(question_features(normalized))
+        self.terms[key] = counts
+        for term in counts:
+            self.postings.setdefault(term, set()).add(key)
+
+    def remove(self, key: str):
+        if key in self.terms:
+            self.norms.clear()
+        for term in self.terms.pop(key, ()):
+            keys = self.postings[term]
+            keys.discard(key)
+            if not keys:
+                del self.postings[term]
+
+    def nearest(self, normalized: str) -> Tuple[Optional[str], float]:
+        """The most similar indexed question and its cosine similarity"""
+        documents = len(self.terms)
+        idf: Dict[str, float] = {}
+
+        def weight(term: str) -> float:
+            if term not in idf:
+                idf[term] = math.log((1 + documents) / (1 + len(self.postings.get(term, ())))) + 1
+            return idf[term]
+
+        query = {term: count * weight(term) for term, count in Counter(question_features(normalized)).items()}
+        query_norm = math.sqrt(sum(value * value for value in query.values()))
+        if not query_norm:
+            return None, 0.0
+
+        # Dot products only involve shared terms, so accumulate them through the postings
+        dots: Dict[str, float] = {}
+        for term, value in query.items():
+            for key in self.postings.get(term, ()):
+                dots[key] = dots.get(key, 0.0) + value * self.terms[key][term] * idf[term]
+
+        best_key, best_score = None, 0.0
+        for key, dot in dots.items():
+            norm = self.norms.get(key)
+            if norm is None:
+                norm = math.sqrt(sum((count * weight(term)) ** 2 for term, count in self.terms[key].items()))
+                self.norms[key] = norm
+            score = dot / (query_norm * norm)
+            if score > best_score:
+                best_key, best_score = key, score
+        return best_key, best_score
+
+
+class AnswerCache:
+    """
+    Cache of generated answers to technical questions.
+
+    Lookups try the normalized question. Only if similarity is set do they then try the
+    closest cached question by TF-IDF cosine similarity, accepted at or above that threshold.
+    Entries expire ttl seconds after they were generated and are evicted least-recently-used
+    beyond max_entries. An optional backend keeps answers across restarts; it is loaded on
+    startup and written through on every put.
+    """
+    __slots__ = ['max_entries', 'ttl', 'similarity', 'backend', 'entries', 'index',
+                 'exact_hits', 'similar_hits', 'misses', 'evictions', 'expirations', 'lock']
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 24 * 3600.0, similarity: Optional[float] = None,
+                 backend: Optional[SQLiteCacheBackend] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity or None
+        self.backend = backend
+        self.entries: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+        self.index = QuestionIndex()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.Lock()
+        if backend:
+            self._load()
+
+    @classmethod
+    def from_env(cls) -> "AnswerCache":
+        """
+        Build a cache from QNA_CACHE_MAX_ENTRIES, QNA_CACHE_TTL, QNA_CACHE_SIMILARITY (a
+        threshold such as 0.9 turns similarity lookups on; by default only exact matches
+        are served) and, to persist answers, QNA_CACHE_DB.
+        """
+        db_path = os.getenv('QNA_CACHE_DB')
+        return cls(
+            max_entries=int(os.getenv('QNA_CACHE_MAX_ENTRIES', 1024)),
+            ttl=float(os.getenv('QNA_CACHE_TTL', 24 * 3600)),
+            similarity=float(os.getenv('QNA_CACHE_SIMILARITY', 0)),
+            backend=SQLiteCacheBackend(db_path, table='qna_cache') if db_path else None
+        )
+
+    def _load(self):
+        rows = self.backend.items(since=time.time() - self.ttl, limit=self.max_entries)
+        with self.lock:
+            for key, payload, created_at in reversed(rows):
+                entry = json.loads(payload)
+                self._store(key, entry['question'], entry['answer'], created_at)
+
+    def get(self, question: str) -> Optional[str]:
+        normalized = normalize_question(question)
+        key = question_key(question)
+        expired = []
+        with self.lock:
+            entry = self._live_entry(key, expired)
+            if entry is not None:
+                self.exact_hits += 1
+            elif self.similarity is not None:
+                similar_key, score = self.index.nearest(normalized)
+                if similar_key is not None and score >= self.similarity:
+                    key = similar_key
+                    entry = self._live_entry(key, expired)
+                    if entry is not None:
+                        self.similar_hits += 1
+
+            if entry is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+
+        if expired and self.backend:
+            self.backend.delete(expired)
+        return entry[1] if entry is not None else None
+
+    def put(self, question: str, answer: str):
+        if not answer:
+            return
+        normalized = normalize_question(question)
+        key = question_key(question)
+        created_at = time.time()
+        with self.lock:
+            evicted = self._store(key, normalized, answer, created_at)
+        if self.backend:
+            self.backend.put(key, json.dumps({'question': normalized, 'answer': answer}), created_at)
+            if evicted:
+                self.backend.delete(evicted)
+
+    def _live_entry(self, key: str, expired: List[str]) -> Optional[Tuple[str, str, float]]:
+        entry = self.entries.get(key)
+        if entry is not None and time.time() - entry[2] > self.ttl:
+            self._remove(key)
+            self.expirations += 1
+            expired.append(key)
+            return None
+        return entry
+
+    def _store(self, key: str, normalized: str, answer: str, created_at: float) -> List[str]:
+        self.entries.pop(key, None)
+        self.entries[key] = (normalized, answer, created_at)
+        self.index.add(key, normalized)
+
+        evicted = []
+        while len(self.entries) > self.max_entries:
+            evicted_key = next(iter(self.entries))
+            self._remove(evicted_key)
+            self.evictions += 1
+            evicted.append(evicted_key)
+        return evicted
+
+    def _remove(self, key: str):
+        del self.entries[key]
+        self.index.remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.index = QuestionIndex()
+
+    def stats(self) -> Dict[str, object]:
+        with self.lock:
+            hits = self.exact_hits + self.similar_hits
+            lookups = hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'exact_hits': self.exact_hits,
+                'similar_hits': self.similar_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'similarity_threshold': self.similarity,
+                'backend': self.backend.path if self.backend else None
+            }
@@ -1,9 +1,27 @@
-from fastapi import FastAPI
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware  # Add this import
-from code_parser import CodeParser
-from agent import generate_prediction
-import sympy as sp
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from analysis_cache import AnalysisCache
+from analysis_channel import AnalysisChannel
+from content_index import ContentIndex
+from analysis_limits import SourceTooLarge
+from ast_export import EXPORT_FORMATS
+from analysis_workers import CACHEABLE_TASKS, AnalysisWorkers, WorkersSaturated
+from batch_analysis import BatchRun, json_items, ndjson_objects
+from editor_sessions import EditorSessionStore, SessionUpdate
+from agent import agenerate_prediction, astream_prediction, close_inference, inference_stats, warm_up_inference
+from answer_cache import AnswerCache
+from inference_client import InferenceBusy, InferenceError
+from metrics import REGISTRY, http_request_seconds, qna_requests_total
+from empirical_verification import CompileError, EmpiricalVerifier, VerifierUnavailable
+from project_analysis import ProjectAnalysis, ProjectInput, ProjectTooLarge, read_tarball
+from starlette.concurrency import run_in_threadpool
 
 class CodeInput(BaseModel):
     code:str
@@ -11,8 +29,37 @@ class CodeInput(BaseModel):
 class Question(BaseModel):
     question:str
 
-code_parser = CodeParser()
-app = FastAPI()
+analysis_cache = AnalysisCache.from_env()
+content_index = ContentIndex.from_env()
+analysis_workers = AnalysisWorkers.from_env(analysis_cache, content_index)
+editor_sessions = EditorSessionStore.from_env()
+project_analysis = ProjectAnalysis.from_env(analysis_workers)
+verifier = EmpiricalVerifier.from_env()
+answer_cache = AnswerCache.from_env()
+
+REGISTRY.gauge('analysis_in_flight', 'Analyses queued or running on the workers',
+               lambda: {(): analysis_workers.in_flight})
+# Session id -> connected editor channels
+open_channels = {}
+REGISTRY.gauge('editor_channels_open', 'Connected editor WebSocket channels',
+               lambda: {(): sum(open_channels.values())})
+REGISTRY.gauge('qna_in_flight', 'Generations holding an inference slot',
+               lambda: {(): (inference_stats()['client'] or {}).get('in_flight', 0)})
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Optional warm-up (WARMUP=analysis,qna); by default everything heavy loads on first use
+    warm_up = {name.strip() for name in os.getenv('WARMUP', '').split(',') if name.strip()}
+    if 'analysis' in warm_up:
+        await analysis_workers.warm_up()
+    if 'qna' in warm_up:
+        warm_up_inference()
+    yield
+    analysis_workers.shutdown()
+    verifier.shutdown()
+    await close_inference()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,54 +69,293 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Labelled by route template, so /sessions/{session_id}/analysis is one series
+    route = request.scope.get("route")
+    http_request_seconds.observe(time.perf_counter() - start, method=request.method,
+                                 route=route.path if route is not None else "unmatched",
+                                 status=response.status_code)
+    return response
+
+@app.exception_handler(WorkersSaturated)
+async def workers_saturated(request, error: WorkersSaturated):
+    return JSONResponse(status_code=429, content={"detail": str(error)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(SourceTooLarge)
+async def source_too_large(request, error: SourceTooLarge):
+    return JSONResponse(status_code=413, content={"detail": str(error)})
+
+@app.exception_handler(VerifierUnavailable)
+async def verifier_unavailable(request, error: VerifierUnavailable):
+    return JSONResponse(status_code=503, content={"detail": str(error)})
+
+@app.exception_handler(InferenceBusy)
+async def inference_busy(request, error: InferenceBusy):
+    return JSONResponse(status_code=429, content={"detail": str(error)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(InferenceError)
+async def inference_failed(request, error: InferenceError):
+    return JSONResponse(status_code=502, content={"detail": str(error)})
+
+async def stream_ast(code: str, format: str, **filters):
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    result = await analysis_workers.run("parse", code, format=format, **filters)
+    if result.get("degraded"):
+        return result
+    # A plain iterator, so Starlette encodes each chunk on a worker thread rather than on the event loop
+    return StreamingResponse(result["export"].chunks(format), media_type=EXPORT_FORMATS[format],
+                             headers={"X-AST-Node-Count": str(result["count"])})
+
 @app.post("/parse")
-async def parse_code(input: CodeInput):
-    tree = code_parser.evaluate_code_syntax(input.code)
-    return {"tree": str(tree.root_node)}
+async def parse_code(input: CodeInput, format: str = "json", max_depth: Optional[int] = None,
+                     start_byte: Optional[int] = None, end_byte: Optional[int] = None, named_only: bool = False):
+    """
+    Streams the syntax tree as a flat array of (type id, parent index, start byte, end byte)
+    rows, as JSON or as packed binary (format=binary). start_byte/end_byte export only the
+    smallest node spanning that range, max_depth cuts off deeper nodes, named_only drops
+    punctuation and keywords.
+    """
+    return await stream_ast(input.code, format, max_depth=max_depth,
+                            start_byte=start_byte, end_byte=end_byte, named_only=named_only)
 
 @app.post("/errors")
-async def get_errors(input: CodeInput):
-    tree = code_parser.evaluate_code_syntax(input.code)
-    errors = code_parser.find_error_nodes(tree)
-    if errors: 
-        return {"errors":0}
-    return {"errors":0}
+async def get_errors(input: CodeInput, max_diagnostics: Optional[int] = None):
+    """
+    Syntax errors (ERROR and MISSING nodes) with a short message and 0-based line/column
+    range each. Stops after max_diagnostics errors (0 for all of them), by default
+    ANALYSIS_MAX_DIAGNOSTICS; "truncated" says whether it did.
+    """
+    if max_diagnostics is not None and max_diagnostics < 0:
+        raise HTTPException(status_code=400, detail="max_diagnostics must not be negative")
+    return await analysis_workers.run("errors", input.code, max_diagnostics=max_diagnostics)
 
 @app.post("/time_complexity")
 async def analyse_time_complexity(input: CodeInput):
-    tree = code_parser.evaluate_code_syntax(input.code)
-    time_complexity = code_parser.analyze_time_complexity(tree)
-    return {"time_complexity": str(sp.simplify(time_complexity))}
+    return await analysis_workers.run("time_complexity", input.code)
 
 @app.post("/memory_usage")
 async def analyze_memory_usage(input: CodeInput):
-    tree = code_parser.evaluate_code_syntax(input.code)
-    memory_usage, _ = code_parser.analyze_memory_usage(tree.root_node)
-    return {"memory_usage": str(sp.simplify(memory_usage))}
+    return await analysis_workers.run("memory_usage", input.code)
 
 @app.post("/print_ast")
-async def print_tree(input: CodeInput):
-    tree = code_parser.evaluate_code_syntax(input.code)
-    code_parser.print_tree(tree)
-    return {"message": "tree printed to console"}
+async def print_tree(input: CodeInput, max_depth: Optional[int] = None, start_byte: Optional[int] = None,
+                     end_byte: Optional[int] = None, named_only: bool = False):
+    """Streams the syntax tree as an indented text outline; takes the same filters as /parse"""
+    return await stream_ast(input.code, "text", max_depth=max_depth,
+                            start_byte=start_byte, end_byte=end_byte, named_only=named_only)
 
 @app.post("/return_analysis")
 async def print_info(input: CodeInput):
     """
     Returns time complexity, memory usage and syntax errors if any.
     """
-    tree = code_parser.evaluate_code_syntax(input.code)
-    errors = code_parser.find_error_nodes(tree.root_node)
-    time_complexity = code_parser.analyze_time_complexity(tree.root_node)
-    memory, _ = code_parser.analyze_memory_usage(tree.root_node)
-    return {
-        "Syntax Errors": errors,
-        "Time Complexity": str(sp.simplify(time_complexity)),
-        "Memory Usage": str(sp.simplify(memory))
-    }
+    return await analysis_workers.run("return_analysis", input.code)
+
+@app.post("/function_report")
+async def function_report(input: CodeInput):
+    """
+    Returns time complexity and memory usage per function, with calls between functions
+    composed (a call to an O(n) helper inside a loop costs O(n**2)).
+    """
+    return await analysis_workers.run("function_report", input.code)
+
+@app.post("/verify_complexity")
+async def verify_complexity(input: CodeInput):
+    """
+    Compiles the program and runs it on inputs of growing size (n, then n integers, on
+    stdin), fitting its CPU time and peak memory to complexity classes. Returns the
+    measured classes next to the analyzers' predicted ones. Off unless VERIFY_ENABLED is set.
+    """
+    try:
+        return await verifier.verify(input.code)
+    except CompileError as error:
+        raise HTTPException(status_code=400, detail={"compiler_output": str(error)})
+
+@app.post("/batch_analysis")
+async def batch_analysis(request: Request, kind: str = "return_analysis"):
+    """
+    Analyzes many submissions over one connection. The body is a JSON list of CodeInput
+    objects (or {"items": [...]}), or an NDJSON stream of them with an
+    application/x-ndjson content type. Analyses start while the body is still arriving;
+    results stream back as NDJSON lines tagged with the item's index, in completion
+    order, followed by a summary line.
+    """
+    if kind not in CACHEABLE_TASKS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {', '.join(CACHEABLE_TASKS)}")
+
+    if "ndjson" in request.headers.get("content-type", ""):
+        items = ndjson_objects(request.stream())
+    else:
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON list or an NDJSON stream")
+        if isinstance(body, dict):
+            body = body.get("items")
+        if not isinstance(body, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON list of code inputs")
+        items = json_items(body)
+
+    # The body has to be fully read before streaming the response starts, since the
+    # response listens for client disconnects on the same receive channel
+    batch = BatchRun(analysis_workers, kind, CodeInput)
+    await batch.read(items)
+    return StreamingResponse(batch.results(), media_type="application/x-ndjson")
+
+@app.post("/project_analysis")
+async def analyze_project(request: Request):
+    """
+    Analyzes several files as one program, resolving calls between them. The body is
+    {"files": [{"path": ..., "code": ...}]}, or a tar archive (optionally gzipped) of the
+    project with an application/x-tar, application/gzip or application/octet-stream
+    content type. Returns per-file syntax errors and per-function complexity, each
+    function tagged with the file defining it.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        try:
+            project = ProjectInput.model_validate(await request.json())
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error))
+        files = [(file.path, file.code) for file in project.files]
+    else:
+        length = request.headers.get("content-length")
+        if project_analysis.max_bytes and length and length.isdigit() and int(length) > project_analysis.max_bytes:
+            raise ProjectTooLarge(f"Project archive is {length} bytes, the limit is {project_analysis.max_bytes}")
+        data = await request.body()
+        try:
+            files = await run_in_threadpool(read_tarball, data, project_analysis.max_files, project_analysis.max_bytes)
+        except SourceTooLarge:
+            raise
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error))
+    try:
+        return await project_analysis.analyze(files)
+    except SourceTooLarge:
+        raise
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+@app.post("/sessions/{session_id}/analysis")
+async def session_analysis(session_id: str, update: SessionUpdate):
+    """
+    Incremental analysis for a live editor session: reparses around the edit and
+    re-analyzes only the functions it touched.
+    """
+    try:
+        return await analysis_workers.call(editor_sessions.update, session_id, update)
+    except SourceTooLarge:
+        raise
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+@app.websocket("/sessions/{session_id}/channel")
+async def session_channel(websocket: WebSocket, session_id: str):
+    """
+    The same incremental analysis over one long-lived connection. Send SessionUpdate
+    JSON messages (optionally with a "seq"); diagnostics and then per-function results
+    are pushed as they are ready. Updates sent while earlier ones are being analyzed are
+    folded into the next parse, and analyses made stale by them are abandoned.
+    """
+    await websocket.accept()
+    channel = AnalysisChannel(session_id, editor_sessions, analysis_workers, websocket.send_json)
+    open_channels[session_id] = open_channels.get(session_id, 0) + 1
+    try:
+        await channel.serve(websocket.receive_text)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        open_channels[session_id] -= 1
+        if not open_channels[session_id]:
+            del open_channels[session_id]
+
+@app.delete("/sessions/{session_id}")
+async def close_session(session_id: str):
+    return {"closed": editor_sessions.close(session_id)}
+
+@app.get("/cache_stats")
+async def cache_stats():
+    return analysis_cache.stats()
+
+@app.get("/content_index_stats")
+async def content_index_stats():
+    return content_index.stats() if content_index is not None else {"enabled": False}
+
+@app.get("/worker_stats")
+async def worker_stats():
+    return analysis_workers.stats()
+
+@app.get("/verify_stats")
+async def verify_stats():
+    return verifier.stats()
+
+@app.get("/inference_stats")
+async def get_inference_stats():
+    return inference_stats()
+
+@app.get("/metrics")
+async def metrics():
+    """Stage latencies, request latencies and Q&A timings in the Prometheus text format"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/qna_cache_stats")
+async def qna_cache_stats():
+    return answer_cache.stats()
+
+def relay_answer_events(user_question: str, cached_answer: str = None):
+    """
+    Server-sent events for a streamed answer: one `data: {"token": ...}` event per chunk,
+    then an `event: done` event. If the client disconnects, the upstream generation is closed.
+    A cached answer is sent as a single token; a completed generation is cached.
+    """
+    async def events():
+        if cached_answer is not None:
+            yield f"data: {json.dumps({'token': cached_answer})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+            qna_requests_total.inc(outcome="cache_hit")
+            return
+
+        tokens = astream_prediction(user_question)
+        answer = []
+        try:
+            async for token in tokens:
+                answer.append(token)
+                yield f"data: {json.dumps({'token': token})}\n\n"
+            await run_in_threadpool(answer_cache.put, user_question, ''.join(answer))
+            yield "event: done\ndata: {}\n\n"
+            qna_requests_total.inc(outcome="generated")
+        except InferenceError as error:
+            qna_requests_total.inc(outcome="error")
+            # Headers are already sent, so failures are reported in-band
+            yield f"event: error\ndata: {json.dumps({'detail': str(error)})}\n\n"
+        finally:
+            await tokens.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @app.post("/technical-qna")
-async def generate_answer(question: Question):
-    answer = generate_prediction(question.question)
-    print(answer)
+async def generate_answer(question: Question, stream: bool = False):
+    """
+    Answers a C++ question. With ?stream=true the answer is relayed as server-sent
+    events while the model generates it. Repeated (or, if enabled, near-identical)
+    questions are answered from the answer cache.
+    """
+    # Cache I/O stays on the default threadpool, off the analysis workers
+    cached_answer = await run_in_threadpool(answer_cache.get, question.question)
+    if stream:
+        return relay_answer_events(question.question, cached_answer)
+    if cached_answer is not None:
+        qna_requests_total.inc(outcome="cache_hit")
+        return {"answer": cached_answer}
+    try:
+        answer = await agenerate_prediction(question.question)
+    except InferenceError:
+        qna_requests_total.inc(outcome="error")
+        raise
+    qna_requests_total.inc(outcome="generated")
+    await run_in_threadpool(answer_cache.put, question.question, answer)
     return {"answer": answer}
\ No newline at end of file
@@ -0,0 +1,181 @@
+import json
+import struct
+import sys
+import time
+from array import array
+from typing import Dict, Iterator, List, Optional
+
+from metrics import timed
+
+FIELDS = ('type', 'parent', 'start_byte', 'end_byte')
+
+# Response media type per export format
+EXPORT_FORMATS = {
+    'json': 'application/json',
+    'binary': 'application/octet-stream',
+    'text': 'text/plain; charset=utf-8'
+}
+
+BINARY_MAGIC = b'CAST'
+BINARY_VERSION = 1
+# magic, version, type count, node count
+BINARY_HEADER = struct.Struct('<4sBII')
+# type id, name length; followed by the UTF-8 name
+BINARY_TYPE = struct.Struct('<HB')
+
+# Nodes per streamed chunk
+CHUNK_NODES = 4096
+
+# Leaf text shown by the text outline; subtrees cut off by max_depth can span a lot of source
+TEXT_PREVIEW_BYTES = 60
+
+
+class AstExport:
+    """
+    A syntax tree flattened into pre-order rows of (type id, parent index, start byte,
+    end byte), stored as one flat int32 array, 16 bytes a node. Parent indices point at
+    earlier rows; the root's parent is -1. Type ids are the grammar's node kind ids, with
+    the names of the ones used in `types`.
+
+    Encodings, all produced lazily in chunks, so a response can start before it is
+    encoded and only one chunk of the encoding is held at a time:
+
+    - json: {"fields": [...], "types": {id: name}, "count": N, "nodes": [flat ints]}
+    - binary: BINARY_HEADER, then per type BINARY_TYPE and its name, then N records of
+      four little-endian int32s
+    - text: an indented outline, one node per line, with (the start of) leaf text
+    """
+    __slots__ = ['nodes', 'types', 'source']
+
+    def __init__(self, nodes: array, types: Dict[int, str], source: bytes):
+        self.nodes = nodes
+        self.types = types
+        self.source = source
+
+    @property
+    def count(self) -> int:
+        return len(self.nodes) // len(FIELDS)
+
+    def chunks(self, format: str) -> Iterator[bytes]:
+        if format == 'json':
+            return self.json_chunks()
+        if format == 'binary':
+            return self.binary_chunks()
+        if format == 'text':
+            return self.text_chunks()
+        raise ValueError(f"Unknown AST export format: {format}")
+
+    def json_chunks(self) -> Iterator[bytes]:
+        types = json.dumps({str(type_id): name for type_id, name in self.types.items()})
+        yield f'{{"fields":{json.dumps(FIELDS)},"types":{types},"count":{self.count},"nodes":['.encode('utf8')
+        step = CHUNK_NODES * len(FIELDS)
+        for start in range(0, len(self.nodes), step):
+            chunk = json.dumps(self.nodes[start:start + step].tolist(), separators=(',', ':'))[1:-1]
+            yield (',' + chunk if start else chunk).encode('utf8')
+        yield b']}'
+
+    def binary_chunks(self) -> Iterator[bytes]:
+        header = [BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(self.types), self.count)]
+        for type_id, name in self.types.items():
+            encoded = name.encode('utf8')[:255]
+            header.append(BINARY_TYPE.pack(type_id, len(encoded)) + encoded)
+        yield b''.join(header)
+        step = CHUNK_NODES * len(FIELDS)
+        for start in range(0, len(self.nodes), step):
+            records = self.nodes[start:start + step]
+            if sys.byteorder == 'big':
+                records.byteswap()
+            yield records.tobytes()
+
+    def text_chunks(self) -> Iterator[bytes]:
+        nodes = self.nodes
+        stride = len(FIELDS)
+        depths: List[int] = []
+        has_children = [False] * self.count
+        for row in range(self.count):
+            parent = nodes[row * stride + 1]
+            if parent >= 0:
+                has_children[parent] = True
+        lines = []
+        for row in range(self.count):
+            type_id, parent, start_byte, end_byte = nodes[row * stride:row * stride + stride]
+            depth = depths[parent] + 1 if parent >= 0 else 0
+            depths.append(depth)
+            line = '  ' * depth + f'- {self.types[type_id]}'
+            if not has_children[row]:
+                text = self.source[start_byte:min(end_byte, start_byte + TEXT_PREVIEW_BYTES)].decode('utf8', 'replace')
+                line += ': ' + json.dumps(text if end_byte - start_byte <= TEXT_PREVIEW_BYTES else text + '...')
+            lines.append(line)
+            if len(lines) == CHUNK_NODES:
+                yield ('\n'.join(lines) + '\n').encode('utf8')
+                lines = []
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode('utf8')
+
+
+@timed('ast_export')
+def export_tree(code_parser, tree, source: bytes, max_depth: Optional[int] = None, start_byte: Optional[int] = None,
+                end_byte: Optional[int] = None, named_only: bool = False) -> AstExport:
+    """
+    Flatten tree, or only the smallest node spanning [start_byte, end_byte) if either is
+    given. max_depth cuts off nodes deeper than that below the exported root; named_only
+    leaves out anonymous nodes such as punctuation and keywords.
+
+    Uses its own cursor loop rather than CodeParser.walk, since handler dispatch would
+    cost several times the export itself, but stops at the same nesting and time limits.
+    """
+    node = tree.root_node
+    if start_byte is not None or end_byte is not None:
+        start = start_byte if start_byte is not None else 0
+        end = end_byte if end_byte is not None else start
+        node = node.descendant_for_byte_range(start, max(start, end)) or node
+
+    limits = code_parser.limits
+    nesting_limit = limits.max_depth
+    deadline = code_parser.deadline
+    packed = array('i')
+    # Appending to a list is several times faster than to an array, but the list holds
+    # each int as an object, so rows are moved into the array every CHUNK_NODES rows
+    nodes: List[int] = []
+    types: Dict[int, str] = {}
+    # Row of the nearest exported ancestor at each depth
+    parents = [-1]
+    cursor = node.walk()
+    depth = 0
+    row = 0
+    while True:
+        current = cursor.node
+        descend = True
+        if not named_only or current.is_named:
+            kind_id = current.kind_id
+            if kind_id not in types:
+                types[kind_id] = current.type
+            nodes += (kind_id, parents[depth], current.start_byte, current.end_byte)
+            parent_row = row
+            row += 1
+            if not row % CHUNK_NODES:
+                packed.fromlist(nodes)
+                nodes = []
+            descend = max_depth is None or depth < max_depth
+        else:
+            # Anonymous nodes are leaves (or close to it); their children are not exported either
+            descend = False
+            parent_row = parents[depth]
+
+        if descend and cursor.goto_first_child():
+            depth += 1
+            if nesting_limit and depth > nesting_limit:
+                raise limits.depth_exceeded()
+            if deadline is not None and not row & 1023 and time.monotonic() > deadline:
+                raise limits.time_exceeded()
+            if len(parents) <= depth:
+                parents.append(parent_row)
+            else:
+                parents[depth] = parent_row
+            continue
+        while depth and not cursor.goto_next_sibling():
+            cursor.goto_parent()
+            depth -= 1
+        if not depth:
+            packed.fromlist(nodes)
+            return AstExport(packed, types, source)
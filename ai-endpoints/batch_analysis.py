@@ -0,0 +1,141 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List
+
+from pydantic import ValidationError
+
+from analysis_cache import source_key
+from analysis_workers import AnalysisWorkers, WorkersSaturated
+
+# Sentinel put on the results queue once every analysis has finished
+_DONE = object()
+
+
+async def ndjson_objects(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """Decode an NDJSON byte stream into objects as lines arrive; undecodable lines yield the error"""
+    buffer = b''
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            if line.strip():
+                yield _decode_line(line)
+    if buffer.strip():
+        yield _decode_line(buffer)
+
+
+def _decode_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError as error:
+        return error
+
+
+async def json_items(items: List[Any]) -> AsyncIterator[Any]:
+    for item in items:
+        yield item
+
+
+class BatchRun:
+    """
+    One bulk-grading batch. read() dispatches an analysis for every distinct source as
+    items arrive; results() then yields one NDJSON line per item as analyses finish.
+
+    Items with identical (normalized) sources are analyzed once and the result is fanned
+    out to each of their indices. A bad item or a failed analysis produces an error line
+    for that index only; the rest of the batch carries on.
+    """
+    __slots__ = ['workers', 'kind', 'code_model', 'max_retries', 'concurrency', 'queue',
+                 'waiting', 'finished', 'tasks', 'closer', 'items', 'unique']
+
+    def __init__(self, workers: AnalysisWorkers, kind: str, code_model, max_retries: int = 5):
+        self.workers = workers
+        self.kind = kind
+        self.code_model = code_model
+        self.max_retries = max_retries
+        # Leave room in the worker queue for interactive requests
+        self.concurrency = asyncio.Semaphore(workers.max_workers)
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.waiting: Dict[str, List[int]] = {}
+        self.finished: Dict[str, Dict[str, Any]] = {}
+        self.tasks = set()
+        self.closer = None
+        self.items = 0
+        self.unique = 0
+
+    async def read(self, items: AsyncIterator[Any]):
+        """Consume every item, starting analyses as soon as each distinct source is seen"""
+        try:
+            await self._read(items)
+        except BaseException:
+            for task in list(self.tasks):
+                task.cancel()
+            raise
+        self.closer = asyncio.create_task(self._close())
+
+    async def _read(self, items: AsyncIterator[Any]):
+        async for item in items:
+            index = self.items
+            self.items += 1
+            try:
+                if isinstance(item, Exception):
+                    raise item
+                code = self.code_model.model_validate(item).code
+            except (ValueError, ValidationError) as error:
+                self.queue.put_nowait((None, {'index': index, 'error': f"Invalid item: {error}"}))
+                continue
+
+            key = source_key(self.kind, code)
+            if key in self.finished:
+                self.queue.put_nowait((None, {'index': index, **self.finished[key]}))
+            elif key in self.waiting:
+                self.waiting[key].append(index)
+            else:
+                self.waiting[key] = [index]
+                self.unique += 1
+                task = asyncio.create_task(self._analyze(key, code))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+    async def _analyze(self, key: str, code: str):
+        async with self.concurrency:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    outcome = {'result': await self.workers.run(self.kind, code)}
+                    break
+                except WorkersSaturated as error:
+                    if attempt == self.max_retries:
+                        outcome = {'error': str(error)}
+                        break
+                    await asyncio.sleep(0.05 * 2 ** attempt)
+                except Exception as error:
+                    outcome = {'error': f"{type(error).__name__}: {error}"}
+                    break
+        self.finished[key] = outcome
+        self.queue.put_nowait((key, outcome))
+
+    async def _close(self):
+        while self.tasks:
+            await asyncio.gather(*self.tasks)
+        self.queue.put_nowait(_DONE)
+
+    async def results(self) -> AsyncIterator[str]:
+        try:
+            while True:
+                message = await self.queue.get()
+                if message is _DONE:
+                    break
+                key, outcome = message
+                if key is None:
+                    yield json.dumps(outcome) + '\n'
+                    continue
+                for index in self.waiting.pop(key):
+                    yield json.dumps({'index': index, **outcome}) + '\n'
+
+            yield json.dumps({'done': True, 'items': self.items, 'unique': self.unique}) + '\n'
+        finally:
+            # Client went away or we are done; either way nothing is left to wait for
+            if self.closer is not None:
+                self.closer.cancel()
+            for task in list(self.tasks):
+                task.cancel()
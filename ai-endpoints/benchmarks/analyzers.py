@@ -0,0 +1,253 @@
+"""
+Benchmark and regression gate for the CodeParser analyzers.
+
+Runs each stage (parse, errors, time_complexity, memory_usage, the fused analyze and
+function_report) over the real programs in benchmarks/corpus (plus any --corpus
+directories of .cpp files) and over generated programs scaled from tens to tens of
+thousands of lines. For every program and stage it reports the median and min latency,
+the peak Python heap, the blocks still allocated once the result is dropped, and the
+garbage collections the stage triggered (tree-sitter's own C allocations are not
+traced). Analysis limits are switched off so large inputs are measured rather than cut
+short.
+
+    python benchmarks/analyzers.py --output baseline.json
+    python benchmarks/analyzers.py --baseline baseline.json --threshold 0.25
+
+With --baseline the run exits with status 1 if any stage's median latency or peak memory
+grew by more than --threshold over the baseline (ignoring changes below --min-delta-ms
+and --min-delta-kb, which are noise).
+"""
+import argparse
+import gc
+import glob
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(SERVICE_DIR, 'benchmarks', 'corpus')
+sys.path.insert(0, SERVICE_DIR)
+
+from analysis_limits import AnalysisLimits  # noqa: E402
+from code_parser import CodeParser  # noqa: E402
+from function_summaries import SummaryMemo  # noqa: E402
+
+STAGES = ('parse', 'errors', 'time_complexity', 'memory_usage', 'analyze', 'function_report')
+DEFAULT_SIZES = (10, 100, 1000, 10000, 30000)
+
+# Building blocks for generated programs; {i} makes every copy's names unique
+TEMPLATES = (
+    '''int sumPairs{i}(vector<int>& values) {{
+    int n = values.size();
+    int total = 0;
+    for (int a = 0; a < n; a++) {{
+        for (int b = a + 1; b < n; b++) {{
+            total += values[a] * values[b];
+        }}
+    }}
+    return total;
+}}
+''',
+    '''int binarySearch{i}(vector<int>& values, int lo, int hi, int target) {{
+    if (lo > hi)
+        return -1;
+    int mid = lo + (hi - lo) / 2;
+    if (values[mid] == target)
+        return mid;
+    if (values[mid] < target)
+        return binarySearch{i}(values, mid + 1, hi, target);
+    return binarySearch{i}(values, lo, mid - 1, target);
+}}
+''',
+    '''long long fib{i}(int n) {{
+    if (n < 2)
+        return n;
+    return fib{i}(n - 1) + fib{i}(n - 2);
+}}
+''',
+    '''class Counter{i} {{
+    vector<int> counts;
+public:
+    Counter{i}(int n) : counts(n, 0) {{}}
+    void add(int key) {{
+        counts[key % counts.size()]++;
+    }}
+    int total() {{
+        int sum = 0;
+        for (int k = 0; k < counts.size(); k++)
+            sum += counts[k];
+        return sum;
+    }}
+}};
+''',
+    '''int countHalvings{i}(int n) {{
+    int steps = 0;
+    for (int k = n; k > 0; k /= 2) {{
+        steps++;
+    }}
+    int buffer[64];
+    buffer[0] = steps;
+    return buffer[0] + sumPairs{i}(*new vector<int>(n, 1));
+}}
+''',
+)
+
+
+def generate_program(lines: int, seed: int = 0) -> str:
+    """A valid C++ program of about `lines` lines, built from TEMPLATES in a seeded order"""
+    rng = random.Random(seed)
+    parts = ['#include <bits/stdc++.h>', 'using namespace std;', '']
+    count = len(parts)
+    index = 0
+    while count < lines - 5:
+        # sumPairs comes first in every group, since countHalvings calls it
+        group = [TEMPLATES[0]] + rng.sample(TEMPLATES[1:], len(TEMPLATES) - 1)
+        for template in group:
+            block = template.format(i=index)
+            parts.append(block)
+            count += block.count('\n') + 1
+            if count >= lines - 5:
+                break
+        index += 1
+    parts.append('int main() {\n    int n;\n    return 0;\n}')
+    return '\n'.join(parts)
+
+
+def load_corpus(directories: list, sizes: list) -> dict:
+    programs = {}
+    for directory in directories:
+        for path in sorted(glob.glob(os.path.join(directory, '*.cpp'))):
+            with open(path, 'rb') as source:
+                programs[os.path.splitext(os.path.basename(path))[0]] = source.read()
+    for lines in sizes:
+        programs[f'generated_{lines}'] = generate_program(lines).encode('utf8')
+    return programs
+
+
+def stage_runner(stage: str, source: bytes, limits: AnalysisLimits):
+    """A callable running one stage on a fresh CodeParser, so no stage sees another's cached state"""
+    tree = CodeParser(limits=limits).evaluate_code_syntax(source)
+    root = tree.root_node
+    if stage == 'parse':
+        return lambda: CodeParser(limits=limits).evaluate_code_syntax(source)
+    if stage == 'errors':
+        return lambda: CodeParser(limits=limits).find_error_nodes(root)
+    if stage == 'time_complexity':
+        return lambda: CodeParser(limits=limits).analyze_time_complexity(root)
+    if stage == 'memory_usage':
+        return lambda: CodeParser(limits=limits).analyze_memory_usage(root)
+    if stage == 'analyze':
+        return lambda: CodeParser(limits=limits).analyze(root)
+    if stage == 'function_report':
+        return lambda: CodeParser(limits=limits).function_report(root, SummaryMemo())
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def measure(run, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+
+    # One more run under tracemalloc, which slows things down too much to time
+    gc.collect()
+    collections_before = sum(generation['collections'] for generation in gc.get_stats())
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    result = run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    collections = sum(generation['collections'] for generation in gc.get_stats()) - collections_before
+    # Whatever the stage left behind once its result is gone: caches, or leaks
+    del result
+    retained_blocks = sys.getallocatedblocks() - blocks_before
+
+    return {
+        'median_ms': statistics.median(timings) * 1000,
+        'min_ms': min(timings) * 1000,
+        'peak_kb': peak / 1024,
+        'retained_blocks': retained_blocks,
+        'gc_collections': collections
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVICE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def regressions(baseline: dict, result: dict, threshold: float, min_delta_ms: float, min_delta_kb: float) -> list:
+    found = []
+    for name, program in result['programs'].items():
+        base_program = baseline.get('programs', {}).get(name)
+        if base_program is None:
+            continue
+        for stage, current in program['stages'].items():
+            base = base_program['stages'].get(stage)
+            if base is None:
+                continue
+            for metric, min_delta in (('median_ms', min_delta_ms), ('peak_kb', min_delta_kb)):
+                if current[metric] > base[metric] * (1 + threshold) and current[metric] - base[metric] > min_delta:
+                    found.append(f"{name} {stage} {metric}: {base[metric]:.1f} -> {current[metric]:.1f} "
+                                 f"(+{(current[metric] / base[metric] - 1) * 100 if base[metric] else float('inf'):.0f}%)")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='*', default=list(DEFAULT_SIZES),
+                        help='line counts of the generated programs (default %(default)s)')
+    parser.add_argument('--corpus', action='append', default=[], help='another directory of .cpp files to include')
+    parser.add_argument('--stages', nargs='*', default=list(STAGES), choices=STAGES, help='stages to run (default all)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per program and stage (default 3)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='results JSON of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative growth (default 0.25)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore latency changes below this (default 1)')
+    parser.add_argument('--min-delta-kb', type=float, default=64.0, help='ignore peak memory changes below this (default 64)')
+    args = parser.parse_args()
+
+    limits = AnalysisLimits(max_source_bytes=0, max_nodes=0, max_depth=0, parse_timeout=0, analysis_timeout=0)
+    programs = load_corpus([CORPUS_DIR, *args.corpus], args.sizes)
+    result = {'commit': git_commit(), 'python': sys.version.split()[0], 'repeat': args.repeat, 'programs': {}}
+
+    print(f"{'program':<24}{'lines':>7}{'nodes':>9}  " + ''.join(f'{stage:>17}' for stage in args.stages))
+    for name, source in programs.items():
+        tree = CodeParser(limits=limits).evaluate_code_syntax(source)
+        program = {
+            'lines': source.count(b'\n') + 1,
+            'bytes': len(source),
+            'nodes': tree.root_node.descendant_count,
+            'stages': {stage: measure(stage_runner(stage, source, limits), args.repeat) for stage in args.stages}
+        }
+        result['programs'][name] = program
+        print(f"{name:<24}{program['lines']:>7}{program['nodes']:>9}  " +
+              ''.join(f"{program['stages'][stage]['median_ms']:>14.1f} ms" for stage in args.stages))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(result, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        found = regressions(baseline, result, args.threshold, args.min_delta_ms, args.min_delta_kb)
+        if found:
+            print(f"\n{len(found)} regression(s) against {args.baseline} ({baseline.get('commit', '?')}):")
+            for line in found:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline} ({baseline.get('commit', '?')})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+#include <iostream>
+using namespace std;
+
+struct Node {
+    int key;
+    Node* left;
+    Node* right;
+    Node(int item) : key(item), left(nullptr), right(nullptr) {}
+};
+
+Node* insert(Node* node, int key) {
+    if (node == nullptr)
+        return new Node(key);
+    if (key < node->key)
+        node->left = insert(node->left, key);
+    else if (key > node->key)
+        node->right = insert(node->right, key);
+    return node;
+}
+
+Node* search(Node* root, int key) {
+    if (root == nullptr || root->key == key)
+        return root;
+    if (root->key < key)
+        return search(root->right, key);
+    return search(root->left, key);
+}
+
+void inorder(Node* root) {
+    if (root != nullptr) {
+        inorder(root->left);
+        cout << root->key << " ";
+        inorder(root->right);
+    }
+}
+
+bool isEven(int n);
+bool isOdd(int n) { return n == 0 ? false : isEven(n - 1); }
+bool isEven(int n) { return n == 0 ? true : isOdd(n - 1); }
+
+int main() {
+    Node* root = nullptr;
+    int keys[] = {50, 30, 20, 40, 70, 60, 80};
+    for (int i = 0; i < 7; i++)
+        root = insert(root, keys[i]);
+    inorder(root);
+    cout << (search(root, 60) != nullptr) << " " << isEven(7) << endl;
+    return 0;
+}
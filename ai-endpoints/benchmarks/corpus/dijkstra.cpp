@@ -0,0 +1,59 @@
+#include <bits/stdc++.h>
+using namespace std;
+
+class Graph {
+    int V;
+    vector<vector<pair<int, int>>> adj;
+
+public:
+    Graph(int V) : V(V), adj(V) {}
+
+    void addEdge(int u, int v, int w) {
+        adj[u].push_back({v, w});
+        adj[v].push_back({u, w});
+    }
+
+    vector<int> shortestPath(int src) {
+        priority_queue<pair<int, int>, vector<pair<int, int>>, greater<pair<int, int>>> pq;
+        vector<int> dist(V, INT_MAX);
+        pq.push({0, src});
+        dist[src] = 0;
+
+        while (!pq.empty()) {
+            int u = pq.top().second;
+            pq.pop();
+            for (auto& edge : adj[u]) {
+                int v = edge.first;
+                int weight = edge.second;
+                if (dist[v] > dist[u] + weight) {
+                    dist[v] = dist[u] + weight;
+                    pq.push({dist[v], v});
+                }
+            }
+        }
+        return dist;
+    }
+};
+
+int main() {
+    int V = 9;
+    Graph g(V);
+    g.addEdge(0, 1, 4);
+    g.addEdge(0, 7, 8);
+    g.addEdge(1, 2, 8);
+    g.addEdge(1, 7, 11);
+    g.addEdge(2, 3, 7);
+    g.addEdge(2, 8, 2);
+    g.addEdge(2, 5, 4);
+    g.addEdge(3, 4, 9);
+    g.addEdge(3, 5, 14);
+    g.addEdge(4, 5, 10);
+    g.addEdge(5, 6, 2);
+    g.addEdge(6, 7, 1);
+    g.addEdge(6, 8, 6);
+    g.addEdge(7, 8, 7);
+    vector<int> dist = g.shortestPath(0);
+    for (int i = 0; i < V; i++)
+        cout << i << " \t\t " << dist[i] << endl;
+    return 0;
+}
@@ -0,0 +1,40 @@
+#include <bits/stdc++.h>
+using namespace std;
+
+int matrixChainMemo(vector<int>& dims, int i, int j, vector<vector<int>>& memo) {
+    if (i + 1 == j)
+        return 0;
+    if (memo[i][j] != -1)
+        return memo[i][j];
+    int best = INT_MAX;
+    for (int k = i + 1; k < j; k++) {
+        int cost = matrixChainMemo(dims, i, k, memo) + matrixChainMemo(dims, k, j, memo) + dims[i] * dims[k] * dims[j];
+        best = min(best, cost);
+    }
+    return memo[i][j] = best;
+}
+
+int matrixChainTabulated(vector<int>& dims) {
+    int n = dims.size();
+    vector<vector<int>> dp(n, vector<int>(n, 0));
+    for (int len = 2; len < n; len++) {
+        for (int i = 0; i + len < n; i++) {
+            int j = i + len;
+            dp[i][j] = INT_MAX;
+            for (int k = i + 1; k < j; k++) {
+                int cost = dp[i][k] + dp[k][j] + dims[i] * dims[k] * dims[j];
+                dp[i][j] = min(dp[i][j], cost);
+            }
+        }
+    }
+    return dp[0][n - 1];
+}
+
+int main() {
+    vector<int> dims = {1, 2, 3, 4, 3};
+    int n = dims.size();
+    vector<vector<int>> memo(n, vector<int>(n, -1));
+    cout << matrixChainMemo(dims, 0, n - 1, memo) << endl;
+    cout << matrixChainTabulated(dims) << endl;
+    return 0;
+}
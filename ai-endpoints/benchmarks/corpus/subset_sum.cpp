@@ -0,0 +1,38 @@
+// C++ Program for Space Optimized Dynamic Programming
+// Solution to Subset Sum Problem
+#include <bits/stdc++.h>
+using namespace std;
+
+// Returns true if there is a subset of arr[]
+// with sum equal to given sum
+bool isSubsetSum(vector<int> arr, int sum) {
+    int n = arr.size();
+    vector<bool> prev(sum + 1, false), curr(sum + 1);
+
+    // Mark prev[0] = true as it is true
+    // to make sum = 0 using 0 elements
+    prev[0] = true;
+
+    // Fill the subset table in
+    // bottom up manner
+    for (int i = 1; i <= n; i++) {
+        for (int j = 0; j <= sum; j++) {
+            if (j < arr[i - 1])
+                curr[j] = prev[j];
+            else
+                curr[j] = (prev[j] || prev[j - arr[i - 1]]);
+        }
+        prev = curr;
+    }
+    return prev[sum];
+}
+
+int main() {
+    vector<int> arr = {3, 34, 4, 12, 5, 2};
+    int sum = 9;
+    if (isSubsetSum(arr, sum) == true)
+        cout << "True";
+    else
+        cout << "False";
+    return 0;
+}
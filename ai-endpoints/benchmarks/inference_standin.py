@@ -0,0 +1,96 @@
+"""
+Local stand-in for the text-generation inference server, so /technical-qna and the
+async inference client can be run and load-tested without a hosted model.
+
+Answers POST {"inputs", "parameters", "stream"} on any path, the way the hosted
+text-generation API does:
+- one prompt with "stream": true gets `data:{"token": {...}}` server-sent events, the
+  last one carrying generated_text;
+- a list of prompts (the micro-batcher's requests) gets one {"generated_text"} per prompt;
+- one prompt without streaming gets a one-element list.
+
+With return_full_text the prompt comes back in front of the answer, as from the hosted
+API. The answer is canned text cut to max_new_tokens words. STANDIN_TOKEN_DELAY is the
+pause between tokens (default 0.02 seconds); STANDIN_FAILURE_RATE answers that fraction
+of requests with 503 and Retry-After, to exercise the client's retries (default 0).
+
+    python benchmarks/inference_standin.py --port 8081
+    HF_INFERENCE_URL=http://127.0.0.1:8081/generate uvicorn app:app
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+ANSWER = (
+    "A hash map gives average constant time lookups, so replacing the inner loop with one "
+    "turns the quadratic scan into a single linear pass over the input. Keep the sorted "
+    "version if you also need the results in order, since sorting costs O(n log n)."
+)
+
+TOKEN_DELAY = float(os.getenv('STANDIN_TOKEN_DELAY', 0.02))
+FAILURE_RATE = float(os.getenv('STANDIN_FAILURE_RATE', 0))
+
+
+def answer_tokens(prompt: str, parameters: dict) -> list:
+    words = ANSWER.split()[:int(parameters.get('max_new_tokens', 1024))]
+    tokens = [word + ' ' for word in words]
+    if parameters.get('return_full_text'):
+        tokens.insert(0, prompt)
+    return tokens
+
+
+async def stream_tokens(tokens: list):
+    for index, text in enumerate(tokens, 1):
+        await asyncio.sleep(TOKEN_DELAY)
+        event = {
+            'index': index,
+            'token': {'id': index, 'text': text, 'logprob': 0.0, 'special': False},
+            'generated_text': ''.join(tokens) if index == len(tokens) else None,
+            'details': None
+        }
+        yield f"data:{json.dumps(event)}\n\n"
+
+
+async def generate(request: Request) -> Response:
+    if random.random() < FAILURE_RATE:
+        return JSONResponse({'error': 'Model is overloaded'}, status_code=503, headers={'Retry-After': '1'})
+    body = await request.json()
+    inputs = body.get('inputs')
+    parameters = body.get('parameters') or {}
+
+    if isinstance(inputs, list):
+        answers = [answer_tokens(prompt, parameters) for prompt in inputs]
+        await asyncio.sleep(TOKEN_DELAY * max((len(tokens) for tokens in answers), default=0))
+        return JSONResponse([{'generated_text': ''.join(tokens)} for tokens in answers])
+    if not isinstance(inputs, str):
+        return JSONResponse({'error': 'inputs must be a string or a list of strings'}, status_code=422)
+
+    tokens = answer_tokens(inputs, parameters)
+    if body.get('stream'):
+        return StreamingResponse(stream_tokens(tokens), media_type='text/event-stream')
+    await asyncio.sleep(TOKEN_DELAY * len(tokens))
+    return JSONResponse([{'generated_text': ''.join(tokens)}])
+
+
+app = Starlette(routes=[Route('/{path:path}', generate, methods=['POST'])])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
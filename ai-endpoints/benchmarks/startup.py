@@ -0,0 +1,106 @@
+"""
+Cold-start benchmark for the ai-endpoints service.
+
+Each run starts a fresh interpreter and times importing app, the first and second
+analysis request, warming the analysis workers and building the Q&A client. Reports
+the median, min and max of every stage across runs, and which heavy modules were
+already loaded right after the import.
+
+    python benchmarks/startup.py --runs 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ('huggingface_hub', 'httpx', 'tree_sitter', 'tree_sitter_cpp', 'fastapi')
+
+# Runs in the child interpreter; prints one JSON object of stage timings
+PROBE = '''
+import asyncio, json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+SAMPLE = "int main() { int n; for (int i = 0; i < n; i++) { for (int j = 0; j < n; j++) {} } return 0; }"
+
+async def stages():
+    timings = {}
+    start = time.perf_counter()
+    if WARM:
+        await app.analysis_workers.warm_up()
+    timings['warm_up_analysis'] = time.perf_counter() - start
+    start = time.perf_counter()
+    await app.analysis_workers.submit('return_analysis', SAMPLE)
+    timings['first_analysis'] = time.perf_counter() - start
+    start = time.perf_counter()
+    await app.analysis_workers.submit('return_analysis', SAMPLE + ' ')
+    timings['second_analysis'] = time.perf_counter() - start
+    start = time.perf_counter()
+    app.warm_up_inference()
+    timings['qna_client'] = time.perf_counter() - start
+    app.analysis_workers.shutdown()
+    return timings
+
+timings = {'import_app': imported - started, **asyncio.run(stages())}
+print(json.dumps({'timings': timings, 'loaded_at_import': loaded}))
+'''
+
+
+def run_once(warm: bool) -> dict:
+    probe = f"HEAVY_MODULES = {HEAVY_MODULES!r}\nWARM = {warm!r}\n" + PROBE
+    env = dict(os.environ)
+    # The Q&A client is only built, never called; a local URL means no API key is needed
+    env.setdefault('HF_INFERENCE_URL', 'http://127.0.0.1:9/generate')
+    output = subprocess.run(
+        [sys.executable, '-c', probe], cwd=SERVICE_DIR, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(runs: list) -> dict:
+    stages = runs[0]['timings'].keys()
+    return {
+        stage: {
+            'median_ms': statistics.median(run['timings'][stage] for run in runs) * 1000,
+            'min_ms': min(run['timings'][stage] for run in runs) * 1000,
+            'max_ms': max(run['timings'][stage] for run in runs) * 1000
+        }
+        for stage in stages
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters to start (default 5)')
+    parser.add_argument('--warm', action='store_true', help='run the analysis warm-up hook before the first request')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    runs = [run_once(args.warm) for _ in range(args.runs)]
+    result = {
+        'runs': args.runs,
+        'warm': args.warm,
+        'python': sys.version.split()[0],
+        'stages': summarize(runs),
+        'loaded_at_import': runs[0]['loaded_at_import']
+    }
+
+    for stage, timing in result['stages'].items():
+        print(f"{stage:<18} median {timing['median_ms']:8.1f} ms   "
+              f"min {timing['min_ms']:8.1f} ms   max {timing['max_ms']:8.1f} ms")
+    print(f"loaded at import: {', '.join(result['loaded_at_import']) or 'none'}")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(result, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
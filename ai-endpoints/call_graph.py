@@ -0,0 +1,380 @@
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+# Scopes whose name becomes part of a function's qualified name
+SCOPE_TYPES = ('namespace_definition', 'class_specifier', 'struct_specifier', 'union_specifier')
+
+# Declarator wrappers between a function_definition and its function_declarator
+DECLARATOR_WRAPPERS = ('pointer_declarator', 'reference_declarator', 'attributed_declarator', 'parenthesized_declarator')
+
+PARAMETER_TYPES = ('parameter_declaration', 'optional_parameter_declaration', 'variadic_parameter_declaration')
+
+TEMPLATE_ARGUMENTS = re.compile(r'<[^<>]*>')
+
+
+def _strip_template_arguments(text: str) -> str:
+    previous = None
+    while previous != text:
+        previous, text = text, TEMPLATE_ARGUMENTS.sub('', text)
+    return text
+
+
+def function_declarator(function_node):
+    """The function_declarator of a function_definition, looking through pointer/reference wrappers"""
+    declarator = function_node.child_by_field_name('declarator')
+    while declarator is not None and declarator.type in DECLARATOR_WRAPPERS:
+        declarator = declarator.child_by_field_name('declarator') or next(
+            (child for child in declarator.named_children if 'declarator' in child.type), None)
+    return declarator if declarator is not None and declarator.type == 'function_declarator' else None
+
+
+def declared_name(function_node) -> Tuple[Optional[str], Tuple[str, ...]]:
+    """
+    Simple name and explicit qualifier of a function definition: `int f()` gives ('f', ()),
+    `void Shape::area()` gives ('area', ('Shape',)), destructors and operators keep their
+    spelling (`~Shape`, `operator==`).
+    """
+    declarator = function_declarator(function_node)
+    if declarator is None:
+        return None, ()
+    name_node = declarator.child_by_field_name('declarator')
+    if name_node is None:
+        return None, ()
+    text = _strip_template_arguments(name_node.text.decode('utf8')).replace(' ', '')
+    parts = tuple(part for part in text.split('::') if part)
+    if not parts:
+        return None, ()
+    return parts[-1], parts[:-1]
+
+
+def enclosing_scope(function_node) -> Tuple[str, ...]:
+    """Names of the namespaces and classes a definition sits in, outermost first"""
+    scope = []
+    node = function_node.parent
+    while node is not None:
+        if node.type in SCOPE_TYPES and node.child_by_field_name('body') is not None:
+            name_node = node.child_by_field_name('name')
+            if name_node is not None:
+                scope.append(name_node.text.decode('utf8'))
+        node = node.parent
+    return tuple(reversed(scope))
+
+
+def display_names(functions: List[Tuple[str, Any]]) -> List[str]:
+    """
+    Names to report (qualified name, function_definition node) pairs under: the qualified
+    name, with the parameter list appended where a name is overloaded and #2, #3, ...
+    where the same signature is defined again
+    """
+    counts: Dict[str, int] = {}
+    for name, _ in functions:
+        counts[name] = counts.get(name, 0) + 1
+    names = []
+    seen: Dict[str, int] = {}
+    for name, node in functions:
+        if counts[name] > 1:
+            declarator = function_declarator(node)
+            parameters = declarator.child_by_field_name('parameters') if declarator is not None else None
+            name += ' '.join(parameters.text.decode('utf8').split()) if parameters is not None else '()'
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else f"{name} #{seen[name]}")
+    return names
+
+
+def parameter_range(function_node) -> Tuple[int, Optional[int]]:
+    """Fewest and most arguments a definition accepts; None means variadic"""
+    declarator = function_declarator(function_node)
+    parameters = declarator.child_by_field_name('parameters') if declarator is not None else None
+    if parameters is None:
+        return 0, 0
+    required = 0
+    total = 0
+    for parameter in parameters.named_children:
+        if parameter.type == 'variadic_parameter_declaration':
+            return required, None
+        if parameter.type not in PARAMETER_TYPES:
+            continue
+        if parameter.type == 'parameter_declaration' and parameter.text.strip() == b'void':
+            continue
+        total += 1
+        if parameter.type != 'optional_parameter_declaration':
+            required += 1
+    if b'...' in parameters.text:
+        return required, None
+    return required, total
+
+
+def call_target(call_node) -> Optional[Tuple[str, Tuple[str, ...], Optional[str], int]]:
+    """
+    What a call_expression calls: (name, qualifier, receiver, argument count). `obj.f(x)` and
+    `p->f(x)` have a receiver (`obj`, `p`, `this`), `ns::f(x)` a qualifier, `f<int>(x)` neither.
+    """
+    function_node = call_node.child_by_field_name('function')
+    if function_node is None:
+        return None
+    arguments = call_node.child_by_field_name('arguments')
+    arity = sum(1 for child in arguments.named_children if child.type != 'comment') if arguments else 0
+
+    receiver = None
+    if function_node.type == 'field_expression':
+        field = function_node.child_by_field_name('field')
+        argument = function_node.child_by_field_name('argument')
+        if field is None:
+            return None
+        receiver = argument.text.decode('utf8') if argument is not None else None
+        text = field.text.decode('utf8')
+    elif function_node.type == 'template_function':
+        name_node = function_node.child_by_field_name('name')
+        text = name_node.text.decode('utf8') if name_node is not None else function_node.text.decode('utf8')
+    else:
+        text = function_node.text.decode('utf8')
+
+    text = _strip_template_arguments(text).replace(' ', '')
+    parts = tuple(part for part in text.split('::') if part)
+    if not parts or not re.match(r'~?[A-Za-z_]\w*$|operator', parts[-1]):
+        return None
+    return parts[-1], parts[:-1], receiver, arity
+
+
+class FunctionEntry:
+    """One function definition; overloads get one entry each"""
+    __slots__ = ['index', 'name', 'scope', 'node', 'min_arity', 'max_arity']
+
+    def __init__(self, index: int, name: str, scope: Tuple[str, ...], node, min_arity: int, max_arity: Optional[int]):
+        self.index = index
+        self.name = name
+        self.scope = scope
+        self.node = node
+        self.min_arity = min_arity
+        self.max_arity = max_arity
+
+    @property
+    def qualified_name(self) -> str:
+        return '::'.join((*self.scope, self.name))
+
+    def accepts(self, arity: int) -> bool:
+        return self.min_arity <= arity and (self.max_arity is None or arity <= self.max_arity)
+
+
+class CallGraphIndex:
+    """
+    Every function definition in a tree and the calls between them, built in one walk.
+
+    Functions are indexed by simple name and carry their enclosing namespace/class scope, so
+    methods, out-of-class definitions and overloads are told apart. Calls are resolved by
+    name, narrowed by qualifier, receiver and argument count; calls that stay ambiguous get
+    an edge to every remaining candidate. Strongly connected components of the graph give
+    recursion, direct or mutual, for all functions at once in linear time.
+    """
+    __slots__ = ['functions', 'by_name', 'edges', 'call_sites', 'callees_by_call', 'components', 'component_of', 'recursive']
+
+    def __init__(self):
+        self.functions: List[FunctionEntry] = []
+        self.by_name: Dict[str, List[int]] = {}
+        self.edges: Dict[int, Dict[int, int]] = {}
+        self.call_sites: List[Tuple[Any, Optional[int], List[int]]] = []
+        self.callees_by_call: Dict[int, List[int]] = {}
+        self.components: List[List[int]] = []
+        self.component_of: Dict[int, int] = {}
+        self.recursive: Set[int] = set()
+
+    @classmethod
+    def build(cls, code_parser, root) -> "CallGraphIndex":
+        index = cls()
+        handlers, exit_handlers, finish = index.collector()
+        code_parser.walk(root, handlers, {}, exit_handlers)
+        finish()
+        return index
+
+    @classmethod
+    def from_functions(cls, functions: List[Tuple[str, Tuple[str, ...], int, Optional[int]]],
+                       calls: Dict[int, Iterable[Tuple[str, Tuple[str, ...], Optional[str], int]]]) -> "CallGraphIndex":
+        """
+        An index over functions collected without a common tree, such as the files of a
+        project: functions are (name, scope, min arity, max arity) and calls maps a
+        function's position in that list to the call targets it makes. Entries have no
+        node, and there are no call sites.
+        """
+        index = cls()
+        for name, scope, min_arity, max_arity in functions:
+            entry = FunctionEntry(len(index.functions), name, scope, None, min_arity, max_arity)
+            index.functions.append(entry)
+            index.by_name.setdefault(name, []).append(entry.index)
+        for caller, targets in calls.items():
+            for target in targets:
+                index._link(caller, target)
+        index._find_components()
+        return index
+
+    def collector(self) -> Tuple[Dict[str, list], Dict[str, list], Callable[[], None]]:
+        """
+        Walk handlers that fill this index, for merging into another analysis' walk, and
+        the function to call once that walk is done
+        """
+        scopes: List[str] = []
+        function_stack: List[Optional[int]] = []
+        pending_calls: List[Tuple[Any, Optional[int], Tuple[str, Tuple[str, ...], Optional[str], int]]] = []
+
+        def scope_enter(node, context):
+            name_node = node.child_by_field_name('name')
+            scopes.append(name_node.text.decode('utf8') if name_node is not None and node.child_by_field_name('body') else '')
+
+        def scope_exit(node, context):
+            scopes.pop()
+
+        def function_enter(node, context):
+            name, qualifier = declared_name(node)
+            if name is None:
+                function_stack.append(None)
+                return
+            scope = tuple(part for part in scopes if part) + qualifier
+            min_arity, max_arity = parameter_range(node)
+            entry = FunctionEntry(len(self.functions), name, scope, node, min_arity, max_arity)
+            self.functions.append(entry)
+            self.by_name.setdefault(name, []).append(entry.index)
+            function_stack.append(entry.index)
+
+        def function_exit(node, context):
+            function_stack.pop()
+
+        def call_handler(node, context):
+            target = call_target(node)
+            if target is not None:
+                caller = next((entry for entry in reversed(function_stack) if entry is not None), None)
+                pending_calls.append((node, caller, target))
+
+        def finish():
+            # Calls can refer to functions defined further down, so resolve after the walk
+            for node, caller, target in pending_calls:
+                callees = self._link(caller, target)
+                self.call_sites.append((node, caller, callees))
+                self.callees_by_call[node.id] = callees
+            self._find_components()
+
+        handlers = {'function_definition': [function_enter], 'call_expression': [call_handler]}
+        exit_handlers = {'function_definition': [function_exit]}
+        for scope_type in SCOPE_TYPES:
+            handlers[scope_type] = [scope_enter]
+            exit_handlers[scope_type] = [scope_exit]
+        return handlers, exit_handlers, finish
+
+    def resolve(self, target: Tuple[str, Tuple[str, ...], Optional[str], int], caller: Optional[int] = None) -> List[int]:
+        """Indices of the definitions a call target may refer to; empty for library and unknown functions"""
+        name, qualifier, receiver, arity = target
+        candidates = [self.functions[i] for i in self.by_name.get(name, ())]
+        if not candidates:
+            return []
+
+        if qualifier:
+            candidates = [entry for entry in candidates if entry.scope[-len(qualifier):] == qualifier]
+        caller_scope = self.functions[caller].scope if caller is not None else ()
+        if receiver is not None:
+            # Member calls only reach functions with an enclosing scope; `this` means the caller's class
+            members = [entry for entry in candidates if entry.scope]
+            if receiver == 'this':
+                members = [entry for entry in members if entry.scope == caller_scope] or members
+            candidates = members
+        elif not qualifier and len(candidates) > 1:
+            # Unqualified calls find the innermost scope first
+            for depth in range(len(caller_scope), -1, -1):
+                scoped = [entry for entry in candidates if entry.scope == caller_scope[:depth]]
+                if scoped:
+                    candidates = scoped
+                    break
+
+        if len(candidates) > 1:
+            candidates = [entry for entry in candidates if entry.accepts(arity)] or candidates
+        return [entry.index for entry in candidates]
+
+    def _link(self, caller: Optional[int], target: Tuple[str, Tuple[str, ...], Optional[str], int]) -> List[int]:
+        """Resolve one call and add its edges; returns the callees"""
+        callees = self.resolve(target, caller)
+        if caller is not None:
+            edges = self.edges.setdefault(caller, {})
+            for callee in callees:
+                edges[callee] = edges.get(callee, 0) + 1
+        return callees
+
+    def _find_components(self):
+        """Iterative Tarjan; components come out callees-first (reverse topological order)"""
+        indices: Dict[int, int] = {}
+        lowlinks: Dict[int, int] = {}
+        on_stack: Set[int] = set()
+        stack: List[int] = []
+        counter = 0
+
+        for start in range(len(self.functions)):
+            if start in indices:
+                continue
+            work = [(start, iter(self.edges.get(start, ())))]
+            indices[start] = lowlinks[start] = counter
+            counter += 1
+            stack.append(start)
+            on_stack.add(start)
+            while work:
+                node, successors = work[-1]
+                advanced = False
+                for successor in successors:
+                    if successor not in indices:
+                        indices[successor] = lowlinks[successor] = counter
+                        counter += 1
+                        stack.append(successor)
+                        on_stack.add(successor)
+                        work.append((successor, iter(self.edges.get(successor, ()))))
+                        advanced = True
+                        break
+                    if successor in on_stack:
+                        lowlinks[node] = min(lowlinks[node], indices[successor])
+                if advanced:
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlinks[parent] = min(lowlinks[parent], lowlinks[node])
+                if lowlinks[node] == indices[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    component_index = len(self.components)
+                    self.components.append(component)
+                    for member in component:
+                        self.component_of[member] = component_index
+                    if len(component) > 1 or node in self.edges.get(node, ()):
+                        self.recursive.update(component)
+
+    def definitions(self) -> Dict[str, Any]:
+        """Simple name -> definition node; with overloads the last definition wins"""
+        return {entry.name: entry.node for entry in self.functions}
+
+    def recursive_names(self) -> Set[str]:
+        return {self.functions[i].name for i in self.recursive}
+
+    def recursive_call_count(self, name: str) -> int:
+        """Most call sites in any definition of name that call back into its own recursion cycle"""
+        best = 0
+        for i in self.by_name.get(name, ()):
+            if i in self.recursive:
+                component = self.component_of[i]
+                best = max(best, sum(count for callee, count in self.edges.get(i, {}).items()
+                                     if self.component_of[callee] == component))
+        return best
+
+    def calls_recursive(self, call_node) -> bool:
+        """Whether a call site may reach a recursive function"""
+        return any(callee in self.recursive for callee in self.callees_by_call.get(call_node.id, ()))
+
+    def recursion_group(self, function_index: int) -> List[str]:
+        """Qualified names of the functions that recurse together with this one (empty if it does not recurse)"""
+        if function_index not in self.recursive:
+            return []
+        component = self.components[self.component_of[function_index]]
+        return sorted(self.functions[i].qualified_name for i in component)
+
+    def display_names(self) -> Dict[int, str]:
+        """Report names by function index (see display_names)"""
+        names = display_names([(entry.qualified_name, entry.node) for entry in self.functions])
+        return {entry.index: name for entry, name in zip(self.functions, names)}
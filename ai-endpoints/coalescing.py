@@ -0,0 +1,215 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from inference_client import AsyncTextGenerationClient, InferenceError
+
+
+class SharedStream:
+    """One upstream token stream, buffered so subscribers that join late replay it from the start"""
+    __slots__ = ['tokens', 'done', 'error', 'changed', 'subscribers', 'task']
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Condition()
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight requests: the first caller for a key starts the upstream
+    work, later callers for the same key attach to it instead of starting their own.
+
+    The upstream work runs in its own task and is cancelled once every caller has gone
+    away, so a disconnected client does not cut off the others. Nothing is kept once the
+    work finishes; repeats after that are the answer cache's job.
+    """
+    __slots__ = ['streams', 'calls', 'started', 'coalesced']
+
+    def __init__(self):
+        self.streams: Dict[str, SharedStream] = {}
+        self.calls: Dict[str, Tuple[asyncio.Task, List[int]]] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def stream(self, key: str, source: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        shared = self.streams.get(key)
+        if shared is None:
+            shared = SharedStream()
+            self.streams[key] = shared
+            shared.task = asyncio.create_task(self._pump(key, shared, source()))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        shared.subscribers += 1
+        try:
+            position = 0
+            while True:
+                async with shared.changed:
+                    await shared.changed.wait_for(lambda: position < len(shared.tokens) or shared.done)
+                if position < len(shared.tokens):
+                    tokens = shared.tokens[position:]
+                    position += len(tokens)
+                    for token in tokens:
+                        yield token
+                elif shared.error is not None:
+                    raise shared.error
+                else:
+                    return
+        finally:
+            shared.subscribers -= 1
+            if not shared.subscribers and not shared.done:
+                shared.task.cancel()
+
+    async def _pump(self, key: str, shared: SharedStream, tokens: AsyncIterator[str]):
+        try:
+            async for token in tokens:
+                async with shared.changed:
+                    shared.tokens.append(token)
+                    shared.changed.notify_all()
+        except asyncio.CancelledError:
+            shared.error = InferenceError("Generation cancelled")
+        except Exception as error:
+            shared.error = error
+        finally:
+            if self.streams.get(key) is shared:
+                del self.streams[key]
+            async with shared.changed:
+                shared.done = True
+                shared.changed.notify_all()
+            await tokens.aclose()
+
+    async def call(self, key: str, work: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self.calls.get(key)
+        if entry is None:
+            task = asyncio.create_task(work())
+            entry = (task, [0])
+            self.calls[key] = entry
+
+            def forget(_):
+                if self.calls.get(key) is entry:
+                    del self.calls[key]
+
+            task.add_done_callback(forget)
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        task, waiters = entry
+        waiters[0] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            waiters[0] -= 1
+            if not waiters[0] and not task.done():
+                task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'in_flight': len(self.streams) + len(self.calls),
+            'started': self.started,
+            'coalesced': self.coalesced
+        }
+
+
+class MicroBatcher:
+    """
+    Groups concurrent non-streaming generations into batched upstream requests.
+
+    The first queued prompt opens a window of max_wait seconds; everything queued before it
+    closes (up to max_batch_size prompts) goes out together, one request per distinct set of
+    generation parameters. Needs a backend that accepts a list of inputs.
+    """
+    __slots__ = ['client', 'max_batch_size', 'max_wait', 'queue', 'worker', 'sending', 'batches', 'prompts',
+                 'total_wait', 'max_wait_seen', 'max_queue_depth']
+
+    def __init__(self, client: AsyncTextGenerationClient, max_batch_size: int = 8, max_wait: float = 0.02):
+        self.client = client
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.sending = set()
+        self.batches = 0
+        self.prompts = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+        self.max_queue_depth = 0
+
+    async def generate(self, prompt: str, **parameters) -> str:
+        loop = asyncio.get_running_loop()
+        if self.worker is None or self.worker.done():
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.create_task(self._run())
+        future = loop.create_future()
+        self.queue.put_nowait((prompt, parameters, future, loop.time()))
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            closes_at = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = closes_at - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except TimeoutError:
+                    break
+
+            groups: Dict[str, List[Tuple[str, Dict[str, Any], asyncio.Future, float]]] = {}
+            for item in batch:
+                groups.setdefault(json.dumps(item[1], sort_keys=True), []).append(item)
+            for group in groups.values():
+                task = asyncio.create_task(self._send(group))
+                self.sending.add(task)
+                task.add_done_callback(self.sending.discard)
+
+    async def _send(self, group: List[Tuple[str, Dict[str, Any], asyncio.Future, float]]):
+        now = asyncio.get_running_loop().time()
+        group = [item for item in group if not item[2].done()]
+        if not group:
+            return
+        for _, _, _, queued_at in group:
+            waited = now - queued_at
+            self.total_wait += waited
+            self.max_wait_seen = max(self.max_wait_seen, waited)
+        self.batches += 1
+        self.prompts += len(group)
+
+        try:
+            texts = await self.client.generate_batch([item[0] for item in group], **group[0][1])
+        except Exception as error:
+            for _, _, future, _ in group:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, _, future, _), text in zip(group, texts):
+            if not future.done():
+                future.set_result(text)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'max_batch_size': self.max_batch_size,
+            'window_ms': self.max_wait * 1000,
+            'queue_depth': self.queue.qsize() if self.queue is not None else 0,
+            'max_queue_depth': self.max_queue_depth,
+            'batches': self.batches,
+            'prompts': self.prompts,
+            'mean_batch_size': self.prompts / self.batches if self.batches else 0.0,
+            'mean_wait_ms': self.total_wait / self.prompts * 1000 if self.prompts else 0.0,
+            'max_wait_ms': self.max_wait_seen * 1000
+        }
+
+    async def aclose(self):
+        if self.worker is not None:
+            self.worker.cancel()
+        for task in list(self.sending):
+            task.cancel()
@@ -1,19 +1,100 @@
-from tree_sitter import Language, Parser
+import threading
+import time
+from contextlib import contextmanager
+from tree_sitter import Language, Parser, Query
 import tree_sitter_cpp as cpython
-import sympy as sp
-from typing import Callable, List, Union, Dict, Any, Tuple
+from analysis_limits import AnalysisLimits, LimitExceeded, default_analysis_limits, warnings_result
+from call_graph import CallGraphIndex, call_target, declared_name
+from code_patterns import LOOP_TYPES, POINTER_SIZE, CodePatterns, compile_patterns, expression_complexity, type_size
+from complexity import Complexity
+from diagnostics import find_errors, serialize_error
+from metrics import span, timed
+from function_summaries import (FunctionSummary, SummaryMemo, bind_summaries, compose_summaries, default_summary_memo,
+                                function_key, recursion_time, stack_depth_pattern)
+from typing import Callable, Iterator, List, Union, Dict, Any, Tuple
 
-class CodeParser:
-    __slots__ = ['language', 'parser', 'n', 'errors', 'memory_units', 'function_definitions', 'recursive_functions']
+# Handler return values understood by CodeParser.walk
+SKIP_SUBTREE = object()
+STOP_WALK = object()
+
+def big_o(expr: Complexity) -> str:
+    return f"O({expr.dominant() if not expr.is_zero() else 1})"
 
-    def __init__(self):
+class ParserPool:
+    """
+    Shares one C++ Language and a set of idle tree-sitter Parsers (and compiled pattern
+    Queries) across threads. A Parser or Query is only ever used by the thread that
+    checked it out.
+    """
+    __slots__ = ['language', 'max_idle', 'idle_parsers', 'idle_queries', 'lock']
+
+    def __init__(self, max_idle: int = 8):
         self.language = Language(cpython.language())
-        self.parser = Parser(self.language)
-        self.n = sp.symbols('n')
+        self.max_idle = max_idle
+        self.idle_parsers: List[Parser] = []
+        self.idle_queries: List[Query] = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def parser(self) -> Iterator[Parser]:
+        with self.lock:
+            parser = self.idle_parsers.pop() if self.idle_parsers else None
+        if parser is None:
+            parser = Parser(self.language)
+        try:
+            yield parser
+        finally:
+            with self.lock:
+                if len(self.idle_parsers) < self.max_idle:
+                    self.idle_parsers.append(parser)
+
+    @contextmanager
+    def patterns_query(self) -> Iterator[Query]:
+        with self.lock:
+            query = self.idle_queries.pop() if self.idle_queries else None
+        if query is None:
+            query = compile_patterns(self.language)
+        try:
+            yield query
+        finally:
+            with self.lock:
+                if len(self.idle_queries) < self.max_idle:
+                    self.idle_queries.append(query)
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+def default_parser_pool() -> ParserPool:
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ParserPool()
+        return _default_pool
+
+class CodeParser:
+    """
+    Per-request analyzer. The Language and Parsers come from a shared ParserPool, so
+    instances are cheap; the analysis state below belongs to one request and must not
+    be shared between concurrent requests.
+    """
+    __slots__ = ['parser_pool', 'limits', 'deadline', 'language', 'n', 'errors', 'memory_units', 'function_definitions',
+                 'recursive_functions', 'call_graph_root', 'call_graph_index', 'patterns', 'warnings']
+
+    def __init__(self, parser_pool: ParserPool = None, limits: AnalysisLimits = None):
+        self.parser_pool = parser_pool or default_parser_pool()
+        self.limits = limits or default_analysis_limits()
+        self.deadline = None
+        self.language = self.parser_pool.language
+        self.n = Complexity.symbol('n')
         self.errors = []
         self.memory_units = []
         self.function_definitions = {}  
         self.recursive_functions = set()  
+        self.call_graph_root = None
+        self.call_graph_index = None
+        self.patterns = None
+        # Parts of the analysis approximated to stay within limits (see analysis_limits.limit_warning)
+        self.warnings = []
 
     def process_code_for_parsing(self, code: str) -> str:
         code = code.replace(";", ";\n")  
@@ -31,465 +112,486 @@ class CodeParser:
                 processed_lines.append('')
         return '\n'.join(processed_lines) 
 
-    def evaluate_code_syntax(self, code: str):
-        tree = self.parser.parse(bytes(code, 'utf8'))
+    @timed('parse')
+    def evaluate_code_syntax(self, code: Union[str, bytes], old_tree=None):
+        """
+        Parse code; pass the previous tree, already edited with Tree.edit, to reparse incrementally.
+        Enforces the source size, parse time and node count limits, and starts the analysis deadline.
+        """
+        source = code if isinstance(code, bytes) else bytes(code, 'utf8')
+        self.limits.check_source(source)
+        with self.parser_pool.parser() as parser:
+            parser.timeout_micros = int(self.limits.parse_timeout * 1_000_000)
+            try:
+                tree = parser.parse(source, old_tree) if old_tree is not None else parser.parse(source)
+            except ValueError:
+                # Timed out; a pooled parser would otherwise resume this parse on its next use
+                parser.reset()
+                raise LimitExceeded('parse_time', f"Parsing took longer than {self.limits.parse_timeout}s") from None
+        self.limits.check_tree(tree)
+        self.deadline = self.limits.deadline()
         return tree
     
     def print_tree(self, tree):
-        def print_node(node, depth=0):
-            print('  ' * depth + f'- {node.type}', end='')
-            if len(node.children) == 0:
+        def print_node(node, context):
+            print('  ' * context['depth'] + f'- {node.type}', end='')
+            if node.child_count == 0:
                 text = node.text.decode('utf8')
                 print(f': "{text}"')
             else:
                 print()
-            for child in node.children:
-                print_node(child, depth + 1)
+            context['depth'] += 1
+        
+        def leave_node(node, context):
+            context['depth'] -= 1
     
         print("\nDetailed tree structure:")
-        print_node(tree.root_node)
+        self.walk(tree.root_node, {'*': [print_node]}, {'depth': 0}, {'*': [leave_node]})
 
-    def traverse(self, node, node_handlers: List[Callable], context: dict = None):
+    def walk(self, node, handlers: Dict[str, List[Callable]], context: dict = None,
+             exit_handlers: Dict[str, List[Callable]] = None) -> dict:
+        """
+        Iterative, cursor-based pre-order walk with handlers dispatched by node type.
+        
+        Args:
+            node: Root of the subtree to walk
+            handlers: Node type -> handlers called on entering a node of that type; '*' matches every node
+            context: Shared state passed to every handler
+            exit_handlers: Same as handlers, called after a node's subtree has been walked
+        
+        A handler may return SKIP_SUBTREE to skip the node's children, or STOP_WALK to end the walk.
+        Raises LimitExceeded past the nesting limit or the analysis deadline.
+        """
         if context is None:
             context = {}
+        exit_handlers = exit_handlers or {}
+        any_enter = handlers.get('*', [])
+        any_exit = exit_handlers.get('*', [])
+        # '*' is also a node type (the operator); it must not get the wildcard handlers twice
+        if any_enter:
+            handlers = {node_type: typed for node_type, typed in handlers.items() if node_type != '*'}
+        if any_exit:
+            exit_handlers = {node_type: typed for node_type, typed in exit_handlers.items() if node_type != '*'}
+        max_depth = self.limits.max_depth
+        deadline = self.deadline
+        
+        cursor = node.walk()
+        depth = 0
+        visited = 0
+        entering = True
+        while True:
+            current = cursor.node
+            node_type = current.type
             
-        for handler in node_handlers:
-            handler(node, context)
+            if entering:
+                visited += 1
+                if max_depth and depth > max_depth:
+                    raise self.limits.depth_exceeded()
+                # Reading the clock on every node would cost more than the check is worth
+                if deadline is not None and not visited & 1023 and time.monotonic() > deadline:
+                    raise self.limits.time_exceeded()
+                skip = False
+                for handler in (*any_enter, *handlers.get(node_type, ())):
+                    signal = handler(current, context)
+                    if signal is STOP_WALK:
+                        return context
+                    if signal is SKIP_SUBTREE:
+                        skip = True
+                if not skip and cursor.goto_first_child():
+                    depth += 1
+                    continue
             
-        for child in node.children:
-            self.traverse(child, node_handlers, context)
+            for handler in (*exit_handlers.get(node_type, ()), *any_exit):
+                handler(current, context)
             
-        return context
+            if depth == 0:
+                return context
+            if cursor.goto_next_sibling():
+                entering = True
+            else:
+                cursor.goto_parent()
+                depth -= 1
+                entering = False
 
-    def find_error_nodes(self, node):
-        self.errors = []
-        
-        def error_handler(node, context):
-            if node.type == "ERROR":
-                context.setdefault('errors', []).append(node)
-                
-        context = self.traverse(node, [error_handler], {'errors': []})
-        return context.get('errors', [])
+    def traverse(self, node, node_handlers: List[Callable], context: dict = None):
+        """Call every handler on every node; prefer walk, which only dispatches the types a handler needs"""
+        return self.walk(node, {'*': node_handlers}, context)
+
+    def find_error_nodes(self, node, limit: int = None):
+        """ERROR and MISSING nodes, the first `limit` (by default limits.max_diagnostics) of them"""
+        self.errors, _ = find_errors(self, node, self.limits.max_diagnostics if limit is None else limit)
+        return self.errors
     
-    def analyze_time_complexity(self, node) -> sp.Expr:
+    @timed('analyze')
+    def analyze(self, node) -> Dict[str, Any]:
+        """
+        Fused analysis mode: one walk over the tree, every result derived from the collected facts.
+        
+        Returns:
+            Dictionary with the syntax errors, time complexity, memory usage and recursive stack info
+        """
+        facts = self.collect_facts(node)
+        index = facts['call_graph']
+        
+        self.find_error_nodes(node)
+        self.function_definitions = index.definitions()
+        self.recursive_functions = index.recursive_names()
+        
+        complexity_context = facts['complexity']
+        for call_node, function_name in facts['call_sites']:
+            if index.calls_recursive(call_node):
+                self._record_recursive_call(call_node, function_name, complexity_context)
+        time_complexity = self._combine_time_complexity(complexity_context)
+        
+        recursive_stack_info = {}
+        depth_patterns = {}
+        for func_name in self.recursive_functions:
+            self_calls = index.recursive_call_count(func_name)
+            recursive_stack_info[func_name] = {
+                'max_depth': 1 + self_calls,
+                'frame_size': facts['frame_sizes'].get(func_name, 0)
+            }
+            depth_patterns[func_name] = self._stack_depth_pattern(self_calls, func_name in facts['has_division'])
+        memory_usage = self._combine_memory_usage(facts['memory_exprs'], recursive_stack_info, depth_patterns)
+        
+        return {
+            'errors': self.errors,
+            'time_complexity': time_complexity,
+            'memory_usage': memory_usage,
+            'stack_info': recursive_stack_info
+        }
+
+    @timed('collect_facts')
+    def collect_facts(self, node) -> Dict[str, Any]:
+        """Walk the tree once and collect everything the analyzers need"""
+        facts = {
+            'call_graph': CallGraphIndex(),
+            'call_sites': [],
+            'has_division': set(),
+            'frame_sizes': {},
+            'memory_exprs': [],
+            'complexity': self._new_complexity_context()
+        }
+        complexity_context = facts['complexity']
+        function_stack = []
+        patterns = self.code_patterns(node)
+        
+        def function_enter(node, context):
+            function_stack.append(self._function_name(node))
+        
+        def function_exit(node, context):
+            function_stack.pop()
+        
+        def call_handler(node, context):
+            function_node = node.child_by_field_name('function')
+            if function_node:
+                facts['call_sites'].append((node, function_node.text.decode('utf8')))
+        
+        def division_handler(node, context):
+            current_function = function_stack[-1] if function_stack else None
+            if current_function and patterns.is_division(node):
+                facts['has_division'].add(current_function)
+        
+        def declaration_handler(node, context):
+            memory_exprs, frame_size = self._declaration_memory(node)
+            facts['memory_exprs'].extend(memory_exprs)
+            current_function = function_stack[-1] if function_stack else None
+            if current_function:
+                facts['frame_sizes'][current_function] = facts['frame_sizes'].get(current_function, 0) + frame_size
+        
+        handlers = {
+            'function_definition': [function_enter],
+            'call_expression': [call_handler],
+            'binary_expression': [division_handler],
+            'declaration': [declaration_handler]
+        }
+        exit_handlers = {'function_definition': [function_exit]}
+        for loop_type in LOOP_TYPES:
+            handlers[loop_type] = [self._enter_loop]
+            exit_handlers[loop_type] = [self._leave_loop]
+        
+        # The call graph is built in the same walk
+        index_handlers, index_exit_handlers, finish_index = facts['call_graph'].collector()
+        for node_type, node_handlers in index_handlers.items():
+            handlers.setdefault(node_type, []).extend(node_handlers)
+        for node_type, node_handlers in index_exit_handlers.items():
+            exit_handlers.setdefault(node_type, []).extend(node_handlers)
+        
+        self.walk(node, handlers, complexity_context, exit_handlers)
+        finish_index()
+        self.call_graph_root, self.call_graph_index = node, facts['call_graph']
+        
+        return facts
+
+    @timed('time_complexity')
+    def analyze_time_complexity(self, node) -> Complexity:
         self.identify_functions_and_recursion(node)
-        
-        def loop_handler(node, context: Dict[str, Any]):
-            if node.type in ('for_statement', 'while_statement', 'do_statement'):
-                context['current_depth'] += 1
-                context['max_loop_depth'] = max(context['max_loop_depth'], context['current_depth'])
-                
-                loop_range = _detect_loop_range(node)
-                if loop_range is not None:
-                    context['loop_ranges'].append(loop_range)
-                
-                if _detect_log_pattern(node):
-                    context['log_factors'] += 1
-                
-                if _detect_factorial_pattern(node) and context['current_depth'] > 1:
-                    context['factorial_detected'] = True
+        self.code_patterns(node)
         
         def recursive_call_handler(node, context):
-            if node.type == 'call_expression':
-                function_node = node.child_by_field_name('function')
-                if function_node:
-                    function_name = function_node.text.decode('utf8')
-                    if function_name in self.recursive_functions:
-                        context['recursive_calls'].append(function_name)
-                        
-                        if _detect_linear_recursion(node, function_name):
-                            context['linear_recursion'] = True
-                        elif _detect_binary_recursion(node, function_name):
-                            context['binary_recursion'] = True
-                        elif _detect_exponential_recursion(node, function_name):
-                            context['exponential_recursion'] = True
-                            
-        def _detect_linear_recursion(node, function_name):
-            parent = node.parent
-            if parent and parent.type == 'expression_statement':
-                prev_sibling = parent.prev_sibling
-                if prev_sibling and prev_sibling.type == 'if_statement':
-                    return True
-            return False
-            
-        def _detect_binary_recursion(node, function_name):
-            parent = node.parent
-            if parent:
-                siblings = [c for c in parent.parent.children if c.type == 'call_expression']
-                call_count = sum(1 for s in siblings if s.child_by_field_name('function') and 
-                                s.child_by_field_name('function').text.decode('utf8') == function_name)
-                return call_count >= 2
-            return False
-            
-        def _detect_exponential_recursion(node, function_name):
-            parent = node.parent
-            if parent:
-                siblings = [c for c in parent.parent.children if c.type == 'call_expression']
-                call_count = sum(1 for s in siblings if s.child_by_field_name('function') and 
-                                s.child_by_field_name('function').text.decode('utf8') == function_name)
-                return call_count > 2
-            return False
-                            
-        def loop_exit_handler(node, context):
-            if node.type in ('for_statement', 'while_statement', 'do_statement'):
-                context['current_depth'] -= 1
-        
-        def _detect_loop_range(loop_node) -> Union[sp.Expr, None]:
-            if loop_node.type == 'for_statement':
-                init_expr = next((c for c in loop_node.children if c.type == 'declaration'), None)
-                cond_expr = next((c for c in loop_node.children if c.type == 'binary_expression'), None)
-                
-                if init_expr and cond_expr:
-                    init_text = init_expr.text.decode('utf8')
-                    cond_text = cond_expr.text.decode('utf8')
-                    
-                    if '=0' in init_text and '<' in cond_text:
-                        bound_var = cond_text.split('<')[1].strip()
-                        try:
-                            bound = int(bound_var)
-                            return sp.Integer(bound)
-                        except ValueError:
-                            return sp.symbols(bound_var)
-            
-            return None
+            function_node = node.child_by_field_name('function')
+            if function_node and self.call_graph_index.calls_recursive(node):
+                self._record_recursive_call(node, function_node.text.decode('utf8'), context)
         
-        def _detect_log_pattern(loop_node) -> bool:
-            if loop_node.type == 'for_statement' and len(loop_node.children) >= 7:
-                update_expr = loop_node.children[6] 
-                text = update_expr.text.decode('utf8')
-                return any(op in text for op in ('*=', '/=', '*2', '/2', '>>'))
-            
-            if loop_node.type == 'while_statement':
-                condition = next((c for c in loop_node.children if c.type == 'parenthesized_expression'), None)
-                if condition:
-                    cond_text = condition.text.decode('utf8')
-                    return any(op in cond_text for op in ('>', '<', '>=', '<=', '/=', '*='))
-            return False
-
-        def _detect_factorial_pattern(loop_node) -> bool:
-            if loop_node.type == 'for_statement':
-                init = next((c for c in loop_node.children if c.type == 'declaration'), None)
-                cond = next((c for c in loop_node.children if c.type == 'binary_expression'), None)
-                update = next((c for c in loop_node.children if c.type == 'update_expression'), None)
-                
-                if init and cond and update:
-                    init_text = init.text.decode('utf8')
-                    cond_text = cond.text.decode('utf8')
-                    update_text = update.text.decode('utf8')
-                    
-                    if ('=n' in init_text or '>0' in cond_text) and '--' in update_text:
-                        return True
-            return False
-        
-        complexity_context = {
-            'max_loop_depth': 0,
-            'current_depth': 0,
-            'log_factors': 0,
+        complexity_context = self._new_complexity_context()
+        
+        handlers = {loop_type: [self._enter_loop] for loop_type in LOOP_TYPES}
+        handlers['call_expression'] = [recursive_call_handler]
+        exit_handlers = {loop_type: [self._leave_loop] for loop_type in LOOP_TYPES}
+        self.walk(node, handlers, complexity_context, exit_handlers)
+        
+        return self._combine_time_complexity(complexity_context)
+
+    def _new_complexity_context(self) -> Dict[str, Any]:
+        return {
+            # Iterations of the innermost loop body per run, one entry per enclosing loop
+            'loop_stack': [],
+            # The same for every loop seen
+            'loop_costs': [],
             'factorial_detected': False,
-            'loop_ranges': [],
             'recursive_calls': [],
             'linear_recursion': False,
             'binary_recursion': False,
             'exponential_recursion': False
         }
+
+    def code_patterns(self, node) -> CodePatterns:
+        """Loop and division patterns under node; matched once, and reused for any node inside it"""
+        if self.patterns is None or not self.patterns.covers(node):
+            with span('patterns'), self.parser_pool.patterns_query() as query:
+                self.patterns = CodePatterns.match(query, node, self.limits, self.warnings)
+        return self.patterns
+
+    def _enter_loop(self, node, context: Dict[str, Any]):
+        """
+        Walk handler for loops: a loop runs its matched range, log n times if it steps
+        geometrically, otherwise n times, multiplied by the loops around it
+        """
+        if self.patterns.is_log_loop(node):
+            iterations = Complexity.log()
+        else:
+            iterations = self.patterns.loop_range(node)
+            if iterations is None:
+                iterations = self.n
+        
+        loop_stack = context['loop_stack']
+        # Nested countdown loops, as in permutation generators
+        if loop_stack and self.patterns.is_countdown_loop(node):
+            context['factorial_detected'] = True
+        
+        cost = loop_stack[-1] * iterations if loop_stack else iterations
+        loop_stack.append(cost)
+        context['loop_costs'].append(cost)
+
+    def _leave_loop(self, node, context: Dict[str, Any]):
+        context['loop_stack'].pop()
+
+    def _record_recursive_call(self, node, function_name: str, context: Dict[str, Any]):
+        context['recursive_calls'].append(function_name)
         
-        self.traverse(node, [loop_handler, recursive_call_handler], complexity_context)
-        self.traverse(node, [loop_exit_handler], complexity_context)
-        
+        shape = self._recursion_shape(node, function_name)
+        if shape is not None:
+            context[f'{shape}_recursion'] = True
+
+    def _recursion_shape(self, node, function_name: str) -> Union[str, None]:
+        """'linear', 'binary' or 'exponential' for a recursive call, None if it has none of these shapes"""
+        if self._detect_linear_recursion(node, function_name):
+            return 'linear'
+        if self._detect_binary_recursion(node, function_name):
+            return 'binary'
+        if self._detect_exponential_recursion(node, function_name):
+            return 'exponential'
+        return None
+
+    @timed('combine_time')
+    def _combine_time_complexity(self, complexity_context: Dict[str, Any]) -> Complexity:
         if complexity_context['factorial_detected']:
-            base_complexity = sp.factorial(self.n)
-        elif complexity_context['max_loop_depth'] > 0:
-            if complexity_context['loop_ranges']:
-                base_complexity = sp.Integer(1)
-                for loop_range in complexity_context['loop_ranges']:
-                    base_complexity *= loop_range
-            else:
-                base_complexity = self.n ** complexity_context['max_loop_depth']
+            base_complexity = Complexity.factorial()
+        elif complexity_context['loop_costs']:
+            base_complexity = sum(complexity_context['loop_costs'])
         else:
-            base_complexity = sp.Integer(1)
-            
-        if complexity_context['log_factors'] > 0:
-            base_complexity *= sp.log(self.n) ** complexity_context['log_factors']
+            base_complexity = Complexity.constant(1)
             
         if complexity_context['recursive_calls']:
-            if complexity_context['linear_recursion']:
-                recursive_complexity = self.n
-            elif complexity_context['binary_recursion']:
-                recursive_complexity = self.n * sp.log(self.n)
-            elif complexity_context['exponential_recursion']:
-                recursive_complexity = 2 ** self.n
-            else:
-                recursive_complexity = self.n
-                
-            return self._complexity_compare(base_complexity, recursive_complexity)
+            shapes = [shape for shape in ('linear', 'binary', 'exponential') if complexity_context[f'{shape}_recursion']]
+            return self._complexity_compare(base_complexity, recursion_time(shapes))
             
         return base_complexity
-    
+
+    def _detect_linear_recursion(self, node, function_name):
+        parent = node.parent
+        if parent and parent.type == 'expression_statement':
+            prev_sibling = parent.prev_sibling
+            if prev_sibling and prev_sibling.type == 'if_statement':
+                return True
+        return False
+        
+    def _detect_binary_recursion(self, node, function_name):
+        parent = node.parent
+        if parent:
+            siblings = [c for c in parent.parent.children if c.type == 'call_expression']
+            call_count = sum(1 for s in siblings if s.child_by_field_name('function') and 
+                            s.child_by_field_name('function').text.decode('utf8') == function_name)
+            return call_count >= 2
+        return False
+        
+    def _detect_exponential_recursion(self, node, function_name):
+        parent = node.parent
+        if parent:
+            siblings = [c for c in parent.parent.children if c.type == 'call_expression']
+            call_count = sum(1 for s in siblings if s.child_by_field_name('function') and 
+                            s.child_by_field_name('function').text.decode('utf8') == function_name)
+            return call_count > 2
+        return False
+
+    def call_graph(self, root_node) -> CallGraphIndex:
+        """Call graph of the tree; built once per root and shared by the time and memory analyzers"""
+        if self.call_graph_index is None or self.call_graph_root != root_node:
+            with span('call_graph'):
+                self.call_graph_index = CallGraphIndex.build(self, root_node)
+            self.call_graph_root = root_node
+        return self.call_graph_index
+
     def identify_functions_and_recursion(self, root_node):
-        self.function_definitions = {}
-        self.recursive_functions = set()
-        
-        def function_def_handler(node, context):
-            if node.type == 'function_definition':
-                declarator = node.child_by_field_name('declarator')
-                if declarator:
-                    name_node = next((c for c in declarator.children if c.type == 'identifier'), None)
-                    if name_node:
-                        function_name = name_node.text.decode('utf8')
-                        self.function_definitions[function_name] = node
-                        context['functions'].append(function_name)
-        
-        def recursive_call_checker(node, context):
-            if 'current_function' not in context or not context['current_function']:
-                return
-                
-            if node.type == 'call_expression':
-                function_node = node.child_by_field_name('function')
-                if function_node:
-                    called_function = function_node.text.decode('utf8')
-                    if called_function == context['current_function']:
-                        self.recursive_functions.add(called_function)
-                        context['recursive_functions'].add(called_function)
-        
-        functions_context = {'functions': []}
-        self.traverse(root_node, [function_def_handler], functions_context)
-        
-        recursion_context = {
-            'current_function': None,
-            'recursive_functions': set()
-        }
-        
-        for function_name, function_node in self.function_definitions.items():
-            recursion_context['current_function'] = function_name
-            self.traverse(function_node, [recursive_call_checker], recursion_context)
-            recursion_context['current_function'] = None
+        index = self.call_graph(root_node)
+        self.function_definitions = index.definitions()
+        self.recursive_functions = index.recursive_names()
+
+    def _function_name(self, node) -> Union[str, None]:
+        return declared_name(node)[0]
     
-    def analyze_memory_usage(self, node) -> Tuple[sp.Expr, Dict[str, Any]]:
+    @timed('memory_usage')
+    def analyze_memory_usage(self, node) -> Tuple[Complexity, Dict[str, Any]]:
         self.identify_functions_and_recursion(node)
+        self.code_patterns(node)
+        index = self.call_graph_index
         
         recursive_stack_info = {
-            func_name: {'max_depth': 1, 'frame_size': 0} 
+            func_name: {'max_depth': 1 + index.recursive_call_count(func_name), 'frame_size': 0}
             for func_name in self.recursive_functions
         }
         
         def memory_handler(node, context):
             """Handler to detect memory allocations in the code"""
-            if node.type == 'declaration':
-                type_node = node.child_by_field_name('type')
-                type_name = type_node.text.decode('utf8') if type_node else 'unknown'
-                
-                type_size = _estimate_type_size(type_name)
-                
-                declarators = node.children_by_field_name('declarator')
-                for d in declarators:
-                    if d.type == 'array_declarator':
-                        size_node = d.child_by_field_name('size')
-                        if size_node:
-                            size_text = size_node.text.decode('utf8')
-                            try:
-                                size_value = int(size_text)
-                                memory_expr = sp.Integer(size_value) * sp.Integer(type_size)
-                            except ValueError:
-                                if size_text == 'n':
-                                    memory_expr = self.n * sp.Integer(type_size)
-                                else:
-                                    size_symbol = sp.symbols(size_text)
-                                    memory_expr = size_symbol * sp.Integer(type_size)
-                            
-                            context['memory_exprs'].append(memory_expr)
-                    
-                    elif d.type == 'init_declarator':
-                        value_node = d.child_by_field_name('value')
-                        if value_node and value_node.type == 'call_expression':
-                            args_node = value_node.child_by_field_name('arguments')
-                            if args_node and len(args_node.children) > 1:
-                                size_arg = args_node.children[1].text.decode('utf8')
-                                try:
-                                    size_value = int(size_arg)
-                                    memory_expr = sp.Integer(size_value) * sp.Integer(type_size)
-                                except ValueError:
-                                    if size_arg == 'n':
-                                        memory_expr = self.n * sp.Integer(type_size)
-                                    else:
-                                        size_symbol = sp.symbols(size_arg)
-                                        memory_expr = size_symbol * sp.Integer(type_size)
-                                
-                                context['memory_exprs'].append(memory_expr)
-                        
-                        else:
-                            if 'current_function' in context and context['current_function']:
-                                if context['current_function'] in recursive_stack_info:
-                                    recursive_stack_info[context['current_function']]['frame_size'] += type_size
-                            
-                            context['memory_exprs'].append(sp.Integer(type_size))
-            
-            if node.type == 'call_expression':
-                function_node = node.child_by_field_name('function')
-                if function_node:
-                    function_name = function_node.text.decode('utf8')
-                    if function_name in self.recursive_functions:
-                        if 'current_function' in context and context['current_function'] == function_name:
-                            context['current_recursive_depth'] += 1
-                            recursive_stack_info[function_name]['max_depth'] = max(
-                                recursive_stack_info[function_name]['max_depth'],
-                                context['current_recursive_depth']
-                            )
+            memory_exprs, frame_size = self._declaration_memory(node)
+            context['memory_exprs'].extend(memory_exprs)
+            if 'current_function' in context and context['current_function']:
+                if context['current_function'] in recursive_stack_info:
+                    recursive_stack_info[context['current_function']]['frame_size'] += frame_size
         
         def function_scope_enter(node, context):
-            if node.type == 'function_definition':
-                declarator = node.child_by_field_name('declarator')
-                if declarator:
-                    name_node = next((c for c in declarator.children if c.type == 'identifier'), None)
-                    if name_node:
-                        function_name = name_node.text.decode('utf8')
-                        context['current_function'] = function_name
-                        if function_name in self.recursive_functions:
-                            context['current_recursive_depth'] = 1
+            function_name = self._function_name(node)
+            if function_name:
+                context['current_function'] = function_name
         
         def function_scope_exit(node, context):
-            if node.type == 'function_definition':
-                context['current_function'] = None
-                context['current_recursive_depth'] = 0
-        
-        def _estimate_type_size(type_name: str) -> int:
-            """Estimate the size in bytes of common C++ types"""
-            type_sizes = {
-                'int': 4,
-                'float': 4,
-                'double': 8,
-                'char': 1,
-                'long': 8,
-                'bool': 1,
-                'short': 2
-            }
-            
-            if '*' in type_name:
-                return 8
-            
-            if 'vector' in type_name or 'list' in type_name or 'map' in type_name:
-                if '<' in type_name and '>' in type_name:
-                    inner_type = type_name.split('<')[1].split('>')[0]
-                    inner_size = _estimate_type_size(inner_type)
-                    return inner_size + 24  
-                return 24  
-            
-            for t, size in type_sizes.items():
-                if t in type_name:
-                    return size
-                    
-            return 4  
+            context['current_function'] = None
         
         memory_context = {
             'memory_exprs': [], 
-            'current_function': None,
-            'current_recursive_depth': 0
+            'current_function': None
         }
         
-        self.traverse(node, [memory_handler, function_scope_enter], memory_context)
-        self.traverse(node, [function_scope_exit], memory_context)
+        handlers = {
+            'declaration': [memory_handler],
+            'function_definition': [function_scope_enter]
+        }
+        self.walk(node, handlers, memory_context, {'function_definition': [function_scope_exit]})
         
-        if memory_context['memory_exprs']:
-            base_memory = sum(memory_context['memory_exprs'])
+        depth_patterns = {
+            func_name: self._analyze_recursive_stack_depth(func_name)
+            for func_name in recursive_stack_info
+        }
+        return self._combine_memory_usage(memory_context['memory_exprs'], recursive_stack_info, depth_patterns), recursive_stack_info
+
+    @timed('combine_memory')
+    def _combine_memory_usage(self, memory_exprs: List[Complexity], recursive_stack_info: Dict[str, Dict[str, int]],
+                              depth_patterns: Dict[str, Union[str, int]]) -> Complexity:
+        if memory_exprs:
+            base_memory = sum(memory_exprs)
         else:
-            base_memory = sp.Integer(0)
+            base_memory = Complexity()
         
-        stack_usage = sp.Integer(0)
+        stack_usage = Complexity()
         for func_name, info in recursive_stack_info.items():
-            max_depth = self._analyze_recursive_stack_depth(func_name)
+            max_depth = depth_patterns[func_name]
             if max_depth == 'linear':
                 depth_expr = self.n
             elif max_depth == 'log':
-                depth_expr = sp.log(self.n)
+                depth_expr = Complexity.log()
             elif max_depth == 'exponential':
-                depth_expr = 2 ** self.n
+                depth_expr = Complexity.exponential()
             else:
                 depth_expr = max(info['max_depth'], 1)
                 
-            stack_usage += sp.Integer(info['frame_size']) * depth_expr
+            stack_usage += info['frame_size'] * depth_expr
         
-        return base_memory + stack_usage, recursive_stack_info
-    
+        return base_memory + stack_usage
+
+    def _declaration_memory(self, node) -> Tuple[List[Complexity], int]:
+        """Memory expressions for a declaration, plus the bytes it adds to the enclosing stack frame"""
+        element_size = type_size(node.child_by_field_name('type'))
+        memory_exprs = []
+        frame_size = 0
+        
+        declarators = node.children_by_field_name('declarator')
+        for d in declarators:
+            if d.type == 'array_declarator':
+                size_node = d.child_by_field_name('size')
+                if size_node:
+                    memory_exprs.append(self._sized_allocation(size_node, element_size))
+            
+            elif d.type == 'init_declarator':
+                value_node = d.child_by_field_name('value')
+                if value_node and value_node.type == 'call_expression':
+                    args_node = value_node.child_by_field_name('arguments')
+                    if args_node and args_node.named_child_count > 0:
+                        memory_exprs.append(self._sized_allocation(args_node.named_children[0], element_size))
+                
+                else:
+                    # int* p = new int[n] keeps a pointer in the frame, whatever it points at
+                    is_pointer = d.child_by_field_name('declarator').type == 'pointer_declarator'
+                    size = POINTER_SIZE if is_pointer else element_size
+                    frame_size += size
+                    memory_exprs.append(Complexity.constant(size))
+        
+        return memory_exprs, frame_size
+
+    def _sized_allocation(self, size_node, type_size: int) -> Complexity:
+        return expression_complexity(size_node, self.limits, self.warnings) * type_size
+
     def _complexity_compare(self, expr1, expr2):
         """Compare two complexity expressions and return the one with higher asymptotic growth"""
         rank1 = self._complexity_rank(expr1)
         rank2 = self._complexity_rank(expr2)
         return expr1 if rank1 >= rank2 else expr2
 
-    def _complexity_rank(self, expr):
-        """Rank expressions by their asymptotic complexity"""
-        n = self.n
-        expr_str = str(expr)
-        
-        if "factorial" in expr_str:
-            return 100  
-        elif "**" in expr_str and str(n) in expr_str:
-            try:
-                base = float(expr_str.split("**")[0].strip())
-                return 90 + base 
-            except:
-                return 90 
-        elif "*log" in expr_str:
-            return 60  
-        elif str(n) + "**" in expr_str or "**" + str(n) in expr_str:
-            try:
-                if "**" in expr_str:
-                    power = float(expr_str.split("**")[1].strip())
-                    return 50 + power  
-            except:
-                return 55  
-        elif str(n) in expr_str:
-            return 40  
-        elif "log" in expr_str:
-            return 20  
-        else:
-            return 10  
+    def _complexity_rank(self, expr: Complexity):
+        """Rank expressions by their asymptotic complexity; ranks compare with plain tuple ordering"""
+        return expr.growth()
     
     def _analyze_recursive_stack_depth(self, function_name: str) -> Union[str, int]:
         function_node = self.function_definitions.get(function_name)
         if not function_node:
-            return 1        
-        if self._has_divide_and_conquer_pattern(function_node, function_name):
-            return 'log'
-            
-        if self._has_exponential_pattern(function_node, function_name):
-            return 'exponential'
-            
-        return 'linear'
+            return 1
+        return self._stack_depth_pattern(self.call_graph_index.recursive_call_count(function_name),
+                                         self._has_division(function_node))
+
+    def _stack_depth_pattern(self, recursive_calls: int, has_division: bool) -> str:
+        return stack_depth_pattern(recursive_calls, has_division)
     
-    def _has_divide_and_conquer_pattern(self, node, function_name: str) -> bool:
-        """Check if the function has a divide-and-conquer pattern (like binary search)"""
+    def _has_division(self, node) -> bool:
+        """Check if the function halves its input somewhere (like binary search)"""
+        patterns = self.code_patterns(node)
+        
         def check_for_division(node, context):
-            if node.type == 'binary_expression':
-                text = node.text.decode('utf8')
-                if '/' in text or '>>' in text or 'mid' in text:
-                    context['has_division'] = True
+            if patterns.is_division(node):
+                context['has_division'] = True
+                return STOP_WALK
         
         division_context = {'has_division': False}
-        self.traverse(node, [check_for_division], division_context)
-        
-        def count_recursive_calls(node, context):
-            if node.type == 'call_expression':
-                function_node = node.child_by_field_name('function')
-                if function_node and function_node.text.decode('utf8') == function_name:
-                    context['call_count'] += 1
-        
-        call_context = {'call_count': 0}
-        self.traverse(node, [count_recursive_calls], call_context)
-        
-        return division_context['has_division'] and 1 <= call_context['call_count'] <= 2
-    
-    def _has_exponential_pattern(self, node, function_name: str) -> bool:
-        """Check if the function has an exponential pattern (like Fibonacci)"""
-        def count_recursive_calls(node, context):
-            if node.type == 'call_expression':
-                function_node = node.child_by_field_name('function')
-                if function_node and function_node.text.decode('utf8') == function_name:
-                    context['call_count'] += 1
-        
-        call_context = {'call_count': 0}
-        self.traverse(node, [count_recursive_calls], call_context)
-        
-        return call_context['call_count'] >= 2
+        self.walk(node, {'binary_expression': [check_for_division]}, division_context)
+        return division_context['has_division']
         
     def get_recursion_info(self) -> Dict[str, Any]:
         """Get information about detected recursive functions"""
@@ -523,6 +625,110 @@ class CodeParser:
             
         return result
 
+    def summarize_function(self, function_node, memo: SummaryMemo = None) -> FunctionSummary:
+        """Summary of one function definition, memoized by the hash of its source"""
+        memo = memo or default_summary_memo()
+        key = function_key(function_node)
+        summary = memo.get(key)
+        if summary is None:
+            summary = self._summarize_function(function_node)
+            memo.put(key, summary)
+        return summary
+
+    @timed('summarize_function')
+    def _summarize_function(self, function_node) -> FunctionSummary:
+        """
+        One walk over the function: its own loops and memory, plus every call scaled by the
+        loops around it. Calls with the function's own name also get their recursion shape;
+        whether they are self-calls is left to FunctionSummary.bind.
+        """
+        function_name = self._function_name(function_node)
+        first_warning = len(self.warnings)
+        patterns = self.code_patterns(function_node)
+        complexity_context = self._new_complexity_context()
+        calls = []
+        recursion = []
+        facts = {'has_division': False, 'memory_exprs': [], 'frame_size': 0}
+        
+        def call_handler(node, context):
+            target = call_target(node)
+            if target is None:
+                return
+            if target[0] == function_name:
+                callee = node.child_by_field_name('function').text.decode('utf8')
+                recursion.append((len(calls), self._recursion_shape(node, callee)))
+            # Scaled by how often the enclosing loops run their body
+            loop_stack = context['loop_stack']
+            calls.append((target, loop_stack[-1] if loop_stack else Complexity.constant(1)))
+        
+        def division_handler(node, context):
+            if not facts['has_division'] and patterns.is_division(node):
+                facts['has_division'] = True
+        
+        def declaration_handler(node, context):
+            memory_exprs, frame_size = self._declaration_memory(node)
+            facts['memory_exprs'].extend(memory_exprs)
+            facts['frame_size'] += frame_size
+        
+        handlers = {
+            'call_expression': [call_handler],
+            'binary_expression': [division_handler],
+            'declaration': [declaration_handler]
+        }
+        exit_handlers = {}
+        for loop_type in LOOP_TYPES:
+            handlers[loop_type] = [self._enter_loop]
+            exit_handlers[loop_type] = [self._leave_loop]
+        self.walk(function_node, handlers, complexity_context, exit_handlers)
+        
+        return FunctionSummary(
+            name=function_name,
+            time=self._combine_time_complexity(complexity_context),
+            memory=self._combine_memory_usage(facts['memory_exprs'], {}, {}),
+            calls=tuple(calls),
+            recursion=tuple(recursion),
+            frame_size=facts['frame_size'],
+            has_division=facts['has_division'],
+            warnings=tuple(self.warnings[first_warning:])
+        )
+
+    @timed('function_report')
+    def function_report(self, node, memo: SummaryMemo = None) -> Dict[str, Any]:
+        """
+        Per-function time and memory. Each function is summarized once (or taken from the
+        memo if its source was seen before) and the summaries are composed through the
+        call graph, so a call to an O(n) helper inside a loop makes the caller O(n**2).
+        Overloads are reported separately, under their parameter lists.
+        """
+        memo = memo or default_summary_memo()
+        index = self.call_graph(node)
+        # One pattern pass for the whole tree rather than one per function
+        self.code_patterns(node)
+        
+        hits_before = memo.hits
+        summaries = {entry.index: self.summarize_function(entry.node, memo) for entry in index.functions}
+        reused = memo.hits - hits_before
+        warnings = self.warnings + [warning for summary in summaries.values() for warning in summary.warnings]
+        summaries = bind_summaries(index, summaries)
+        
+        names = index.display_names()
+        functions = {}
+        for function_index, (time, memory) in compose_summaries(index, summaries).items():
+            summary = summaries[function_index]
+            callees = {callee for target, _ in summary.calls for callee in index.resolve(target, function_index)}
+            functions[names[function_index]] = {
+                'time_complexity': str(time),
+                'time_big_o': big_o(time),
+                'memory_usage': str(memory),
+                'memory_big_o': big_o(memory),
+                'self_time_complexity': str(summary.time),
+                'self_memory_usage': str(summary.memory),
+                'calls': sorted(names[callee] for callee in callees),
+                'recursive': summary.self_calls > 0 or function_index in index.recursive,
+                'recursion_group': index.recursion_group(function_index)
+            }
+        return {'functions': functions, 'summarized': len(summaries) - reused, 'reused': reused, **warnings_result(warnings)}
+
 if __name__ == '__main__':
     codeParser = CodeParser()
     code = """ 
@@ -588,9 +794,9 @@ int main() {
     memory_usage, stack_info = codeParser.analyze_memory_usage(tree.root_node)
     
     print(f"\nTime Complexity Expression: {time_complexity}")
-    print(f"Time Complexity (Big-O): O({sp.simplify(time_complexity)})")
+    print(f"Time Complexity (Big-O): O({time_complexity.dominant()})")
     
     print(f"\nMemory Usage Expression: {memory_usage} bytes")
-    print(f"Memory Usage (Big-O): O({sp.simplify(memory_usage)}) bytes")
+    print(f"Memory Usage (Big-O): O({memory_usage.dominant()}) bytes")
     
     codeParser.print_tree(tree)
\ No newline at end of file
@@ -0,0 +1,201 @@
+import hashlib
+from typing import Any, Dict, List, Optional, Set
+
+from tree_sitter import Query
+
+from analysis_limits import AnalysisLimits, LimitExceeded, limit_warning
+from complexity import Complexity
+
+LOOP_TYPES = ('for_statement', 'while_statement', 'do_statement')
+
+# Loop, allocation and division shapes the analyzers look for, matched natively in one
+# query pass. Captures are named <kind>.<role>; the node a kind is about is <kind>.loop
+# (or just @<kind>), the other captures only feed the predicates.
+PATTERNS = '''
+; for (int i = 0; i < bound; i++): runs `bound` times
+(for_statement
+  initializer: [
+    (declaration declarator: (init_declarator declarator: (identifier) @range.var value: (number_literal)))
+    (assignment_expression left: (identifier) @range.var operator: "=" right: (number_literal))]
+  condition: [
+    (binary_expression left: (identifier) @range.cond operator: ["<" "<=" "!="] right: (_) @range.bound)
+    (binary_expression left: (_) @range.bound operator: [">" ">="] right: (identifier) @range.cond)]
+  update: [
+    (update_expression argument: (identifier) @range.step operator: "++")
+    (update_expression operator: "++" argument: (identifier) @range.step)
+    (assignment_expression left: (identifier) @range.step operator: "+=")]
+  (#eq? @range.var @range.cond)
+  (#eq? @range.var @range.step)) @range.loop
+
+; for (int i = n; i > 0; i--): counting down to a constant, or down from a variable
+(for_statement
+  condition: (binary_expression operator: [">" ">=" "!="] right: (number_literal))
+  update: (update_expression operator: "--")) @countdown.loop
+(for_statement
+  initializer: [
+    (declaration declarator: (init_declarator value: (identifier)))
+    (assignment_expression operator: "=" right: (identifier))]
+  update: (update_expression operator: "--")) @countdown.loop
+
+; Steps that shrink or grow a loop variable geometrically: i *= 2, n /= 10, i = i >> 1,
+; and midpoints such as mid = (lo + hi) / 2 or mid = lo + (hi - lo) / 2
+(assignment_expression operator: ["*=" "/=" ">>=" "<<="]) @halving
+(assignment_expression
+  operator: "="
+  right: (binary_expression operator: ["/" ">>"] right: (number_literal))) @halving
+(assignment_expression
+  operator: "="
+  right: (binary_expression operator: "+" right: (binary_expression operator: ["/" ">>"] right: (number_literal)))) @halving
+(init_declarator value: (binary_expression operator: ["/" ">>"] right: (number_literal))) @halving
+(init_declarator
+  value: (binary_expression operator: "+" right: (binary_expression operator: ["/" ">>"] right: (number_literal)))) @halving
+
+; Divisions and midpoints, which make recursion divide-and-conquer
+(binary_expression operator: ["/" ">>"]) @division
+(binary_expression left: (identifier) @division.name (#match? @division.name "mid")) @division
+(binary_expression right: (identifier) @division.name (#match? @division.name "mid")) @division
+'''
+
+POINTER_SIZE = 8
+DEFAULT_TYPE_SIZE = 4
+# Header of a vector, list or map, excluding its elements
+CONTAINER_SIZE = 24
+
+# Keyed by the type's source bytes, so a lookup needs no decoding
+TYPE_SIZES: Dict[bytes, int] = {
+    b'bool': 1, b'char': 1, b'signed char': 1, b'unsigned char': 1, b'int8_t': 1, b'uint8_t': 1,
+    b'short': 2, b'short int': 2, b'unsigned short': 2, b'int16_t': 2, b'uint16_t': 2, b'wchar_t': 4,
+    b'int': 4, b'signed': 4, b'unsigned': 4, b'unsigned int': 4, b'int32_t': 4, b'uint32_t': 4, b'float': 4,
+    b'long': 8, b'unsigned long': 8, b'long int': 8, b'long long': 8, b'unsigned long long': 8,
+    b'long long int': 8, b'int64_t': 8, b'uint64_t': 8, b'size_t': 8, b'double': 8, b'long double': 16,
+    b'auto': DEFAULT_TYPE_SIZE
+}
+
+CONTAINER_TYPES = frozenset({
+    b'vector', b'list', b'deque', b'map', b'multimap', b'unordered_map', b'set', b'multiset', b'unordered_set'
+})
+
+
+def compile_patterns(language) -> Query:
+    """Compiling takes tens of milliseconds, so compiled queries are pooled (see ParserPool)"""
+    return Query(language, PATTERNS)
+
+
+class CodePatterns:
+    """
+    What one query pass found under a node: loop ranges, geometric (log) loops,
+    countdown loops and divisions, keyed by node id so the analyzers' walks can look
+    them up instead of re-reading each node's text.
+    """
+    __slots__ = ['root', 'ranges', 'log_loops', 'countdown_loops', 'divisions']
+
+    def __init__(self, root):
+        self.root = root
+        self.ranges: Dict[int, Complexity] = {}
+        self.log_loops: Set[int] = set()
+        self.countdown_loops: Set[int] = set()
+        self.divisions: Set[int] = set()
+
+    @classmethod
+    def match(cls, query: Query, root, limits: AnalysisLimits, warnings: List[Dict[str, Any]]) -> "CodePatterns":
+        """Patterns under root; loop bounds over the expression limit add to warnings"""
+        patterns = cls(root)
+        for _, captures in query.matches(root):
+            if 'range.loop' in captures:
+                bound = _loop_bound(captures['range.bound'][0], limits, warnings)
+                if bound is not None:
+                    patterns.ranges[captures['range.loop'][0].id] = bound
+            elif 'countdown.loop' in captures:
+                patterns.countdown_loops.add(captures['countdown.loop'][0].id)
+            elif 'halving' in captures:
+                loop = _stepped_loop(captures['halving'][0])
+                if loop is not None:
+                    patterns.log_loops.add(loop.id)
+            elif 'division' in captures:
+                patterns.divisions.add(captures['division'][0].id)
+        return patterns
+
+    def covers(self, node) -> bool:
+        """Whether node is in the subtree these patterns were matched over"""
+        while node is not None:
+            if node == self.root:
+                return True
+            node = node.parent
+        return False
+
+    def loop_range(self, loop_node) -> Optional[Complexity]:
+        return self.ranges.get(loop_node.id)
+
+    def is_log_loop(self, loop_node) -> bool:
+        return loop_node.id in self.log_loops
+
+    def is_countdown_loop(self, loop_node) -> bool:
+        return loop_node.id in self.countdown_loops
+
+    def is_division(self, node) -> bool:
+        return node.id in self.divisions
+
+
+def expression_complexity(node, limits: AnalysisLimits, warnings: List[Dict[str, Any]]) -> Complexity:
+    """
+    An array size or loop bound as a Complexity. One over limits.max_expression_bytes is
+    not parsed: it becomes an opaque symbol named after a hash of its text, and a warning
+    says where it was, so the rest of the analysis still gets a result.
+    """
+    try:
+        limits.check_expression(node.text)
+    except LimitExceeded as error:
+        name = 'expr_' + hashlib.sha256(node.text).hexdigest()[:8]
+        warnings.append(limit_warning(error, f"{error}, so the one at line {node.start_point[0] + 1} is counted as {name}"))
+        return Complexity.symbol(name)
+    return Complexity.parse(node.text.decode('utf8'))
+
+
+def _loop_bound(bound, limits: AnalysisLimits, warnings: List[Dict[str, Any]]) -> Optional[Complexity]:
+    """
+    A loop bound as an expression, or None for bounds such as v.size() or strlen(s):
+    input sizes with no better name than n, which is what loops without a range count as
+    """
+    if bound.type in ('identifier', 'number_literal', 'binary_expression', 'parenthesized_expression'):
+        return expression_complexity(bound, limits, warnings)
+    return None
+
+
+def _stepped_loop(step):
+    """
+    The loop a geometric step makes logarithmic: a for loop whose update it is, or the
+    nearest while or do loop whose body it is in. Steps in a for loop's body do not
+    count; that loop's update decides.
+    """
+    node = step
+    while node is not None:
+        parent = node.parent
+        if parent is None or parent.type == 'function_definition':
+            return None
+        if parent.type == 'for_statement':
+            return parent if node == parent.child_by_field_name('update') else None
+        if parent.type in LOOP_TYPES:
+            return parent
+        node = parent
+    return None
+
+
+def type_size(type_node) -> int:
+    """Estimated size in bytes of a declaration's type node"""
+    if type_node is None:
+        return DEFAULT_TYPE_SIZE
+    # std::vector<int> is a qualified_identifier around the template_type
+    if type_node.type == 'qualified_identifier':
+        name = type_node.child_by_field_name('name')
+        if name is not None and name.type == 'template_type':
+            type_node = name
+    if type_node.type == 'template_type':
+        name = type_node.child_by_field_name('name')
+        if name is not None and name.text in CONTAINER_TYPES:
+            arguments = type_node.child_by_field_name('arguments')
+            element = arguments.named_children[0] if arguments is not None and arguments.named_child_count else None
+            if element is not None and element.type == 'type_descriptor':
+                return CONTAINER_SIZE + type_size(element.child_by_field_name('type'))
+            return CONTAINER_SIZE
+        return DEFAULT_TYPE_SIZE
+    return TYPE_SIZES.get(type_node.text, DEFAULT_TYPE_SIZE)
@@ -0,0 +1,274 @@
+import re
+from fractions import Fraction
+from typing import Dict, List, Tuple, Union
+
+# A term is coefficient * prod(symbol**power) * log(n)**log * 2**(exp*n) * factorial(n)**factorial;
+# this key holds everything but the coefficient
+TermKey = Tuple[Tuple[Tuple[str, int], ...], int, int, int]
+Number = Union[int, Fraction]
+
+IDENTIFIER = re.compile(r'[A-Za-z_]\w*$')
+TOKEN = re.compile(r'\s*(?:(\d+)|([A-Za-z_]\w*)|(.))')
+
+CONSTANT_KEY: TermKey = ((), 0, 0, 0)
+
+# Beyond these, Complexity.parse gives up and returns the text as an opaque symbol: deeper
+# nesting would exhaust the recursion limit, and multiplying sums of distinct symbols
+# doubles the term count with every factor
+MAX_PARSE_NESTING = 100
+MAX_PARSE_TERMS = 64
+
+
+class Complexity:
+    """
+    Exact, lightweight stand-in for the SymPy expressions the analyzers used to build.
+
+    An expression is a sum of terms, each a product of n**a * log(n)**b * 2**(c*n) *
+    factorial(n)**d with integer or fractional coefficients. Other symbols (loop bounds,
+    array sizes) are kept as extra powers in the term. Terms are combined as they are
+    built, so there is no separate simplify step, and str() gives the simplified form.
+    """
+    __slots__ = ['terms']
+
+    def __init__(self, terms: Dict[TermKey, Number] = None):
+        self.terms = {key: coefficient for key, coefficient in (terms or {}).items() if coefficient}
+
+    @classmethod
+    def constant(cls, value: Number) -> "Complexity":
+        return cls({CONSTANT_KEY: value})
+
+    @classmethod
+    def symbol(cls, name: str) -> "Complexity":
+        return cls({(((name, 1),), 0, 0, 0): 1})
+
+    @classmethod
+    def log(cls, power: int = 1) -> "Complexity":
+        """log(n)**power"""
+        return cls({((), power, 0, 0): 1})
+
+    @classmethod
+    def exponential(cls) -> "Complexity":
+        """2**n"""
+        return cls({((), 0, 1, 0): 1})
+
+    @classmethod
+    def factorial(cls) -> "Complexity":
+        """factorial(n)"""
+        return cls({((), 0, 0, 1): 1})
+
+    @classmethod
+    def parse(cls, text: str) -> "Complexity":
+        """
+        Parse a size or bound expression such as `n`, `100`, `sum + 1` or `n / 2`.
+
+        Only integers, identifiers, parentheses and + - * / by a constant are understood;
+        anything else, or anything nested deeper than MAX_PARSE_NESTING or expanding to
+        more than MAX_PARSE_TERMS terms, becomes an opaque symbol named by its text.
+        """
+        text = text.strip()
+        try:
+            tokens = [token for token in TOKEN.findall(text) if any(token)]
+            parser = _ExpressionParser(tokens)
+            result = parser.expression()
+            if parser.position == len(tokens):
+                return result
+        except (ValueError, IndexError, ZeroDivisionError, RecursionError):
+            pass
+        return cls.symbol(text)
+
+    def is_zero(self) -> bool:
+        return not self.terms
+
+    def __add__(self, other: Union["Complexity", Number]) -> "Complexity":
+        other = _coerce(other)
+        terms = dict(self.terms)
+        for key, coefficient in other.terms.items():
+            terms[key] = terms.get(key, 0) + coefficient
+        return Complexity(terms)
+
+    __radd__ = __add__
+
+    def __neg__(self) -> "Complexity":
+        return Complexity({key: -coefficient for key, coefficient in self.terms.items()})
+
+    def __sub__(self, other: Union["Complexity", Number]) -> "Complexity":
+        return self + -_coerce(other)
+
+    def __mul__(self, other: Union["Complexity", Number]) -> "Complexity":
+        other = _coerce(other)
+        terms: Dict[TermKey, Number] = {}
+        for left_key, left_coefficient in self.terms.items():
+            for right_key, right_coefficient in other.terms.items():
+                key = _multiply_keys(left_key, right_key)
+                terms[key] = terms.get(key, 0) + left_coefficient * right_coefficient
+        return Complexity(terms)
+
+    __rmul__ = __mul__
+
+    def __pow__(self, exponent: int) -> "Complexity":
+        if not isinstance(exponent, int) or exponent < 0:
+            raise ValueError("Complexity only supports non-negative integer powers")
+        result = Complexity.constant(1)
+        for _ in range(exponent):
+            result = result * self
+        return result
+
+    def __rpow__(self, base: int) -> "Complexity":
+        """Only 2**n is meaningful here"""
+        if base == 2 and self == Complexity.symbol('n'):
+            return Complexity.exponential()
+        raise ValueError("Complexity only supports 2**n as an exponential")
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (int, Fraction)):
+            other = Complexity.constant(other)
+        return isinstance(other, Complexity) and self.terms == other.terms
+
+    def __hash__(self) -> int:
+        return hash(frozenset(self.terms.items()))
+
+    def growth(self) -> Tuple[int, int, int, int]:
+        """
+        Asymptotic order of the fastest-growing term as (factorial, exponential, degree, log),
+        comparable with plain tuple ordering. Every symbol is assumed to grow like n.
+        """
+        if not self.terms:
+            return (0, 0, 0, 0)
+        return max(_term_growth(key) for key in self.terms)
+
+    def dominant(self) -> "Complexity":
+        """The Big-O class: fastest-growing terms with unit coefficients"""
+        if not self.terms:
+            return Complexity()
+        top = self.growth()
+        return Complexity({key: 1 for key in self.terms if _term_growth(key) == top})
+
+    def __str__(self) -> str:
+        if not self.terms:
+            return '0'
+        ordered = sorted(self.terms.items(), key=lambda item: (_term_growth(item[0]), item[0]), reverse=True)
+        text = ''
+        for index, (key, coefficient) in enumerate(ordered):
+            term = _format_term(key, coefficient)
+            if index == 0:
+                text = term
+            elif term.startswith('-'):
+                text += ' - ' + term[1:]
+            else:
+                text += ' + ' + term
+        return text
+
+    def __repr__(self) -> str:
+        return f"Complexity({self})"
+
+
+def _coerce(value: Union[Complexity, Number]) -> Complexity:
+    if isinstance(value, Complexity):
+        return value
+    if isinstance(value, (int, Fraction)):
+        return Complexity.constant(value)
+    raise TypeError(f"Cannot combine Complexity with {type(value).__name__}")
+
+
+def _multiply_keys(left: TermKey, right: TermKey) -> TermKey:
+    powers = dict(left[0])
+    for name, power in right[0]:
+        powers[name] = powers.get(name, 0) + power
+    return (tuple(sorted(powers.items())), left[1] + right[1], left[2] + right[2], left[3] + right[3])
+
+
+def _term_growth(key: TermKey) -> Tuple[int, int, int, int]:
+    symbols, log_power, exp_power, factorial_power = key
+    return (factorial_power, exp_power, sum(power for _, power in symbols), log_power)
+
+
+def _format_term(key: TermKey, coefficient: Number) -> str:
+    symbols, log_power, exp_power, factorial_power = key
+    factors: List[str] = []
+    if exp_power:
+        factors.append('2**n' if exp_power == 1 else f'2**({exp_power}*n)')
+    for name, power in symbols:
+        name = name if IDENTIFIER.match(name) else f'({name})'
+        factors.append(name if power == 1 else f'{name}**{power}')
+    if factorial_power:
+        factors.append('factorial(n)' if factorial_power == 1 else f'factorial(n)**{factorial_power}')
+    if log_power:
+        factors.append('log(n)' if log_power == 1 else f'log(n)**{log_power}')
+
+    sign = '-' if coefficient < 0 else ''
+    if isinstance(coefficient, int):
+        numerator, denominator = abs(coefficient), 1
+    else:
+        numerator, denominator = abs(coefficient.numerator), coefficient.denominator
+    if not factors:
+        return sign + (str(numerator) if denominator == 1 else f'{numerator}/{denominator}')
+    text = '*'.join(factors)
+    if numerator != 1:
+        text = f'{numerator}*{text}'
+    if denominator != 1:
+        text = f'{text}/{denominator}'
+    return sign + text
+
+
+class _ExpressionParser:
+    """Recursive-descent parser for the small arithmetic subset Complexity.parse accepts"""
+    __slots__ = ['tokens', 'position', 'depth']
+
+    def __init__(self, tokens: List[Tuple[str, str, str]]):
+        self.tokens = tokens
+        self.position = 0
+        self.depth = 0
+
+    def _peek(self) -> str:
+        if self.position < len(self.tokens):
+            number, name, symbol = self.tokens[self.position]
+            return symbol
+        return ''
+
+    def expression(self) -> Complexity:
+        result = self.product()
+        while self._peek() in ('+', '-'):
+            operator = self._peek()
+            self.position += 1
+            right = self.product()
+            result = result + right if operator == '+' else result - right
+        return result
+
+    def product(self) -> Complexity:
+        result = self.atom()
+        while self._peek() in ('*', '/'):
+            operator = self._peek()
+            self.position += 1
+            right = self.atom()
+            if operator == '*':
+                result = result * right
+                if len(result.terms) > MAX_PARSE_TERMS:
+                    raise ValueError("Expression expands to too many terms")
+            else:
+                divisor = right.terms.get(CONSTANT_KEY) if set(right.terms) == {CONSTANT_KEY} else None
+                if not divisor:
+                    raise ValueError("Only division by a non-zero constant is supported")
+                result = result * Complexity.constant(Fraction(1) / Fraction(divisor))
+        return result
+
+    def atom(self) -> Complexity:
+        number, name, symbol = self.tokens[self.position]
+        self.position += 1
+        if number:
+            return Complexity.constant(int(number))
+        if name:
+            return Complexity.symbol(name)
+        if symbol not in ('(', '-'):
+            raise ValueError(f"Unexpected token {symbol!r}")
+        self.depth += 1
+        if self.depth > MAX_PARSE_NESTING:
+            raise ValueError("Expression is nested too deeply")
+        if symbol == '(':
+            result = self.expression()
+            if self._peek() != ')':
+                raise ValueError("Unbalanced parentheses")
+            self.position += 1
+        else:
+            result = -self.atom()
+        self.depth -= 1
+        return result
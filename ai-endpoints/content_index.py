@@ -0,0 +1,284 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from analysis_cache import ANALYZER_VERSION, source_digest
+from analysis_limits import SourceTooLarge
+from analysis_workers import CACHEABLE_TASKS, run_task
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INDEX_PATH = os.path.join(SERVICE_DIR, 'content_index.db')
+DEFAULT_COURSES_PATH = os.path.join(SERVICE_DIR, '..', 'server', 'src', 'seed', 'data', 'courses.json')
+DEFAULT_COURSE_DB = os.path.join(SERVICE_DIR, '..', 'shared-local-instance.db')
+
+# Bump when the index layout changes. An index built for another layout or another
+# ANALYZER_VERSION is rebuilt, never served
+INDEX_VERSION = 1
+BUILD_VERSION = f"{INDEX_VERSION}.{ANALYZER_VERSION}"
+
+# Fenced code blocks; the first word of the info string names the language
+FENCE = re.compile(r'^[ \t]*(`{3,}|~{3,})[ \t]*([^\s`~]*)[^\n]*\n(.*?)^[ \t]*\1[ \t]*$', re.MULTILINE | re.DOTALL)
+CPP_LANGUAGES = frozenset({'cpp', 'c++', 'cc', 'cxx', 'hpp', 'c', 'h'})
+# An untagged block counts as C++ if it contains one of these
+CPP_MARKERS = ('#include', 'std::', 'int main(')
+
+# Course fields written by learners rather than teachers
+LEARNER_FIELDS = frozenset({'comments', 'enrollments'})
+
+
+def extract_snippets(text: str) -> List[str]:
+    """The C and C++ fenced code blocks in a piece of course text"""
+    snippets = []
+    for match in FENCE.finditer(text):
+        language, code = match.group(2).lower(), match.group(3)
+        if language in CPP_LANGUAGES or (not language and any(marker in code for marker in CPP_MARKERS)):
+            if code.strip():
+                snippets.append(code)
+    return snippets
+
+
+def course_snippets(course: Any) -> List[str]:
+    """Snippets in every text field of a course, in document order"""
+    snippets = []
+    pending = [course]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, str):
+            if '```' in value or '~~~' in value:
+                snippets.extend(extract_snippets(value))
+        elif isinstance(value, dict):
+            pending.extend(item for key, item in reversed(value.items()) if key not in LEARNER_FIELDS)
+        elif isinstance(value, list):
+            pending.extend(reversed(value))
+    return snippets
+
+
+def read_course_file(path: str) -> Iterator[Tuple[str, Any]]:
+    """(source id, course) pairs from a JSON list of courses, such as the server's seed data"""
+    with open(path) as courses_file:
+        courses = json.load(courses_file)
+    name = os.path.basename(path)
+    for position, course in enumerate(courses):
+        yield f"{name}:{course.get('courseId', position)}", course
+
+
+def read_course_table(path: str, table: str = 'Course') -> Iterator[Tuple[str, Any]]:
+    """(source id, course) pairs from a DynamoDB Local database, such as shared-local-instance.db"""
+    if not table.replace('_', '').isalnum():
+        raise ValueError(f"Invalid course table name: {table}")
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as connection:
+        rows = connection.execute(f'SELECT hashKey, ObjectJSON FROM "{table}"').fetchall()
+    for key, item in rows:
+        key = key.decode('utf8') if isinstance(key, bytes) else key
+        yield f"{table}:{key}", _from_dynamo({'M': json.loads(item)})
+
+
+def _from_dynamo(value: Dict[str, Any]) -> Any:
+    """Plain JSON from a DynamoDB attribute value such as {"M": {"title": {"S": "..."}}}"""
+    (kind, inner), = value.items()
+    if kind == 'M':
+        return {key: _from_dynamo(item) for key, item in inner.items()}
+    if kind == 'L':
+        return [_from_dynamo(item) for item in inner]
+    if kind == 'N':
+        return float(inner) if any(c in inner for c in '.eE') else int(inner)
+    if kind == 'NULL':
+        return None
+    # S, BOOL, B and the set types carry their value as is
+    return inner
+
+
+def analyze_snippet(code: str) -> Dict[str, str]:
+    """JSON results of the cacheable analyses of one snippet, leaving out degraded ones"""
+    results = {}
+    for kind in CACHEABLE_TASKS:
+        try:
+            result, _ = run_task(kind, code)
+        except SourceTooLarge:
+            return {}
+        if not result.get('degraded'):
+            results[kind] = json.dumps(result)
+    return results
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, timeout=5)
+    connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    # results: JSON object of analysis kind -> JSON result
+    connection.execute("CREATE TABLE IF NOT EXISTS snippets (digest TEXT PRIMARY KEY, results TEXT NOT NULL)")
+    # digests: JSON list of the snippet digests found in the source when its fingerprint was taken
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS sources (source TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, digests TEXT NOT NULL)")
+    return connection
+
+
+def build_index(path: str, courses: List[Tuple[str, Any]], full: bool = False) -> Dict[str, int]:
+    """
+    Bring the index at path up to date with courses. Courses whose content is unchanged
+    since the last build are skipped; in changed ones only snippets not yet in the index
+    are analyzed. Snippets no course contains any more are dropped. `full` (or an index
+    built for another BUILD_VERSION) starts from scratch.
+    """
+    counts = {'courses': len(courses), 'changed': 0, 'removed': 0, 'snippets': 0, 'analyzed': 0, 'reused': 0,
+              'dropped': 0}
+    with _connect(path) as connection:
+        version = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if full or version is None or version[0] != BUILD_VERSION:
+            connection.execute("DELETE FROM snippets")
+            connection.execute("DELETE FROM sources")
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (BUILD_VERSION,))
+
+        known = {source: (fingerprint, json.loads(digests)) for source, fingerprint, digests
+                 in connection.execute("SELECT source, fingerprint, digests FROM sources")}
+        indexed = {digest for digest, in connection.execute("SELECT digest FROM snippets")}
+        referenced = set()
+        for source, course in courses:
+            fingerprint = hashlib.sha256(json.dumps(course, sort_keys=True).encode('utf8')).hexdigest()
+            previous = known.pop(source, None)
+            if previous is not None and previous[0] == fingerprint:
+                referenced.update(previous[1])
+                continue
+            counts['changed'] += 1
+            digests = []
+            for code in course_snippets(course):
+                digest = source_digest(code)
+                digests.append(digest)
+                if digest in indexed:
+                    counts['reused'] += 1
+                    continue
+                results = analyze_snippet(code)
+                if results:
+                    connection.execute("INSERT OR REPLACE INTO snippets (digest, results) VALUES (?, ?)",
+                                       (digest, json.dumps(results, separators=(',', ':'))))
+                    indexed.add(digest)
+                    counts['analyzed'] += 1
+            referenced.update(digests)
+            connection.execute("INSERT OR REPLACE INTO sources (source, fingerprint, digests) VALUES (?, ?, ?)",
+                               (source, fingerprint, json.dumps(digests)))
+
+        # Courses that are gone
+        counts['removed'] = len(known)
+        connection.executemany("DELETE FROM sources WHERE source = ?", [(source,) for source in known])
+        unreferenced = indexed - referenced
+        connection.executemany("DELETE FROM snippets WHERE digest = ?", [(digest,) for digest in unreferenced])
+        counts['dropped'] = len(unreferenced)
+        counts['snippets'] = len(indexed) - len(unreferenced)
+    if counts['dropped']:
+        with sqlite3.connect(path) as connection:
+            connection.execute("VACUUM")
+    return counts
+
+
+class ContentIndex:
+    """
+    Read side of the course content index: every snippet's precomputed analysis results,
+    held in memory and keyed by the hash of the normalized source, so a learner running
+    course code through the analysis endpoints gets a dictionary lookup. The file is
+    rebuilt offline (python content_index.py); a server notices a new build within
+    check_interval seconds and reloads it.
+    """
+    __slots__ = ['path', 'check_interval', 'entries', 'mtime', 'checked_at', 'hits', 'misses', 'lock']
+
+    def __init__(self, path: str, check_interval: float = 30.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.entries: Dict[str, Dict[str, str]] = {}
+        self.mtime: Optional[float] = None
+        self.checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["ContentIndex"]:
+        """Read from CONTENT_INDEX_PATH (default content_index.db here); set it empty to turn the index off"""
+        path = os.getenv('CONTENT_INDEX_PATH', DEFAULT_INDEX_PATH)
+        if not path:
+            return None
+        return cls(path, check_interval=float(os.getenv('CONTENT_INDEX_CHECK_INTERVAL', 30)))
+
+    def get(self, kind: str, code: str) -> Optional[Dict[str, Any]]:
+        self._refresh()
+        if not self.entries:
+            return None
+        results = self.entries.get(source_digest(code))
+        payload = results.get(kind) if results is not None else None
+        with self.lock:
+            if payload is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(payload)
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return
+        self.checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            self.entries, self.mtime = {}, None
+            return
+        if mtime != self.mtime:
+            self.entries = self._load()
+            self.mtime = mtime
+
+    def _load(self) -> Dict[str, Dict[str, str]]:
+        with sqlite3.connect(f"file:{self.path}?mode=ro", uri=True) as connection:
+            try:
+                version = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+                if version is None or version[0] != BUILD_VERSION:
+                    return {}
+                return {digest: json.loads(results)
+                        for digest, results in connection.execute("SELECT digest, results FROM snippets")}
+            except sqlite3.OperationalError:
+                # Not built yet
+                return {}
+
+    def stats(self) -> Dict[str, Any]:
+        self._refresh()
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'path': self.path,
+                'snippets': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the course content analysis index")
+    parser.add_argument('--index', default=os.getenv('CONTENT_INDEX_PATH') or DEFAULT_INDEX_PATH,
+                        help="index file to create or update")
+    parser.add_argument('--courses', nargs='*', default=None,
+                        help="JSON course lists (default: the server's seed data)")
+    parser.add_argument('--course-db', default=None,
+                        help="DynamoDB Local database with a Course table (default: shared-local-instance.db, if present)")
+    parser.add_argument('--table', default='Course', help="course table in --course-db")
+    parser.add_argument('--full', action='store_true', help="rebuild from scratch instead of incrementally")
+    args = parser.parse_args()
+
+    courses = []
+    for path in args.courses if args.courses is not None else [DEFAULT_COURSES_PATH]:
+        courses.extend(read_course_file(path))
+    course_db = args.course_db or (DEFAULT_COURSE_DB if os.path.exists(DEFAULT_COURSE_DB) else None)
+    if course_db:
+        courses.extend(read_course_table(course_db, args.table))
+
+    start = time.perf_counter()
+    counts = build_index(args.index, courses, full=args.full)
+    counts['seconds'] = round(time.perf_counter() - start, 3)
+    print(json.dumps(counts))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import timed
+
+# Source shown in a message, cut at the first line break
+SNIPPET_BYTES = 40
+
+# A byte range; nodes touching either end, such as zero-width MISSING nodes, count as inside
+Range = Tuple[int, int]
+# (row, column), 0-based
+Point = Tuple[int, int]
+
+
+def serialize_error(node) -> Dict[str, Any]:
+    """
+    JSON-friendly form of an ERROR or MISSING node: its type, a short message and its
+    0-based (line, column) range, columns counted in bytes as tree-sitter does. No byte
+    offsets, which would not survive the cache's source normalization.
+    """
+    return {
+        'type': 'MISSING' if node.is_missing else node.type,
+        'message': error_message(node),
+        'start_point': list(node.start_point),
+        'end_point': list(node.end_point)
+    }
+
+
+def error_message(node) -> str:
+    if node.is_missing:
+        return f"Missing '{node.type}'" if not node.is_named else f"Missing {node.type.replace('_', ' ')}"
+    # The first token is what the parser choked on; the whole span can be most of the file
+    leaf = node
+    while leaf.child_count:
+        leaf = leaf.children[0]
+    snippet = (leaf.text or b'').split(b'\n', 1)[0][:SNIPPET_BYTES].decode('utf8', 'replace').strip()
+    message = f"Unexpected '{snippet}'" if snippet else "Unexpected end of input"
+    parent = node.parent
+    if parent is not None and parent.type != 'translation_unit':
+        message += f" in {parent.type.replace('_', ' ')}"
+    return message
+
+
+@timed('errors')
+def find_errors(code_parser, node, limit: int = 0, ranges: Optional[List[Range]] = None) -> Tuple[List[Any], bool]:
+    """
+    ERROR and MISSING nodes under node in source order, and whether the search stopped
+    at `limit` of them (0 for no limit). Subtrees without errors are skipped, so the cost
+    follows the number of errors rather than the size of the tree. With `ranges`, only
+    nodes overlapping one of them are visited; ERROR nodes are reported whole, without
+    the errors nested in them.
+    """
+    if not node.has_error:
+        return [], False
+    found: List[Any] = []
+    for start, end in _merge(ranges) if ranges is not None else [(node.start_byte, node.end_byte)]:
+        if _scan(code_parser, node, start, end, found, limit):
+            return found, True
+    return found, False
+
+
+def _scan(code_parser, node, start: int, end: int, found: List[Any], limit: int) -> bool:
+    """Appends the errors overlapping [start, end] to found; True once limit is reached"""
+    deadline = code_parser.deadline
+    nesting_limit = code_parser.limits.max_depth
+    cursor = node.walk()
+    depth = 0
+    visited = 0
+    while True:
+        current = cursor.node
+        visited += 1
+        if deadline is not None and not visited & 1023 and time.monotonic() > deadline:
+            raise code_parser.limits.time_exceeded()
+        if current.is_error or current.is_missing:
+            # Nodes spanning a range boundary are seen by the scans of both ranges
+            if not found or found[-1] != current:
+                found.append(current)
+                if limit and len(found) >= limit:
+                    return True
+        # The first child ending at or after start; zero-width nodes end where they start
+        elif current.has_error and cursor.goto_first_child_for_byte(max(start - 1, 0)) is not None:
+            depth += 1
+            if nesting_limit and depth > nesting_limit:
+                raise code_parser.limits.depth_exceeded()
+            if cursor.node.start_byte <= end:
+                continue
+        while depth:
+            if cursor.goto_next_sibling() and cursor.node.start_byte <= end:
+                break
+            cursor.goto_parent()
+            depth -= 1
+        else:
+            return False
+
+
+def _merge(ranges: List[Range]) -> List[Range]:
+    merged: List[List[int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def diagnostics_result(errors: List[Dict[str, Any]], truncated: bool) -> Dict[str, Any]:
+    return {'errors': len(errors), 'truncated': truncated, 'diagnostics': errors}
+
+
+def shift_errors(errors: List[Dict[str, Any]], start_point: Point, old_end_point: Point,
+                 new_end_point: Point) -> List[Dict[str, Any]]:
+    """
+    Serialized errors of the previous buffer that an edit did not touch, moved to where
+    they are after it, the way Tree.edit moves nodes; errors touching the edit are dropped
+    """
+    shifted = []
+    for error in errors:
+        if tuple(error['end_point']) < start_point:
+            shifted.append(error)
+        elif tuple(error['start_point']) > old_end_point:
+            shifted.append({
+                **error,
+                'start_point': _shift_point(error['start_point'], old_end_point, new_end_point),
+                'end_point': _shift_point(error['end_point'], old_end_point, new_end_point)
+            })
+    return shifted
+
+
+def _shift_point(point: List[int], old_end: Point, new_end: Point) -> List[int]:
+    row, column = point
+    if row == old_end[0]:
+        # On the edit's last line, so the column moves too
+        return [new_end[0], column - old_end[1] + new_end[1]]
+    return [row + new_end[0] - old_end[0], column]
+
+
+def outside(error: Dict[str, Any], ranges: List[Tuple[Point, Point]]) -> bool:
+    """Whether a serialized error is clear of all of the (start point, end point) ranges"""
+    start, end = tuple(error['start_point']), tuple(error['end_point'])
+    return all(end < range_start or start > range_end for range_start, range_end in ranges)
@@ -0,0 +1,376 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from analysis_limits import LimitExceeded, SourceTooLarge, degraded_result, warnings_result
+from call_graph import declared_name, display_names, enclosing_scope
+from code_parser import CodeParser, ParserPool, serialize_error
+from diagnostics import find_errors, outside, shift_errors
+
+# Node types whose bodies can hold function definitions without being functions themselves
+FUNCTION_CONTAINERS = (
+    'translation_unit', 'namespace_definition', 'declaration_list', 'linkage_specification',
+    'template_declaration', 'class_specifier', 'struct_specifier', 'field_declaration_list'
+)
+
+
+class EditDelta(BaseModel):
+    """
+    A single edit, in tree-sitter terms: the range [start, old_end) of the previous buffer
+    was replaced and now ends at new_end. Give either byte offsets or 0-based (row, column)
+    points, with the column in bytes as in tree-sitter points and the reported syntax
+    errors; missing byte offsets are derived from the points.
+    """
+    start_byte: Optional[int] = None
+    old_end_byte: Optional[int] = None
+    new_end_byte: Optional[int] = None
+    start_point: Optional[Tuple[int, int]] = None
+    old_end_point: Optional[Tuple[int, int]] = None
+    new_end_point: Optional[Tuple[int, int]] = None
+
+
+class SessionUpdate(BaseModel):
+    """
+    Either the full new buffer in `code`, or `text` replacing the delta's old range.
+    Without a delta (or for an unknown session) the buffer is parsed from scratch. A
+    delta outside the buffer, or one that does not turn it into the new one, is rejected.
+    """
+    code: Optional[str] = None
+    text: Optional[str] = None
+    edit: Optional[EditDelta] = None
+
+
+def _point_to_byte(source: bytes, point: Tuple[int, int]) -> int:
+    """Byte offset of a (row, byte column) point; ValueError if the point is not in source"""
+    row, column = point
+    if row < 0 or column < 0:
+        raise ValueError(f"Edit point ({row}, {column}) has a negative row or column")
+    offset = 0
+    for _ in range(row):
+        offset = source.find(b'\n', offset) + 1
+        if offset == 0:
+            raise ValueError(f"Edit point row {row} is past the last line of the buffer")
+    line_end = source.find(b'\n', offset)
+    line_length = (line_end if line_end != -1 else len(source)) - offset
+    if column > line_length:
+        raise ValueError(f"Edit point column {column} is past the end of line {row} ({line_length} bytes)")
+    return offset + column
+
+
+def _byte_to_point(source: bytes, byte: int) -> Tuple[int, int]:
+    row = source.count(b'\n', 0, byte)
+    return row, byte - (source.rfind(b'\n', 0, byte) + 1)
+
+
+def _shift_ranges(ranges: List[Tuple[int, int]], start_byte: int, old_end_byte: int,
+                  new_end_byte: int) -> List[Tuple[int, int]]:
+    """Byte ranges moved past an edit; ranges the edit touches grow to cover it"""
+    delta = new_end_byte - old_end_byte
+    shifted = []
+    for start, end in ranges:
+        if end < start_byte:
+            shifted.append((start, end))
+        elif start > old_end_byte:
+            shifted.append((start + delta, end + delta))
+        else:
+            shifted.append((min(start, start_byte), max(end + delta, new_end_byte)))
+    return shifted
+
+
+class EditorSession:
+    __slots__ = ['session_id', 'source', 'tree', 'function_results', 'errors', 'errors_truncated', 'lock', 'last_used']
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.source = b''
+        self.tree = None
+        # Keyed by display name (see call_graph.display_names), so overloads and methods are kept apart
+        self.function_results: Dict[str, Dict[str, Any]] = {}
+        # Serialized syntax errors of the current buffer; if truncated, the next update searches it all again
+        self.errors: List[Dict[str, Any]] = []
+        self.errors_truncated = True
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+
+class EditorSessionStore:
+    """
+    Keeps the last parse tree per editor session, so each update only reparses around
+    the edit and only re-analyzes the functions the edit touched.
+    """
+    __slots__ = ['parser_pool', 'max_sessions', 'idle_timeout', 'sessions', 'lock']
+
+    def __init__(self, parser_pool: ParserPool = None, max_sessions: int = 256, idle_timeout: float = 1800.0):
+        # None means the default pool, resolved by CodeParser on the first update
+        self.parser_pool = parser_pool
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sessions: "OrderedDict[str, EditorSession]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, parser_pool: ParserPool = None) -> "EditorSessionStore":
+        return cls(
+            parser_pool,
+            max_sessions=int(os.getenv('EDITOR_SESSION_MAX', 256)),
+            idle_timeout=float(os.getenv('EDITOR_SESSION_TTL', 1800))
+        )
+
+    def _session(self, session_id: str) -> Tuple[EditorSession, bool]:
+        now = time.monotonic()
+        with self.lock:
+            for expired_id in [sid for sid, s in self.sessions.items() if now - s.last_used > self.idle_timeout]:
+                del self.sessions[expired_id]
+
+            session = self.sessions.get(session_id)
+            created = session is None
+            if created:
+                session = EditorSession(session_id)
+                self.sessions[session_id] = session
+                while len(self.sessions) > self.max_sessions:
+                    self.sessions.popitem(last=False)
+            self.sessions.move_to_end(session_id)
+            session.last_used = now
+            return session, created
+
+    def close(self, session_id: str) -> bool:
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def update(self, session_id: str, update: SessionUpdate) -> Dict[str, Any]:
+        """
+        Apply an update and return the diagnostics and per-function results. If the new
+        buffer cannot be parsed within the analysis limits the result is degraded and the
+        next update starts from scratch; a source over the size limit raises SourceTooLarge.
+        """
+        session, created = self._session(session_id)
+        with session.lock:
+            try:
+                result = self._apply(session, [update], created)
+                result.update(self._analyze_functions(session))
+                return result
+            except SourceTooLarge:
+                raise
+            except LimitExceeded as error:
+                return {'session_id': session_id, **degraded_result(error)}
+
+    def edit(self, session_id: str, updates: List[SessionUpdate]) -> Dict[str, Any]:
+        """
+        First half of update() for several updates at once: apply them in order, parse
+        once, and return the diagnostics. Functions the updates touched lose their cached
+        results, so a later analyze() picks them up even if analyses in between were
+        abandoned.
+        """
+        session, created = self._session(session_id)
+        with session.lock:
+            try:
+                return self._apply(session, updates, created)
+            except SourceTooLarge:
+                raise
+            except LimitExceeded as error:
+                return {'session_id': session_id, **degraded_result(error)}
+
+    def analyze(self, session_id: str, cancelled: Optional[Callable[[], bool]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Second half of update(): analyze the functions without cached results. Gives up,
+        returning None, as soon as cancelled() is true; finished functions stay cached.
+        """
+        session, _ = self._session(session_id)
+        with session.lock:
+            return self._analyze_functions(session, cancelled)
+
+    def _apply(self, session: EditorSession, updates: List[SessionUpdate], created: bool) -> Dict[str, Any]:
+        code_parser = CodeParser(self.parser_pool)
+        source = session.source
+        # Edited along with source while it is known to match it; None after a full replacement
+        tree = session.tree if not created else None
+        known = tree is not None
+        errors, errors_truncated = session.errors, session.errors_truncated
+        # Byte ranges of the current source the edits so far replaced
+        edited: List[Tuple[int, int]] = []
+        # Given to the tree once every update is known to be valid, so a bad one leaves the session as it was
+        tree_edits: List[Dict[str, Any]] = []
+
+        for update in updates:
+            edit = update.edit
+            start_byte = old_end_byte = None
+            if known and edit is not None:
+                start_byte = edit.start_byte if edit.start_byte is not None else (
+                    _point_to_byte(source, edit.start_point) if edit.start_point is not None else None)
+                old_end_byte = edit.old_end_byte if edit.old_end_byte is not None else (
+                    _point_to_byte(source, edit.old_end_point) if edit.old_end_point is not None else None)
+                if start_byte is not None and old_end_byte is not None and not 0 <= start_byte <= old_end_byte <= len(source):
+                    raise ValueError(f"Edit range {start_byte}-{old_end_byte} is outside the {len(source)} byte buffer")
+
+            if start_byte is None or old_end_byte is None:
+                if update.code is None:
+                    raise ValueError("Session update needs either code or an edit with replacement text")
+                source, tree, known = update.code.encode('utf8'), None, True
+                errors, errors_truncated, edited, tree_edits = [], True, [], []
+                continue
+
+            if update.code is None and update.text is not None:
+                new_source = source[:start_byte] + update.text.encode('utf8') + source[old_end_byte:]
+            elif update.code is not None:
+                new_source = update.code.encode('utf8')
+            else:
+                raise ValueError("Session update needs either code or an edit with replacement text")
+
+            if edit.new_end_byte is not None:
+                new_end_byte = edit.new_end_byte
+            elif edit.new_end_point is not None:
+                new_end_byte = _point_to_byte(new_source, edit.new_end_point)
+            elif update.text is not None:
+                new_end_byte = start_byte + len(update.text.encode('utf8'))
+            else:
+                new_end_byte = old_end_byte + len(new_source) - len(source)
+            # The edit has to describe how source became new_source, or the reparsed tree goes out of step with it
+            if update.code is None:
+                consistent = new_end_byte == len(new_source) - len(source) + old_end_byte
+            else:
+                consistent = (start_byte <= new_end_byte <= len(new_source)
+                              and new_source[:start_byte] == source[:start_byte]
+                              and new_source[new_end_byte:] == source[old_end_byte:])
+            if not consistent:
+                raise ValueError(f"Edit {start_byte}-{old_end_byte} -> {new_end_byte} does not match the new buffer")
+
+            if tree is not None:
+                start_point = _byte_to_point(source, start_byte)
+                old_end_point = _byte_to_point(source, old_end_byte)
+                new_end_point = _byte_to_point(new_source, new_end_byte)
+                tree_edits.append({
+                    'start_byte': start_byte,
+                    'old_end_byte': old_end_byte,
+                    'new_end_byte': new_end_byte,
+                    'start_point': start_point,
+                    'old_end_point': old_end_point,
+                    'new_end_point': new_end_point
+                })
+                # Errors away from the edit only move
+                errors = shift_errors(errors, start_point, old_end_point, new_end_point)
+            edited = _shift_ranges(edited, start_byte, old_end_byte, new_end_byte)
+            edited.append((start_byte, new_end_byte))
+            source = new_source
+
+        incremental = tree is not None
+        # Several edits can be given to a tree before it is reparsed
+        for tree_edit in tree_edits:
+            tree.edit(**tree_edit)
+        try:
+            new_tree = code_parser.evaluate_code_syntax(source, tree)
+        except LimitExceeded:
+            # The old tree may already carry edits, and the old source is out of date either way
+            session.source, session.tree, session.function_results = b'', None, {}
+            session.errors, session.errors_truncated = [], True
+            raise
+        root = new_tree.root_node
+
+        if incremental:
+            changed = tree.changed_ranges(new_tree)
+            changed_ranges = [(r.start_byte, r.end_byte) for r in changed] + edited
+            changed_points = [(tuple(r.start_point), tuple(r.end_point)) for r in changed]
+            for function_node, key in self._functions(root):
+                if any(start <= function_node.end_byte and function_node.start_byte <= end
+                       for start, end in changed_ranges):
+                    session.function_results.pop(key, None)
+        else:
+            changed_ranges = None
+            session.function_results = {}
+        session.source = source
+        session.tree = new_tree
+
+        max_errors = code_parser.limits.max_diagnostics
+        limit_hit = None
+        try:
+            if incremental and not errors_truncated:
+                # Only the changed ranges are searched again
+                errors = [error for error in errors if outside(error, changed_points)]
+                nodes, errors_truncated = find_errors(code_parser, root, max_errors, changed_ranges)
+                errors = sorted(errors + [serialize_error(node) for node in nodes], key=lambda error: error['start_point'])
+                errors_truncated = errors_truncated or bool(max_errors) and len(errors) > max_errors
+                if errors_truncated:
+                    errors = errors[:max_errors]
+            else:
+                nodes, errors_truncated = find_errors(code_parser, root, max_errors)
+                errors = [serialize_error(node) for node in nodes]
+        except LimitExceeded as error:
+            limit_hit = error
+            errors, errors_truncated = [], True
+        session.errors, session.errors_truncated = errors, errors_truncated
+        result = {
+            'session_id': session.session_id,
+            'incremental': incremental,
+            'changed_ranges': changed_ranges,
+            'errors': errors,
+            'errors_truncated': errors_truncated
+        }
+        if limit_hit is not None:
+            result.update(degraded_result(limit_hit))
+        return result
+
+    def _analyze_functions(self, session: EditorSession,
+                           cancelled: Optional[Callable[[], bool]] = None) -> Optional[Dict[str, Any]]:
+        """Results for every function, analyzing the ones _apply (or an earlier limit) left without one"""
+        if session.tree is None:
+            return {'reanalyzed': [], 'functions': {}}
+        code_parser = CodeParser(self.parser_pool)
+        code_parser.deadline = code_parser.limits.deadline()
+        function_results = {}
+        reanalyzed = []
+        limit_hit = None
+        for function_node, function_name in self._functions(session.tree.root_node):
+            if cancelled is not None and cancelled():
+                return None
+            cached = session.function_results.get(function_name)
+            if cached is None:
+                first_warning = len(code_parser.warnings)
+                try:
+                    analysis = code_parser.analyze(function_node)
+                except LimitExceeded as error:
+                    # Not kept, so the function is analyzed again on the next update
+                    limit_hit = error
+                    function_results[function_name] = degraded_result(error)
+                    continue
+                cached = {
+                    'time_complexity': str(analysis['time_complexity']),
+                    'memory_usage': str(analysis['memory_usage']),
+                    **warnings_result(code_parser.warnings[first_warning:])
+                }
+                session.function_results[function_name] = cached
+                reanalyzed.append(function_name)
+            function_results[function_name] = cached
+        # Drops functions that no longer exist
+        session.function_results = {
+            name: result for name, result in function_results.items() if not result.get('degraded')
+        }
+        result = {'reanalyzed': reanalyzed, 'functions': function_results}
+        if limit_hit is not None:
+            result.update(degraded_result(limit_hit))
+        return result
+
+    def _function_nodes(self, node) -> List[Any]:
+        """Function definitions reachable without descending into function bodies"""
+        functions = []
+        pending = [node]
+        while pending:
+            current = pending.pop()
+            for child in current.named_children:
+                if child.type == 'function_definition':
+                    functions.append(child)
+                elif child.type in FUNCTION_CONTAINERS:
+                    pending.append(child)
+        functions.sort(key=lambda function_node: function_node.start_byte)
+        return functions
+
+    def _functions(self, node) -> List[Tuple[Any, str]]:
+        """Named function definitions (see _function_nodes) with the names their results are kept and reported under"""
+        named = []
+        for function_node in self._function_nodes(node):
+            name, qualifier = declared_name(function_node)
+            if name:
+                named.append(('::'.join((*enclosing_scope(function_node), *qualifier, name)), function_node))
+        return [(function_node, key) for (_, function_node), key in zip(named, display_names(named))]
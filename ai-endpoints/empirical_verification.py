@@ -0,0 +1,488 @@
+import asyncio
+import hashlib
+import math
+import os
+import random
+import re
+import signal
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from analysis_cache import normalize_source
+from analysis_limits import (AnalysisLimits, LimitExceeded, SourceTooLarge, default_analysis_limits, degraded_result,
+                             warnings_result)
+from analysis_workers import WorkersSaturated
+from code_parser import CodeParser, big_o
+
+# Candidate growth classes, simplest first, named the way big_o() prints them
+TIME_CLASSES: List[Tuple[str, Callable[[int], float]]] = [
+    ('O(1)', lambda n: 1.0),
+    ('O(log(n))', lambda n: math.log2(n)),
+    ('O(n)', lambda n: float(n)),
+    ('O(n*log(n))', lambda n: n * math.log2(n)),
+    ('O(n**2)', lambda n: float(n) ** 2),
+    ('O(n**3)', lambda n: float(n) ** 3),
+    ('O(2**n)', lambda n: 2.0 ** n if n < 1000 else math.inf),
+]
+MEMORY_CLASSES = TIME_CLASSES[:5]
+
+# Measurements that grow less than this over the whole size range count as constant
+FLAT_GROWTH = 1.5
+# The simplest class whose fit error is within this factor of the best fit's is chosen;
+# n and n*log(n) in particular are hard to tell apart over a few doublings
+FIT_TOLERANCE = 1.35
+# Timer resolution; shorter runs count as this long, so they do not dominate a relative fit
+MIN_SECONDS = 0.001
+
+INPUT_FORMAT = "n on the first line, then n integers in [0, n)"
+
+# Runs one program and reports its rusage. Linux keeps a process' peak RSS across exec, so
+# a program forked straight from this (large) Python process would report our peak as its
+# own; forked from this small launcher instead, ru_maxrss is the program's.
+# Usage: launcher <cpu seconds> <wall ms> <address space bytes> <program>
+# Prints "<exit code> <signal> <peak rss kb> <cpu seconds>" on stderr.
+LAUNCHER_SOURCE = r'''
+#include <errno.h>
+#include <fcntl.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <sys/resource.h>
+#include <sys/time.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+static pid_t child;
+
+static void expire(int) { kill(child, SIGKILL); }
+
+static void limit(int resource, rlim_t value) {
+    struct rlimit bound = {value, value};
+    setrlimit(resource, &bound);
+}
+
+int main(int argc, char **argv) {
+    if (argc != 5) return 125;
+    child = fork();
+    if (child < 0) return 125;
+    if (child == 0) {
+        limit(RLIMIT_CPU, strtoull(argv[1], 0, 10));
+        limit(RLIMIT_AS, strtoull(argv[3], 0, 10));
+        limit(RLIMIT_FSIZE, 1 << 20);
+        limit(RLIMIT_CORE, 0);
+        limit(RLIMIT_NPROC, 64);
+        int null = open("/dev/null", O_WRONLY);
+        if (null >= 0) dup2(null, 2);
+        execv(argv[4], argv + 4);
+        _exit(126);
+    }
+    signal(SIGALRM, expire);
+    long wall_ms = strtol(argv[2], 0, 10);
+    struct itimerval timer = {{0, 0}, {wall_ms / 1000, (wall_ms % 1000) * 1000}};
+    setitimer(ITIMER_REAL, &timer, 0);
+    int status;
+    struct rusage usage;
+    while (wait4(child, &status, 0, &usage) < 0) {
+        if (errno != EINTR) return 125;
+    }
+    fprintf(stderr, "%d %d %ld %.6f\n", WIFEXITED(status) ? WEXITSTATUS(status) : -1,
+            WIFSIGNALED(status) ? WTERMSIG(status) : 0, usage.ru_maxrss,
+            usage.ru_utime.tv_sec + usage.ru_stime.tv_sec + (usage.ru_utime.tv_usec + usage.ru_stime.tv_usec) / 1e6);
+    return 0;
+}
+'''
+LAUNCHER_NAME = 'launcher'
+
+# A header the compiler opened, as printed by -H
+HEADER_TRACE = re.compile(r'\.+ (.+)$')
+# The file (or tool) a compiler output line is about: "main.cpp:3:5: error: ...",
+# "main.cpp: In function ...", "In file included from a.h:1," or "/usr/bin/ld: ..."
+DIAGNOSTIC_LOCATION = re.compile(r'(?:In file included from |\s+from )?([^\s:][^:]*):(\d+)?(?=[:,\s]|$)')
+
+
+class CompileError(ValueError):
+    """The submission does not compile; the message is the compiler's output about it"""
+
+
+class VerifierUnavailable(Exception):
+    """Verification is switched off, or no compiler is installed"""
+
+
+def fit_complexity(samples: List[Tuple[int, float]], classes: List[Tuple[str, Callable[[int], float]]],
+                   floor: float = MIN_SECONDS) -> Optional[str]:
+    """
+    The class that best explains `samples` of (n, measurement), or None with fewer than
+    three samples. Each class is fitted as a + b * f(n) by least squares on relative
+    error, and a simpler class is preferred unless a more complex one fits clearly
+    better. Measurements below floor count as floor.
+    """
+    if len(samples) < 3:
+        return None
+    values = [max(value, floor) for _, value in samples]
+    if max(values) < min(values) * FLAT_GROWTH:
+        return classes[0][0]
+
+    errors = []
+    for name, growth in classes:
+        xs = [growth(n) for n, _ in samples]
+        if all(math.isfinite(x) for x in xs):
+            errors.append((name, math.sqrt(_relative_fit_error(xs, values) / len(values))))
+    best = min(error for _, error in errors)
+    return next(name for name, error in errors if error <= best * FIT_TOLERANCE)
+
+
+def _relative_fit_error(xs: List[float], ys: List[float]) -> float:
+    """Weighted least squares of y = a + b x with weights 1 / y**2; the weighted residual sum"""
+    weights = [1 / (y * y) for y in ys]
+    total = sum(weights)
+    mean_x = sum(w * x for w, x in zip(weights, xs)) / total
+    mean_y = sum(w * y for w, y in zip(weights, ys)) / total
+    spread = sum(w * (x - mean_x) ** 2 for w, x in zip(weights, xs))
+    slope = sum(w * (x - mean_x) * (y - mean_y) for w, x, y in zip(weights, xs, ys)) / spread if spread else 0.0
+    # Work does not shrink as inputs grow
+    slope = max(slope, 0.0)
+    intercept = mean_y - slope * mean_x
+    return sum(w * (y - intercept - slope * x) ** 2 for w, x, y in zip(weights, xs, ys))
+
+
+def generate_input(n: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    values = ' '.join(str(rng.randrange(n)) for _ in range(n)) if n else ''
+    return f"{n}\n{values}\n".encode('ascii')
+
+
+class BinaryCache:
+    """
+    Compiled submissions on disk, named by the hash of the normalized source and the
+    compiler command, so resubmitting a program skips the compiler. The least recently
+    used binaries beyond max_entries are deleted.
+
+    Submissions may only include the compiler's own headers, and compiler output about
+    any other file is never passed on, so a submission cannot have the compiler read out
+    files from this machine.
+    """
+    __slots__ = ['directory', 'compiler', 'flags', 'compile_timeout', 'max_entries', 'include_dirs', 'hits', 'misses',
+                 'lock']
+
+    def __init__(self, directory: str, compiler: str = 'g++', flags: Tuple[str, ...] = ('-O2', '-std=c++17', '-w'),
+                 compile_timeout: float = 30.0, max_entries: int = 64):
+        self.directory = directory
+        self.compiler = compiler
+        self.flags = flags
+        self.compile_timeout = compile_timeout
+        self.max_entries = max_entries
+        # The compiler's system include directories; found on first use
+        self.include_dirs: Optional[Tuple[str, ...]] = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, code: str) -> str:
+        command = ' '.join((self.compiler, *self.flags))
+        return hashlib.sha256(f"{command}\0{normalize_source(code)}".encode('utf8')).hexdigest()
+
+    def binary(self, code: str) -> Tuple[str, bool]:
+        """Path of the compiled program, compiling it first if it is not cached, and whether it was cached"""
+        path = os.path.join(self.directory, self.key(code))
+        if os.path.exists(path):
+            with self.lock:
+                self.hits += 1
+            # Touch it, so eviction goes by last use
+            os.utime(path)
+            return path, True
+
+        with self.lock:
+            self.misses += 1
+        self._compile(code, path)
+        self._evict()
+        return path, False
+
+    def launcher(self) -> str:
+        """Path of the compiled LAUNCHER_SOURCE; kept out of the hit counts and eviction"""
+        path = os.path.join(self.directory, f"{LAUNCHER_NAME}-{self.key(LAUNCHER_SOURCE)[:16]}")
+        if not os.path.exists(path):
+            self._compile(LAUNCHER_SOURCE, path)
+        return path
+
+    def _compile(self, code: str, path: str):
+        if shutil.which(self.compiler) is None:
+            raise VerifierUnavailable(f"Compiler {self.compiler} is not installed")
+        with tempfile.TemporaryDirectory(dir=self.directory) as build:
+            source = os.path.join(build, 'main.cpp')
+            with open(source, 'w') as source_file:
+                source_file.write(code)
+            output = os.path.join(build, 'main')
+            allowed = (*self._include_dirs(), os.path.realpath(build))
+            try:
+                # -H lists every header opened, however the #include was spelled
+                compiled = subprocess.run([self.compiler, *self.flags, '-H', '-o', output, source], capture_output=True,
+                                          text=True, timeout=self.compile_timeout, cwd=build)
+            except subprocess.TimeoutExpired:
+                raise CompileError(f"Compilation took longer than {self.compile_timeout}s") from None
+            for line in compiled.stderr.splitlines():
+                header = HEADER_TRACE.match(line)
+                if header and not _within(header.group(1), allowed, build):
+                    raise CompileError("Only standard library headers can be included")
+            if compiled.returncode != 0:
+                raise CompileError(_filter_diagnostics(compiled.stderr, allowed, build)[-4000:] or "Compilation failed")
+            # Atomic, so concurrent compilations of the same source are harmless
+            os.replace(output, path)
+
+    def _include_dirs(self) -> Tuple[str, ...]:
+        if self.include_dirs is None:
+            probe = subprocess.run([self.compiler, *self.flags, '-E', '-v', '-x', 'c++', '-'], stdin=subprocess.DEVNULL,
+                                   capture_output=True, text=True, timeout=self.compile_timeout)
+            lines = probe.stderr.splitlines()
+            start = next((i for i, line in enumerate(lines) if line.startswith('#include <...> search starts here')), None)
+            if start is None:
+                raise VerifierUnavailable(f"Could not find the include directories of {self.compiler}")
+            directories = []
+            for line in lines[start + 1:]:
+                if not line.startswith(' '):
+                    break
+                # clang marks framework directories
+                directories.append(os.path.realpath(line.strip().removesuffix(' (framework directory)')))
+            self.include_dirs = tuple(directories)
+        return self.include_dirs
+
+    def _evict(self):
+        with self.lock:
+            entries = [entry for entry in os.scandir(self.directory)
+                       if entry.is_file() and not entry.name.startswith(LAUNCHER_NAME)]
+            if len(entries) <= self.max_entries:
+                return
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:len(entries) - self.max_entries]:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+def _within(path: str, directories: Tuple[str, ...], build: str) -> bool:
+    path = os.path.realpath(os.path.join(build, path))
+    return any(os.path.commonpath((path, directory)) == directory for directory in directories)
+
+
+def _filter_diagnostics(output: str, allowed: Tuple[str, ...], build: str) -> str:
+    """
+    Compiler output with build paths shortened and the -H trace left out, and without
+    messages about a line of any file but main.cpp and the allowed headers: a #line
+    directive can make the compiler quote any file it can read under that file's name.
+    Messages with no line, such as "main.cpp: In function ..." or the linker's, quote nothing.
+    """
+    kept = []
+    keep = True
+    for line in output.splitlines():
+        if HEADER_TRACE.match(line):
+            continue
+        if line.startswith('Multiple include guards may be useful for:'):
+            # The rest of the -H report
+            break
+        location = DIAGNOSTIC_LOCATION.match(line)
+        if location is not None:
+            keep = location.group(2) is None or _within(location.group(1), allowed, build)
+        elif not line.startswith(' '):
+            # "compilation terminated." and the like
+            keep = True
+        # Quoted source and caret lines belong to the message above them
+        if keep:
+            kept.append(line)
+    return '\n'.join(kept).replace(build + os.sep, '')
+
+
+def run_sandboxed(launcher: str, binary: str, stdin: bytes, timeout: float, memory_mb: int) -> Dict[str, Any]:
+    """
+    Run binary once through the launcher, in an empty directory with an empty
+    environment, under CPU time, wall time, address space, file size and process count
+    limits. Returns the exit status, CPU seconds and peak RSS in KB.
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        input_path = os.path.join(workdir, 'input.txt')
+        with open(input_path, 'wb') as input_file:
+            input_file.write(stdin)
+        command = [launcher, str(math.ceil(timeout) + 1), str(math.ceil(timeout * 1000)), str(memory_mb << 20), binary]
+        with open(input_path, 'rb') as input_file:
+            started = time.perf_counter()
+            process = subprocess.Popen(command, stdin=input_file, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                       cwd=workdir, env={}, start_new_session=True)
+            try:
+                _, report = process.communicate(timeout=timeout + 2)
+            except subprocess.TimeoutExpired:
+                # The launcher enforces the wall time itself; this is only a backstop
+                os.killpg(process.pid, signal.SIGKILL)
+                _, report = process.communicate()
+            wall = time.perf_counter() - started
+
+    try:
+        exit_code, killed_by, peak_kb, seconds = report.split()
+        exit_code, killed_by, peak_kb, seconds = int(exit_code), int(killed_by), int(peak_kb), float(seconds)
+    except ValueError:
+        return {'status': 'timeout' if wall >= timeout else 'crashed', 'exit_code': None, 'seconds': None,
+                'wall_seconds': wall, 'peak_kb': None}
+
+    if killed_by in (signal.SIGKILL, signal.SIGXCPU):
+        outcome = 'timeout'
+    elif killed_by or exit_code != 0:
+        outcome = 'crashed'
+    else:
+        outcome = 'ok'
+    return {
+        'status': outcome,
+        'exit_code': -killed_by if killed_by else exit_code,
+        'seconds': seconds,
+        'wall_seconds': wall,
+        'peak_kb': peak_kb
+    }
+
+
+class EmpiricalVerifier:
+    """
+    Checks the analyzers' predictions by running the program. A submission is compiled
+    (or taken from the BinaryCache) and run on generated inputs, doubling n from min_n
+    until a run takes target_seconds, n reaches max_n or the budget is spent. The CPU
+    time and peak RSS per run are then fitted against the candidate complexity classes.
+
+    Programs read INPUT_FORMAT from stdin; a program that ignores its input measures as
+    constant. Runs go through their own small thread pool: at most max_workers
+    verifications run at once and queue_limit more wait, beyond that verify() raises
+    WorkersSaturated.
+
+    This runs untrusted code. The resource limits, empty environment and scratch
+    directory are not a sandbox against a determined attacker, so the mode is off unless
+    VERIFY_ENABLED is set, and is meant for deployments inside a container or VM.
+    """
+    __slots__ = ['enabled', 'cache', 'limits', 'max_workers', 'queue_limit', 'executor', 'in_flight', 'rejected',
+                 'min_n', 'max_n', 'target_seconds', 'run_timeout', 'time_budget', 'memory_mb']
+
+    def __init__(self, cache: BinaryCache, enabled: bool = True, max_workers: int = 1, queue_limit: int = 8,
+                 min_n: int = 4, max_n: int = 1 << 20, target_seconds: float = 0.5, run_timeout: float = 2.0,
+                 time_budget: float = 10.0, memory_mb: int = 1024, limits: Optional[AnalysisLimits] = None):
+        self.enabled = enabled
+        self.cache = cache
+        self.limits = limits or default_analysis_limits()
+        self.max_workers = max_workers
+        self.queue_limit = queue_limit
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='verify')
+        self.in_flight = 0
+        self.rejected = 0
+        self.min_n = min_n
+        self.max_n = max_n
+        self.target_seconds = target_seconds
+        self.run_timeout = run_timeout
+        self.time_budget = time_budget
+        self.memory_mb = memory_mb
+
+    @classmethod
+    def from_env(cls) -> "EmpiricalVerifier":
+        """
+        Off unless VERIFY_ENABLED=1. Configured by VERIFY_CXX, VERIFY_CACHE_DIR,
+        VERIFY_BINARY_CACHE_MAX, VERIFY_WORKERS, VERIFY_QUEUE_LIMIT, VERIFY_MAX_N,
+        VERIFY_RUN_TIMEOUT_MS, VERIFY_BUDGET_MS and VERIFY_MEMORY_MB
+        """
+        cache = BinaryCache(
+            os.getenv('VERIFY_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ai-endpoints-binaries')),
+            compiler=os.getenv('VERIFY_CXX', 'g++'),
+            max_entries=int(os.getenv('VERIFY_BINARY_CACHE_MAX', 64))
+        )
+        return cls(
+            cache,
+            enabled=os.getenv('VERIFY_ENABLED', '').lower() in ('1', 'true', 'yes'),
+            max_workers=int(os.getenv('VERIFY_WORKERS', 1)),
+            queue_limit=int(os.getenv('VERIFY_QUEUE_LIMIT', 8)),
+            max_n=int(os.getenv('VERIFY_MAX_N', 1 << 20)),
+            run_timeout=float(os.getenv('VERIFY_RUN_TIMEOUT_MS', 2_000)) / 1000,
+            time_budget=float(os.getenv('VERIFY_BUDGET_MS', 10_000)) / 1000,
+            memory_mb=int(os.getenv('VERIFY_MEMORY_MB', 1024))
+        )
+
+    async def verify(self, code: str) -> Dict[str, Any]:
+        if not self.enabled:
+            raise VerifierUnavailable("Empirical verification is disabled; set VERIFY_ENABLED=1 to turn it on")
+        self.limits.check_source(code.encode('utf8'))
+        if self.in_flight >= self.max_workers + self.queue_limit:
+            self.rejected += 1
+            raise WorkersSaturated(f"{self.in_flight} verifications already in flight")
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self.measure, code)
+        finally:
+            self.in_flight -= 1
+
+    def measure(self, code: str) -> Dict[str, Any]:
+        """The analyzers' predicted classes next to the measured ones; blocking"""
+        predicted = self.predict(code)
+        compile_started = time.perf_counter()
+        binary, cached = self.cache.binary(code)
+        launcher = self.cache.launcher()
+        compile_seconds = time.perf_counter() - compile_started
+
+        runs = []
+        deadline = time.monotonic() + self.time_budget
+        n = self.min_n
+        while n <= self.max_n and time.monotonic() < deadline:
+            timeout = min(self.run_timeout, max(deadline - time.monotonic(), 0.1))
+            run = run_sandboxed(launcher, binary, generate_input(n), timeout, self.memory_mb)
+            runs.append({'n': n, **run})
+            if run['status'] != 'ok' or run['wall_seconds'] >= self.target_seconds:
+                break
+            n *= 2
+
+        completed = [run for run in runs if run['status'] == 'ok']
+        measured = {
+            'time': fit_complexity([(run['n'], run['seconds']) for run in completed], TIME_CLASSES),
+            'memory': fit_complexity([(run['n'], run['peak_kb']) for run in completed], MEMORY_CLASSES, floor=1)
+        }
+        return {
+            'predicted': predicted,
+            'measured': measured,
+            # None where either side has no answer
+            'agrees': {
+                resource: predicted.get(resource) == measured[resource]
+                if predicted.get(resource) and measured[resource] else None
+                for resource in measured
+            },
+            'input_format': INPUT_FORMAT,
+            'binary_cached': cached,
+            'compile_seconds': compile_seconds,
+            # A run that crashed or hit the time limit: growth may be faster than the fitted samples show
+            'stopped_by': runs[-1]['status'] if runs and runs[-1]['status'] != 'ok' else None,
+            'runs': runs
+        }
+
+    def predict(self, code: str) -> Dict[str, Any]:
+        """Big-O time and memory from the fused analyzer"""
+        code_parser = CodeParser(limits=self.limits)
+        try:
+            tree = code_parser.evaluate_code_syntax(code)
+            analysis = code_parser.analyze(tree.root_node)
+        except SourceTooLarge:
+            raise
+        except LimitExceeded as error:
+            return degraded_result(error)
+        return {'time': big_o(analysis['time_complexity']), 'memory': big_o(analysis['memory_usage']),
+                **warnings_result(code_parser.warnings)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'workers': self.max_workers,
+            'queue_limit': self.queue_limit,
+            'in_flight': self.in_flight,
+            'rejected': self.rejected,
+            'binaries': self.cache.stats()
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
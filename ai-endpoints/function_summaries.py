@@ -0,0 +1,227 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Optional, Tuple
+
+from complexity import Complexity
+
+if TYPE_CHECKING:
+    from call_graph import CallGraphIndex
+
+# (name, qualifier, receiver, argument count), as returned by call_graph.call_target
+CallTarget = Tuple[str, Tuple[str, ...], Optional[str], int]
+
+
+class FunctionSummary:
+    """
+    What one function costs on its own: time and memory of its body, and every call it
+    makes, as a call_target tuple scaled by the loops around the call site. Depends only
+    on the function's source, so it can be shared by every file containing the same
+    function.
+
+    Which calls are self-recursion depends on what else the program defines (`f(1)` inside
+    `f()` may call an overload), so a fresh summary leaves that open: recursion maps the
+    position in calls of every call with the function's own simple name to the shape of
+    recursion it would make. bind() settles it once the calls are resolved. warnings are
+    the limit warnings the function's analysis produced, kept so a memoized summary still
+    reports them.
+    """
+    __slots__ = ['name', 'time', 'memory', 'calls', 'self_calls', 'depth_pattern', 'recursion', 'frame_size', 'has_division',
+                 'warnings']
+
+    def __init__(self, name: str, time: Complexity, memory: Complexity,
+                 calls: Tuple[Tuple[CallTarget, Complexity], ...], self_calls: int = 0, depth_pattern: Optional[str] = None,
+                 recursion: Tuple[Tuple[int, Optional[str]], ...] = (), frame_size: int = 0, has_division: bool = False,
+                 warnings: Tuple[Dict[str, Any], ...] = ()):
+        self.name = name
+        self.time = time
+        self.memory = memory
+        self.calls = calls
+        self.self_calls = self_calls
+        self.depth_pattern = depth_pattern
+        self.recursion = recursion
+        self.frame_size = frame_size
+        self.has_division = has_division
+        self.warnings = warnings
+
+    def bind(self, self_calls: Iterable[int]) -> "FunctionSummary":
+        """
+        The summary with the calls at these positions counted as self-recursion: their cost
+        goes into time and memory, and they are dropped from calls
+        """
+        self_calls = set(self_calls)
+        if not self_calls:
+            return FunctionSummary(self.name, self.time, self.memory, self.calls)
+        n = Complexity.symbol('n')
+        shapes = {shape for position, shape in self.recursion if position in self_calls}
+        recursive_time = recursion_time(shapes)
+        depth_pattern = stack_depth_pattern(len(self_calls), self.has_division)
+        if depth_pattern == 'log':
+            depth = Complexity.log()
+        elif depth_pattern == 'exponential':
+            depth = Complexity.exponential()
+        else:
+            depth = n
+        return FunctionSummary(
+            self.name,
+            self.time if self.time.growth() >= recursive_time.growth() else recursive_time,
+            self.memory + self.frame_size * depth,
+            tuple(call for position, call in enumerate(self.calls) if position not in self_calls),
+            len(self_calls),
+            depth_pattern
+        )
+
+
+def recursion_time(shapes: Iterable[str]) -> Complexity:
+    """
+    Time of a self-recursive function from the shapes of its recursive calls: linear
+    recursion is O(n), binary O(n log n), exponential O(2^n); no known shape counts as linear
+    """
+    shapes = set(shapes)
+    n = Complexity.symbol('n')
+    if 'linear' in shapes:
+        return n
+    if 'binary' in shapes:
+        return n * Complexity.log()
+    if 'exponential' in shapes:
+        return Complexity.exponential()
+    return n
+
+
+def stack_depth_pattern(recursive_calls: int, has_division: bool) -> str:
+    """
+    Divide-and-conquer (a division and one or two calls back into the recursion) is
+    log deep, more than one call back is exponential, anything else linear
+    """
+    if has_division and 1 <= recursive_calls <= 2:
+        return 'log'
+    if recursive_calls >= 2:
+        return 'exponential'
+    return 'linear'
+
+
+def bind_summaries(index: "CallGraphIndex", summaries: Dict[int, FunctionSummary]) -> Dict[int, FunctionSummary]:
+    """
+    Summaries with self-recursion settled through the call graph: a call counts as a
+    self-call only when it resolves to the calling function alone. Calls that may reach
+    an overload or a namespace sibling stay ordinary calls (and edges).
+    """
+    bound = {}
+    for i, summary in summaries.items():
+        self_calls = [position for position, _ in summary.recursion
+                      if index.resolve(summary.calls[position][0], i) == [i]]
+        bound[i] = summary.bind(self_calls)
+    return bound
+
+
+def function_key(function_node) -> str:
+    return hashlib.sha256(function_node.text).hexdigest()
+
+
+class SummaryMemo:
+    """Bounded LRU of FunctionSummary objects keyed by the hash of the function's source"""
+    __slots__ = ['max_entries', 'entries', 'hits', 'misses', 'lock']
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, FunctionSummary]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[FunctionSummary]:
+        with self.lock:
+            summary = self.entries.get(key)
+            if summary is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return summary
+
+    def put(self, key: str, summary: FunctionSummary):
+        with self.lock:
+            self.entries[key] = summary
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+_default_memo = None
+_default_memo_lock = threading.Lock()
+
+def default_summary_memo() -> SummaryMemo:
+    global _default_memo
+    with _default_memo_lock:
+        if _default_memo is None:
+            _default_memo = SummaryMemo(int(os.getenv('FUNCTION_SUMMARY_MEMO_MAX', 4096)))
+        return _default_memo
+
+
+def compose_summaries(index: "CallGraphIndex", summaries: Dict[int, FunctionSummary]) -> Dict[int, Tuple[Complexity, Complexity]]:
+    """
+    Total (time, memory) per function of the call graph, from summaries already bound
+    with bind_summaries, with every call to a function
+    defined in the file replaced by that function's total: time adds multiplier * callee
+    time per call site, memory adds the largest callee memory, since callees do not run at
+    the same time. Calls to anything not defined in the file are free.
+
+    Components are composed callees first. Functions that recurse through each other are
+    costed together: the cycle runs up to n times, each round doing every member's own
+    work and keeping one frame alive, so the group costs n * (sum of the members' time)
+    and n * (largest member memory), plus whatever it calls outside the cycle.
+    """
+    n = Complexity.symbol('n')
+    totals: Dict[int, Tuple[Complexity, Complexity]] = {}
+
+    for component in index.components:
+        members = [i for i in component if i in summaries]
+        if not members:
+            continue
+        # Callees outside this component are already composed; calls back into it are not in totals yet
+        costs = {}
+        for i in members:
+            time = summaries[i].time
+            callee_memory = Complexity()
+            for target, multiplier in summaries[i].calls:
+                callees = [totals[callee] for callee in index.resolve(target, i) if callee in totals]
+                if not callees:
+                    continue
+                callee_time, memory = max(callees, key=lambda total: total[0].growth())
+                time = time + multiplier * callee_time
+                if memory.growth() > callee_memory.growth():
+                    callee_memory = memory
+            costs[i] = (time, callee_memory)
+
+        cyclic = len(members) > 1 or (members[0] in index.recursive and not summaries[members[0]].self_calls)
+        if not cyclic:
+            i = members[0]
+            totals[i] = (costs[i][0], summaries[i].memory + costs[i][1])
+            continue
+
+        group_time = Complexity()
+        frame = Complexity()
+        callee_memory = Complexity()
+        for i in members:
+            group_time = group_time + costs[i][0]
+            if frame.is_zero() or summaries[i].memory.growth() > frame.growth():
+                frame = summaries[i].memory
+            if costs[i][1].growth() > callee_memory.growth():
+                callee_memory = costs[i][1]
+        if frame.is_zero():
+            frame = Complexity.constant(1)
+        group_total = (n * group_time, n * frame + callee_memory)
+        for i in members:
+            totals[i] = group_total
+    return totals
@@ -0,0 +1,241 @@
+import asyncio
+import json
+import os
+import random
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional
+
+from metrics import qna_slot_wait_seconds
+
+if TYPE_CHECKING:
+    import httpx
+
+DEFAULT_MODEL = "mistralai/Mixtral-8x7B-Instruct-v0.1"
+DEFAULT_BASE_URL = "https://router.huggingface.co/hf-inference/models"
+
+# Rate limited, or the model is loading / overloaded: worth another attempt
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class InferenceError(Exception):
+    """The text-generation backend failed, or kept failing after retries"""
+
+
+class InferenceBusy(InferenceError):
+    """No in-flight slot freed up within the request timeout"""
+
+
+class AsyncTextGenerationClient:
+    """
+    Async client for the text-generation streaming API (`POST {"inputs", "parameters",
+    "stream": true}` answered with `data:{"token": {...}}` server-sent events).
+
+    Requests share one pooled connection set, and at most max_in_flight generations run
+    at once; callers beyond that wait for a slot, up to the request timeout. `timeout` is a
+    deadline for a whole generation. Connection failures and retryable statuses are retried
+    with exponentially growing, fully jittered delays, but only until the first token has
+    been yielded, since a half-streamed answer cannot be replayed.
+
+    httpx is only imported when a client is built, so importing this module stays cheap.
+    """
+    __slots__ = ['url', 'max_in_flight', 'timeout', 'max_retries', 'backoff', 'slots', 'client',
+                 'in_flight', 'waiting', 'retries', 'failures', 'rejected']
+
+    def __init__(self, url: str, token: Optional[str] = None, max_in_flight: int = 8,
+                 timeout: float = 120.0, max_retries: int = 3, backoff: float = 0.5):
+        self.url = url
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        import httpx
+
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.client = httpx.AsyncClient(
+            headers={'Authorization': f'Bearer {token}'} if token else None,
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0)),
+            limits=httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+        )
+        self.in_flight = 0
+        self.waiting = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls, model: str = DEFAULT_MODEL) -> "AsyncTextGenerationClient":
+        """
+        Configured by HF_INFERENCE_URL (defaults to the hosted endpoint for `model`; point it
+        at any server speaking the same API, such as benchmarks/inference_standin.py),
+        HUGGINGFACE_API_KEY, HF_MAX_IN_FLIGHT, HF_TIMEOUT and HF_MAX_RETRIES
+        """
+        return cls(
+            url=os.getenv('HF_INFERENCE_URL', f"{DEFAULT_BASE_URL}/{model}"),
+            token=os.getenv('HUGGINGFACE_API_KEY'),
+            max_in_flight=int(os.getenv('HF_MAX_IN_FLIGHT', 8)),
+            timeout=float(os.getenv('HF_TIMEOUT', 120)),
+            max_retries=int(os.getenv('HF_MAX_RETRIES', 3))
+        )
+
+    async def _acquire(self):
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.timeout)
+        except TimeoutError:
+            self.rejected += 1
+            raise InferenceBusy(f"{self.in_flight} generations already in flight") from None
+        finally:
+            self.waiting -= 1
+            qna_slot_wait_seconds.observe(time.perf_counter() - started)
+        self.in_flight += 1
+
+    def _release(self):
+        self.in_flight -= 1
+        self.slots.release()
+
+    async def _backoff(self, attempt: int, retry_after: float, deadline: float):
+        loop = asyncio.get_running_loop()
+        delay = max(retry_after, random.uniform(0, self.backoff * 2 ** attempt))
+        if loop.time() + delay >= deadline:
+            raise InferenceError("Inference request timed out while retrying")
+        self.retries += 1
+        await asyncio.sleep(delay)
+
+    async def stream(self, prompt: str, **parameters) -> AsyncIterator[str]:
+        """
+        Yield token texts as they are generated. Closing the generator closes the upstream
+        response, which stops the generation.
+        """
+        import httpx
+
+        deadline = asyncio.get_running_loop().time() + self.timeout
+        await self._acquire()
+        try:
+            payload = {'inputs': prompt, 'parameters': parameters, 'stream': True}
+            started = False
+            for attempt in range(self.max_retries + 1):
+                retry_after = 0.0
+                try:
+                    async with self.client.stream('POST', self.url, json=payload) as response:
+                        if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                            retry_after = _retry_after(response)
+                        elif response.status_code >= 400:
+                            raise await _status_error(response)
+                        else:
+                            async for text in self._tokens(response, deadline):
+                                started = True
+                                yield text
+                            return
+                except httpx.TransportError as error:
+                    if started or attempt == self.max_retries:
+                        raise InferenceError(f"Inference backend unreachable: {error!r}") from error
+                await self._backoff(attempt, retry_after, deadline)
+        except InferenceError:
+            self.failures += 1
+            raise
+        finally:
+            self._release()
+
+    async def generate_batch(self, prompts: List[str], **parameters) -> List[str]:
+        """
+        Generate answers for several prompts in one non-streaming request, for backends that
+        accept a list of inputs. Takes a single in-flight slot.
+        """
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        await self._acquire()
+        try:
+            payload = {'inputs': prompts, 'parameters': parameters}
+            for attempt in range(self.max_retries + 1):
+                retry_after = 0.0
+                try:
+                    response = await asyncio.wait_for(self.client.post(self.url, json=payload), deadline - loop.time())
+                except TimeoutError:
+                    raise InferenceError("Inference request timed out") from None
+                except httpx.TransportError as error:
+                    if attempt == self.max_retries:
+                        raise InferenceError(f"Inference backend unreachable: {error!r}") from error
+                else:
+                    if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                        retry_after = _retry_after(response)
+                    elif response.status_code >= 400:
+                        raise await _status_error(response)
+                    else:
+                        body = response.json()
+                        if not isinstance(body, list) or len(body) != len(prompts):
+                            raise InferenceError("Inference backend did not return one result per prompt")
+                        return [_generated_text(item) for item in body]
+                await self._backoff(attempt, retry_after, deadline)
+        except InferenceError:
+            self.failures += 1
+            raise
+        finally:
+            self._release()
+
+    async def _tokens(self, response: "httpx.Response", deadline: float) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        if not response.headers.get('content-type', '').startswith('text/event-stream'):
+            # Backend ignored `stream`; serve its whole answer as a single token
+            try:
+                body = await asyncio.wait_for(response.aread(), deadline - loop.time())
+            except TimeoutError:
+                raise InferenceError("Inference request timed out") from None
+            yield _generated_text(json.loads(body))
+            return
+
+        lines = response.aiter_lines()
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise InferenceError("Inference request timed out")
+            try:
+                line = await asyncio.wait_for(anext(lines), remaining)
+            except StopAsyncIteration:
+                return
+            except TimeoutError:
+                raise InferenceError("Inference request timed out") from None
+            if not line.startswith('data:'):
+                continue
+            event = json.loads(line[len('data:'):])
+            if 'error' in event:
+                raise InferenceError(f"Inference backend error: {event['error']}")
+            yield event['token']['text']
+
+    async def generate(self, prompt: str, **parameters) -> str:
+        return ''.join([text async for text in self.stream(prompt, **parameters)])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'max_in_flight': self.max_in_flight,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'retries': self.retries,
+            'failures': self.failures,
+            'rejected': self.rejected
+        }
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+async def _status_error(response: "httpx.Response") -> InferenceError:
+    body = await response.aread()
+    return InferenceError(f"Inference backend returned {response.status_code}: {body[:200].decode('utf8', 'replace')}")
+
+
+def _retry_after(response: "httpx.Response") -> float:
+    try:
+        return float(response.headers.get('retry-after', 0))
+    except ValueError:
+        return 0.0
+
+
+def _generated_text(body: Any) -> str:
+    if isinstance(body, list):
+        body = body[0] if body else {}
+    if 'error' in body:
+        raise InferenceError(f"Inference backend error: {body['error']}")
+    return body.get('generated_text', '')
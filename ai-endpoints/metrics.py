@@ -0,0 +1,318 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter as TallyCounter, deque
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+# Seconds; spans range from sub-millisecond walks to minute-long generations
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger('ai_endpoints.metrics')
+
+
+def _label_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Counter:
+    __slots__ = ['name', 'help', 'labels', 'values', 'lock']
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f'{self.name}{_label_text(self.labels, key)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    __slots__ = ['name', 'help', 'labels', 'buckets', 'series', 'lock']
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts, sum, count]
+        self.series: Dict[Tuple[str, ...], list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = 'le="' + _number(bound) + '"'
+                    lines.append(f'{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative}')
+                le = 'le="+Inf"'
+                lines.append(f'{self.name}_bucket{_label_text(self.labels, key, le)} {count}')
+                lines.append(f'{self.name}_sum{_label_text(self.labels, key)} {_number(total)}')
+                lines.append(f'{self.name}_count{_label_text(self.labels, key)} {count}')
+        return lines
+
+
+class Gauge:
+    """Read when the metrics are rendered, from a callback returning {label values: value}"""
+    __slots__ = ['name', 'help', 'labels', 'read']
+
+    def __init__(self, name: str, help: str, read: Callable[[], Dict[Tuple[str, ...], float]], labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.read = read
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        try:
+            values = self.read()
+        except Exception:
+            logger.exception("Reading gauge %s failed", self.name)
+            return lines
+        for key, value in sorted(values.items()):
+            lines.append(f'{self.name}{_label_text(self.labels, key)} {_number(value)}')
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics in registration order, rendered in the Prometheus text exposition format"""
+    __slots__ = ['metrics', 'lock']
+
+    def __init__(self):
+        self.metrics: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, read: Callable[[], Dict[Tuple[str, ...], float]],
+              labels: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help, read, labels))
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+analysis_stage_seconds = REGISTRY.histogram(
+    'analysis_stage_seconds', 'Time spent in each CodeParser stage; spans nest, so stages overlap', ('stage',))
+analysis_task_seconds = REGISTRY.histogram(
+    'analysis_task_seconds', 'Wall time of analysis tasks on the workers, including queueing', ('kind',))
+analysis_tasks_total = REGISTRY.counter(
+    'analysis_tasks_total', 'Analysis tasks by outcome (ok, indexed, cached, degraded, error)', ('kind', 'outcome'))
+http_request_seconds = REGISTRY.histogram(
+    'http_request_seconds', 'Time to the response headers, per route', ('method', 'route', 'status'))
+editor_channel_updates_total = REGISTRY.counter(
+    'editor_channel_updates_total',
+    'Editor channel work: parses run, updates folded into a later parse, function analyses abandoned',
+    ('outcome',))
+qna_time_to_first_token_seconds = REGISTRY.histogram(
+    'qna_time_to_first_token_seconds', 'From asking the model to its first answer token')
+qna_generation_seconds = REGISTRY.histogram(
+    'qna_generation_seconds', 'Whole generations, by path (stream or batch)', ('path',))
+qna_slot_wait_seconds = REGISTRY.histogram(
+    'qna_slot_wait_seconds', 'Time waiting for an in-flight inference slot')
+qna_requests_total = REGISTRY.counter(
+    'qna_requests_total', 'Questions by outcome (cache_hit, generated, error)', ('outcome',))
+qna_tokens_total = REGISTRY.counter('qna_tokens_total', 'Answer tokens relayed to clients')
+
+
+# Spans: a task running on a worker collects its spans and ships them back with its result,
+# so stages measured in worker processes still end up in this process' registry
+
+_collector = threading.local()
+
+
+@contextmanager
+def collect_spans() -> Iterator[List[Tuple[str, float]]]:
+    """Gather the spans finished on this thread, instead of recording them, until the block ends"""
+    previous = getattr(_collector, 'spans', None)
+    spans: List[Tuple[str, float]] = []
+    _collector.spans = spans
+    try:
+        yield spans
+    finally:
+        _collector.spans = previous
+
+
+def record_spans(spans: List[Tuple[str, float]]):
+    for stage, seconds in spans:
+        analysis_stage_seconds.observe(seconds, stage=stage)
+
+
+def record_span(stage: str, seconds: float):
+    spans = getattr(_collector, 'spans', None)
+    if spans is not None:
+        spans.append((stage, seconds))
+    else:
+        analysis_stage_seconds.observe(seconds, stage=stage)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - start)
+
+
+def timed(stage: str):
+    """Decorator form of span"""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record_span(stage, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+class SlowRequestProfiler:
+    """
+    Statistical profiler for slow requests. Requests register the thread they run on;
+    one background thread samples the stacks of registered threads every `interval`
+    seconds. A request that took longer than `threshold` seconds gets its most frequent
+    stacks logged and kept in `recent`; faster requests' samples are thrown away.
+
+    Hooked around analysis tasks, which run on worker threads (or, in process mode, in
+    the worker processes, each with its own profiler and log output). Requests served on
+    the event loop are not profiled: the loop thread is shared by all of them.
+    """
+    __slots__ = ['threshold', 'interval', 'max_depth', 'active', 'recent', 'lock', 'sampler']
+
+    def __init__(self, threshold: float, interval: float = 0.005, max_depth: int = 20, keep: int = 20):
+        self.threshold = threshold
+        self.interval = interval
+        self.max_depth = max_depth
+        # thread id -> sampled stack tallies, for every request in progress
+        self.active: Dict[int, TallyCounter] = {}
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=keep)
+        self.lock = threading.Lock()
+        self.sampler: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls) -> Optional["SlowRequestProfiler"]:
+        """Enabled by PROFILE_SLOW_MS (threshold), with PROFILE_INTERVAL_MS between samples"""
+        threshold = float(os.getenv('PROFILE_SLOW_MS', 0))
+        if threshold <= 0:
+            return None
+        return cls(threshold / 1000, float(os.getenv('PROFILE_INTERVAL_MS', 5)) / 1000)
+
+    @contextmanager
+    def profile(self, name: str) -> Iterator[None]:
+        thread_id = threading.get_ident()
+        samples = TallyCounter()
+        with self.lock:
+            self.active[thread_id] = samples
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self._sample, name='slow-request-profiler', daemon=True)
+                self.sampler.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.active.pop(thread_id, None)
+            if elapsed >= self.threshold:
+                self._report(name, elapsed, samples)
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                active = list(self.active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, samples in active:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+                    frame = frame.f_back
+                if stack:
+                    samples[' <- '.join(stack)] += 1
+
+    def _report(self, name: str, elapsed: float, samples: TallyCounter):
+        total = sum(samples.values())
+        profile = {
+            'name': name,
+            'seconds': elapsed,
+            'samples': total,
+            'top_stacks': [{'stack': stack, 'share': count / total} for stack, count in samples.most_common(5)]
+        }
+        self.recent.append(profile)
+        logger.warning("Slow request %s took %.3fs; top sampled stacks: %s", name, elapsed, profile['top_stacks'][:3])
+
+
+# Off unless PROFILE_SLOW_MS is set
+slow_request_profiler = SlowRequestProfiler.from_env()
+
+
+@contextmanager
+def profiled(name: str) -> Iterator[None]:
+    if slow_request_profiler is None:
+        yield
+        return
+    with slow_request_profiler.profile(name):
+        yield
@@ -0,0 +1,231 @@
+import asyncio
+import io
+import os
+import posixpath
+import tarfile
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from analysis_cache import source_key
+from analysis_limits import LimitExceeded, SourceTooLarge, warnings_result
+from call_graph import CallGraphIndex, function_declarator
+from code_parser import big_o, serialize_error
+from function_summaries import FunctionSummary, SummaryMemo, bind_summaries, compose_summaries
+
+if TYPE_CHECKING:
+    from analysis_workers import AnalysisWorkers
+
+# Files taken from a project; everything else in a tarball is skipped
+SOURCE_EXTENSIONS = ('.cpp', '.cc', '.cxx', '.c++', '.c', '.h', '.hpp', '.hh', '.hxx', '.h++', '.ipp', '.tpp', '.inl')
+
+
+class ProjectFile(BaseModel):
+    path: str
+    code: str
+
+
+class ProjectInput(BaseModel):
+    files: List[ProjectFile]
+
+
+class ProjectTooLarge(SourceTooLarge):
+    """The project has too many files or too many bytes in total"""
+
+    def __init__(self, detail: str):
+        LimitExceeded.__init__(self, 'project', detail)
+
+
+def summarize_file(code_parser, root) -> Dict[str, Any]:
+    """
+    The part of a project analysis that needs the file's tree: its syntax errors and one
+    entry per function definition with its FunctionSummary. Plain data, so it can come
+    back from a worker process and be kept once the tree is gone.
+    """
+    index = code_parser.call_graph(root)
+    # One pattern pass for the whole file rather than one per function
+    code_parser.code_patterns(root)
+    functions = []
+    warnings = list(code_parser.warnings)
+    for entry in index.functions:
+        declarator = function_declarator(entry.node)
+        parameters = declarator.child_by_field_name('parameters') if declarator is not None else None
+        summary = code_parser.summarize_function(entry.node)
+        warnings.extend(summary.warnings)
+        functions.append({
+            'name': entry.name,
+            'scope': entry.scope,
+            'min_arity': entry.min_arity,
+            'max_arity': entry.max_arity,
+            'parameters': ' '.join(parameters.text.decode('utf8').split()) if parameters is not None else '()',
+            'summary': summary
+        })
+    return {
+        'errors': [serialize_error(node) for node in code_parser.find_error_nodes(root)],
+        'functions': functions,
+        **warnings_result(warnings)
+    }
+
+
+def read_tarball(data: bytes, max_files: int, max_bytes: int) -> List[Tuple[str, str]]:
+    """(path, code) pairs of the C and C++ sources in a (possibly compressed) tar archive"""
+    files = []
+    total = 0
+    try:
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r:*') as archive:
+            for member in archive:
+                if not member.isfile() or not member.name.lower().endswith(SOURCE_EXTENSIONS):
+                    continue
+                # Sizes are checked before anything is extracted
+                total += member.size
+                if max_bytes and total > max_bytes:
+                    raise ProjectTooLarge(f"Project sources exceed {max_bytes} bytes")
+                if max_files and len(files) >= max_files:
+                    raise ProjectTooLarge(f"Project has more than {max_files} source files")
+                content = archive.extractfile(member).read()
+                files.append((posixpath.normpath(member.name).lstrip('/'), content.decode('utf8', errors='replace')))
+    except tarfile.TarError:
+        raise ValueError("Body is neither JSON nor a readable tar archive") from None
+    return files
+
+
+class ProjectAnalysis:
+    """
+    Analyzes a set of files as one program. Every file is parsed and summarized on its
+    own, in parallel on the analysis workers; the function summaries of all files are
+    then linked through one cross-file call graph, so a helper defined in another file
+    (or a header) is resolved and its cost composed into its callers, and recursion
+    across files is found.
+
+    Per-file results are kept by content hash, so re-submitting a project with a few
+    files changed only re-parses those. Identical files are parsed once.
+    """
+    __slots__ = ['workers', 'memo', 'max_files', 'max_bytes']
+
+    def __init__(self, workers: "AnalysisWorkers", memo: Optional[SummaryMemo] = None,
+                 max_files: int = 200, max_bytes: int = 10_000_000):
+        self.workers = workers
+        # SummaryMemo is a plain LRU by source hash; here it holds summarize_file results
+        self.memo = memo or SummaryMemo(1024)
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_env(cls, workers: "AnalysisWorkers") -> "ProjectAnalysis":
+        """Configured by PROJECT_MAX_FILES, PROJECT_MAX_BYTES and PROJECT_FILE_CACHE_MAX"""
+        return cls(
+            workers,
+            memo=SummaryMemo(int(os.getenv('PROJECT_FILE_CACHE_MAX', 1024))),
+            max_files=int(os.getenv('PROJECT_MAX_FILES', 200)),
+            max_bytes=int(os.getenv('PROJECT_MAX_BYTES', 10_000_000))
+        )
+
+    def check(self, files: List[Tuple[str, str]]):
+        """Reject oversized projects before any work is queued"""
+        if not files:
+            raise ValueError("Project has no C or C++ source files")
+        if self.max_files and len(files) > self.max_files:
+            raise ProjectTooLarge(f"Project has {len(files)} source files, the limit is {self.max_files}")
+        total = 0
+        for _, code in files:
+            source = code.encode('utf8')
+            self.workers.limits.check_source(source)
+            total += len(source)
+        if self.max_bytes and total > self.max_bytes:
+            raise ProjectTooLarge(f"Project sources are {total} bytes, the limit is {self.max_bytes}")
+
+    async def analyze(self, files: List[Tuple[str, str]]) -> Dict[str, Any]:
+        self.check(files)
+        paths = [path for path, _ in files]
+        if len(set(paths)) != len(paths):
+            raise ValueError("Project has duplicate file paths")
+
+        keys = [source_key('project_file', code) for _, code in files]
+        results: Dict[str, Dict[str, Any]] = {}
+        pending: Dict[str, str] = {}
+        for key, (_, code) in zip(keys, files):
+            if key in results or key in pending:
+                continue
+            cached = self.memo.get(key)
+            if cached is not None:
+                results[key] = cached
+            else:
+                pending[key] = code
+
+        # As many files at a time as there are workers, leaving queue room for other requests
+        concurrency = asyncio.Semaphore(self.workers.max_workers)
+
+        async def summarize(key: str, code: str):
+            async with concurrency:
+                result = await self.workers.submit('project_file', code)
+            if not result.get('degraded'):
+                self.memo.put(key, result)
+            results[key] = result
+
+        await asyncio.gather(*[summarize(key, code) for key, code in pending.items()])
+        analysis = self._link([(path, results[key]) for path, key in zip(paths, keys)])
+        analysis['analyzed'] = len(pending)
+        analysis['reused'] = len(results) - len(pending)
+        return analysis
+
+    def _link(self, file_results: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        """Resolve calls across files and compose every function's summary with its callees'"""
+        entries: List[Tuple[str, Dict[str, Any]]] = []
+        files = {}
+        for path, result in file_results:
+            if result.get('degraded'):
+                files[path] = result
+                continue
+            files[path] = {'Syntax Errors': result['errors'], 'functions': [], **warnings_result(result.get('warnings'))}
+            entries.extend((path, function) for function in result['functions'])
+
+        index = CallGraphIndex.from_functions(
+            [(function['name'], function['scope'], function['min_arity'], function['max_arity']) for _, function in entries],
+            {i: [target for target, _ in function['summary'].calls] for i, (_, function) in enumerate(entries)}
+        )
+        summaries: Dict[int, FunctionSummary] = bind_summaries(index, {i: function['summary'] for i, (_, function) in enumerate(entries)})
+        names = _display_names(entries)
+
+        functions = {}
+        for function_index, (time, memory) in compose_summaries(index, summaries).items():
+            path, function = entries[function_index]
+            summary = summaries[function_index]
+            callees = {callee for target, _ in summary.calls for callee in index.resolve(target, function_index)}
+            functions[names[function_index]] = {
+                'file': path,
+                'time_complexity': str(time),
+                'time_big_o': big_o(time),
+                'memory_usage': str(memory),
+                'memory_big_o': big_o(memory),
+                'self_time_complexity': str(summary.time),
+                'self_memory_usage': str(summary.memory),
+                'calls': sorted(names[callee] for callee in callees),
+                'recursive': summary.self_calls > 0 or function_index in index.recursive,
+                'recursion_group': sorted(names[i] for i in index.components[index.component_of[function_index]])
+                if function_index in index.recursive else []
+            }
+            files[path]['functions'].append(names[function_index])
+        for file in files.values():
+            if 'functions' in file:
+                file['functions'].sort()
+        return {'files': files, 'functions': functions}
+
+
+def _display_names(entries: List[Tuple[str, Dict[str, Any]]]) -> Dict[int, str]:
+    """
+    Qualified names, with the parameter list appended where a name is overloaded and the
+    file appended where the same signature is defined in several files
+    """
+    qualified = ['::'.join((*function['scope'], function['name'])) for _, function in entries]
+    counts: Dict[str, int] = {}
+    for name in qualified:
+        counts[name] = counts.get(name, 0) + 1
+    signatures = [name + function['parameters'] if counts[name] > 1 else name
+                  for name, (_, function) in zip(qualified, entries)]
+    signature_counts: Dict[str, int] = {}
+    for signature in signatures:
+        signature_counts[signature] = signature_counts.get(signature, 0) + 1
+    return {
+        i: f"{signature} [{path}]" if signature_counts[signature] > 1 else signature
+        for i, (signature, (path, _)) in enumerate(zip(signatures, entries))
+    }